@@ -30,6 +30,10 @@
    Alias for all address spaces
 
 """
+import array
+import bisect
+import struct
+import sys
 import weakref
 
 from rekall import registry
@@ -60,6 +64,173 @@ class TranslationLookasideBuffer(utils.FastStore):
             vaddr >> self.PAGE_SHIFT, paddr)
 
 
+class SharedTranslationLookasideBuffer(object):
+    """A TLB which stores its translations in a shared TranslationCache.
+
+    This has the same interface as the TranslationLookasideBuffer but all
+    instances created for the same namespace (e.g. the same DTB) see each
+    other's translations.
+    """
+
+    PAGE_SHIFT = 12
+    PAGE_MASK = ~ 0xFFF
+
+    def __init__(self, store, namespace):
+        self._store = store
+        self._namespace = namespace
+
+    def Get(self, vaddr):
+        result = self._store.Get((self._namespace, vaddr >> self.PAGE_SHIFT))
+        if result is not None:
+            return result + (vaddr & 0xFFF)
+
+    def Put(self, vaddr, paddr):
+        if paddr is not None:
+            paddr = paddr & self.PAGE_MASK
+
+        self._store.Put((self._namespace, vaddr >> self.PAGE_SHIFT), paddr)
+
+
+# Python 2.7's array module has no explicit 64 bit typecode but "L" is 64 bits
+# wide on most 64 bit platforms.
+if array.array("L").itemsize == 8:
+    _TABLE_TYPECODE = "L"
+else:
+    _TABLE_TYPECODE = None
+
+_TABLE_PARSER = struct.Struct("<" + "Q" * 0x200)
+
+
+def DecodeTable(data):
+    """Decodes a page of 64 bit paging structure entries.
+
+    Args:
+      data: The 0x1000 bytes of the paging structure.
+
+    Returns:
+      A sequence of the 0x200 entries. This is a compact array where the
+      platform supports it, otherwise a tuple.
+    """
+    # Reads past the end of the image may be short.
+    if len(data) < 0x1000:
+        data = data.ljust(0x1000, "\x00")
+
+    if _TABLE_TYPECODE is None:
+        return _TABLE_PARSER.unpack(data)
+
+    result = array.array(_TABLE_TYPECODE, data)
+    if sys.byteorder != "little":
+        result.byteswap()
+
+    return result
+
+
+class TranslationCache(object):
+    """A session wide cache of address translations.
+
+    Each process gets its own address space instance, but all instances with
+    the same DTB translate addresses the same way, and the kernel half of the
+    page tables is shared by all processes. This cache holds both the
+    translations (keyed by a namespace, normally the DTB, and the virtual
+    page) and the decoded paging structure pages (keyed by their physical
+    address), so they are shared by all address space instances in the
+    session.
+
+    The cache is partitioned by the physical address space the page tables are
+    read from. A partition is dropped when its address space goes away.
+    """
+
+    # The maximum number of translations and paging structures held for each
+    # physical address space.
+    TRANSLATION_CACHE_SIZE = 50000
+    TABLE_CACHE_SIZE = 5000
+
+    def __init__(self, translation_cache_size=None, table_cache_size=None):
+        self.translation_cache_size = (
+            translation_cache_size or self.TRANSLATION_CACHE_SIZE)
+        self.table_cache_size = table_cache_size or self.TABLE_CACHE_SIZE
+
+        # Maps the physical address space to (translations, tables) stores.
+        self._partitions = weakref.WeakKeyDictionary()
+
+    def _GetPartition(self, base):
+        try:
+            return self._partitions[base]
+        except KeyError:
+            result = self._partitions[base] = (
+                utils.FastStore(self.translation_cache_size),
+                utils.FastStore(self.table_cache_size))
+
+            return result
+
+    def GetTLB(self, base, namespace):
+        """Returns a TLB for translations in namespace.
+
+        Args:
+          base: The physical address space the page tables are read from.
+          namespace: A hashable describing the translation (e.g. the DTB). All
+            address spaces which use the same namespace over the same base must
+            translate addresses identically.
+        """
+        return SharedTranslationLookasideBuffer(
+            self._GetPartition(base)[0], namespace)
+
+    def GetTableStore(self, base):
+        """Returns the store of decoded paging structures read from base."""
+        return self._GetPartition(base)[1]
+
+    def Flush(self):
+        self._partitions.clear()
+
+    def GetStatistics(self):
+        """Returns a dict of the hit/miss counters of the cache."""
+        result = dict(translation_hits=0, translation_misses=0,
+                      table_hits=0, table_misses=0)
+
+        for translations, tables in self._partitions.values():
+            result["translation_hits"] += translations.hits
+            result["translation_misses"] += translations.misses
+            result["table_hits"] += tables.hits
+            result["table_misses"] += tables.misses
+
+        return result
+
+    def __str__(self):
+        return ("Translations: %(translation_hits)d hits, "
+                "%(translation_misses)d misses. Paging structures: "
+                "%(table_hits)d hits, %(table_misses)d misses." %
+                self.GetStatistics())
+
+
+def CoalesceRuns(runs):
+    """Merges adjacent runs into larger runs.
+
+    Runs which are contiguous in both the virtual and the physical address space
+    are joined into a single run.
+
+    Args:
+      runs: An iterable of (virtual_address, physical_address, length) tuples
+        sorted by virtual address.
+
+    Yields:
+      The merged (virtual_address, physical_address, length) tuples.
+    """
+    run_vaddr = run_paddr = run_length = 0
+    for vaddr, paddr, length in runs:
+        if (run_length and vaddr == run_vaddr + run_length and
+                paddr == run_paddr + run_length):
+            run_length += length
+            continue
+
+        if run_length:
+            yield run_vaddr, run_paddr, run_length
+
+        run_vaddr, run_paddr, run_length = vaddr, paddr, length
+
+    if run_length:
+        yield run_vaddr, run_paddr, run_length
+
+
 class BaseAddressSpace(object):
     """ This is the base class of all Address Spaces. """
 
@@ -147,6 +318,20 @@ class BaseAddressSpace(object):
 
         return "\x00" * length
 
+    def read_into(self, addr, buf):
+        """Reads len(buf) bytes from addr into the writable buffer buf.
+
+        This allows callers to reuse a preallocated buffer (e.g. a bytearray)
+        for large reads.
+
+        Returns:
+          The number of bytes read into buf.
+        """
+        data = self.read(addr, len(buf))
+        memoryview(buf)[:len(data)] = data
+
+        return len(data)
+
     def get_available_addresses(self, start=0):
         """Generates address ranges (offset, phys_offset, size) for this AS.
 
@@ -198,10 +383,9 @@ class BaseAddressSpace(object):
 
     def _get_address_ranges(self, start=0, end=None):
         """Generates merged address ranges from get_available_addresses()."""
-        contiguous_voffset = 0
-        contiguous_poffset = 0
-        total_length = 0
+        return CoalesceRuns(self._get_available_runs(start=start, end=end))
 
+    def _get_available_runs(self, start=0, end=None):
         for (voffset, poffset, length) in self.get_available_addresses(
                 start=start):
 
@@ -213,22 +397,57 @@ class BaseAddressSpace(object):
                 "%(name)s: Merging Address Ranges %(offset)#x %(spinner)s",
                 offset=voffset, name=self.name)
 
-            # Try to join up adjacent pages as much as possible.
-            if (voffset == contiguous_voffset + total_length and
-                    poffset == contiguous_poffset + total_length):
-                total_length += length
+            yield voffset, poffset or 0, length
 
-            else:
-                if total_length > 0:
-                    yield (contiguous_voffset, contiguous_poffset, total_length)
+    def get_gather_ranges(self, start=0, end=None):
+        """Generates the virtually contiguous ranges between start and end.
 
-                # Reset the contiguous range.
-                contiguous_voffset = voffset
-                contiguous_poffset = poffset or 0
-                total_length = length
+        Each range is a list of (offset, phys_offset, length) runs, as returned
+        by get_address_ranges(), which follow each other in the virtual address
+        space but not necessarily in the physical address space. A read
+        spanning the whole range can be satisfied by gathering the data of its
+        runs from phys_base (see read_runs()).
+        """
+        runs = []
+        for run in self.get_address_ranges(start=start, end=end):
+            if runs and runs[-1][0] + runs[-1][2] != run[0]:
+                yield runs
+                runs = []
 
-        if total_length > 0:
-            yield (contiguous_voffset, contiguous_poffset, total_length)
+            runs.append(run)
+
+        if runs:
+            yield runs
+
+    def read_runs(self, runs, addr, length):
+        """Reads a virtually contiguous region from the runs covering it.
+
+        Args:
+          runs: A range as returned by get_gather_ranges().
+          addr: The virtual address to read from.
+          length: The number of bytes to read. The region must be covered by
+            the runs.
+
+        Returns:
+          The data, gathered with one phys_base read per run.
+        """
+        end = addr + length
+        result = []
+
+        # Find the first run containing addr.
+        index = bisect.bisect_right(runs, (addr, 2**64)) - 1
+        for run_start, phys_start, run_length in runs[max(0, index):]:
+            if run_start >= end:
+                break
+
+            read_start = max(addr, run_start)
+            read_end = min(end, run_start + run_length)
+            if read_end > read_start:
+                result.append(self.phys_base.read(
+                    phys_start + read_start - run_start,
+                    read_end - read_start))
+
+        return "".join(result)
 
     def is_valid_address(self, _addr):
         """ Tell us if the address is valid """
@@ -269,7 +488,9 @@ class BaseAddressSpace(object):
 
 # This is a specialised AS for use internally - Its used to provide
 # transparent support for a string buffer so types can be
-# instantiated off the buffer.
+# instantiated off the buffer. The data may also be any object supporting the
+# buffer protocol (e.g. a bytearray, memoryview or mmap) which allows callers to
+# wrap large buffers without copying them.
 class BufferAddressSpace(BaseAddressSpace):
     __abstract = True
 
@@ -294,10 +515,22 @@ class BufferAddressSpace(BaseAddressSpace):
     def read(self, addr, length):
         offset = addr - self.base_offset
         data = self.data[offset: offset + length]
+
+        # Slices of buffer objects are not strings so we copy just the
+        # requested data.
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        elif not isinstance(data, str):
+            data = str(data)
+
         return data + "\x00" * (length - len(data))
 
     def write(self, addr, data):
-        self.data = self.data[:addr] + data + self.data[addr + len(data):]
+        if isinstance(self.data, bytearray):
+            self.data[addr:addr + len(data)] = data
+        else:
+            self.data = self.data[:addr] + data + self.data[addr + len(data):]
+
         return True
 
     def get_available_addresses(self, start=None):
@@ -383,15 +616,31 @@ class PagedReader(BaseAddressSpace):
         """
         Read bytes from a virtual address.
 
+        The pages following vaddr are resolved up front, and as long as they are
+        physically contiguous with the first page (or all unmapped) they are
+        read together in a single read from the base address space.
+
         Args:
           vaddr: A virtual address to read from.
           length: The number of bytes to read.
 
         Returns:
-          As many bytes as can be read within this page.
+          As many bytes as can be read from the physically contiguous pages.
         """
         to_read = min(length, self.PAGE_SIZE - (vaddr % self.PAGE_SIZE))
         paddr = self.vtop(vaddr)
+
+        while to_read < length:
+            next_paddr = self.vtop(vaddr + to_read)
+            if paddr is None:
+                if next_paddr is not None:
+                    break
+
+            elif next_paddr != paddr + to_read:
+                break
+
+            to_read = min(length, to_read + self.PAGE_SIZE)
+
         if paddr is None:
             return "\x00" * to_read
 
@@ -406,18 +655,55 @@ class PagedReader(BaseAddressSpace):
 
         addr, length = int(addr), int(length)
 
-        result = ''
+        result = []
 
         while length > 0:
             buf = self._read_chunk(addr, length)
             if not buf:
                 break
 
-            result += buf
+            result.append(buf)
             addr += len(buf)
             length -= len(buf)
 
-        return result
+        return "".join(result)
+
+    def read_into(self, addr, buf):
+        """Reads len(buf) bytes from addr into the writable buffer buf.
+
+        Each chunk is copied straight into buf, so large reads (e.g. when
+        dumping memory) do not build up intermediate strings.
+
+        Returns:
+          The number of bytes read into buf.
+        """
+        view = memoryview(buf)
+        addr, length = int(addr), len(view)
+        offset = 0
+
+        while offset < length:
+            data = self._read_chunk(addr + offset, length - offset)
+            if not data:
+                break
+
+            view[offset:offset + len(data)] = data
+            offset += len(data)
+
+        return offset
+
+    def get_available_addresses(self, start=0):
+        """Generates (vaddr, paddr, length) runs of the mapped pages.
+
+        Paged address spaces enumerate their mappings page by page in
+        _get_available_pages(). Adjacent pages are merged into larger runs
+        here so callers do not have to deal with millions of tiny runs.
+        """
+        return CoalesceRuns(self._get_available_pages(start=start))
+
+    def _get_available_pages(self, start=0):
+        """Generates (vaddr, paddr, length) for all the mapped pages."""
+        _ = start
+        return []
 
     def is_valid_address(self, addr):
         vaddr = self.vtop(addr)
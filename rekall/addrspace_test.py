@@ -53,5 +53,96 @@ class RunBasedTest(testlib.RekallBaseUnitTestCase):
         self.assertEqual(self.contiguous_as.read(2000, 10),
                          "\x00" * 10)
 
+
+class CoalesceRunsTest(testlib.RekallBaseUnitTestCase):
+    """Test merging of adjacent runs."""
+
+    def testCoalesceRuns(self):
+        runs = [(0, 0x1000, 0x1000), (0x1000, 0x2000, 0x1000),
+                # Virtually contiguous but not physically contiguous.
+                (0x2000, 0x8000, 0x1000),
+                # Physically contiguous but not virtually contiguous.
+                (0x4000, 0x9000, 0x1000),
+                (0x5000, 0xa000, 0x200000)]
+
+        self.assertEqual(list(addrspace.CoalesceRuns(runs)),
+                         [(0, 0x1000, 0x2000),
+                          (0x2000, 0x8000, 0x1000),
+                          (0x4000, 0x9000, 0x201000)])
+
+
+class CustomPagedAddressSpace(addrspace.PagedReader):
+    """A PagedReader which maps virtual pages using a dict."""
+
+    __abstract = True
+
+    def __init__(self, pages=None, **kwargs):
+        super(CustomPagedAddressSpace, self).__init__(**kwargs)
+        self.pages = pages
+
+    def vtop(self, addr):
+        paddr = self.pages.get(addr & ~0xFFF)
+        if paddr is not None:
+            return paddr + (addr & 0xFFF)
+
+
+class PagedReaderTest(testlib.RekallBaseUnitTestCase):
+    """Test reading from a PagedReader."""
+
+    def setUp(self):
+        self.session = session.Session()
+        data = "".join(chr(ord("A") + i) * 0x1000 for i in range(4))
+        self.base = testlib.RecordingBufferAddressSpace(
+            session=self.session, data=data)
+
+        # Pages 0 and 1 are physically contiguous, page 2 is unmapped and page
+        # 3 is somewhere else.
+        self.paged_as = CustomPagedAddressSpace(
+            session=self.session, base=self.base,
+            pages={0: 0, 0x1000: 0x1000, 0x3000: 0x3000})
+
+    def testRead(self):
+        data = self.paged_as.read(0x800, 0x3000)
+        self.assertEqual(data, "A" * 0x800 + "B" * 0x1000 +
+                         "\x00" * 0x1000 + "D" * 0x800)
+
+        # The physically contiguous pages are read together.
+        self.assertEqual(self.base.reads, [(0x800, 0x1800), (0x3000, 0x800)])
+
+    def testReadInto(self):
+        buf = bytearray("X" * 0x2000)
+        self.assertEqual(self.paged_as.read_into(0x1800, buf), 0x2000)
+        self.assertEqual(str(buf), "B" * 0x800 + "\x00" * 0x1000 +
+                         "D" * 0x800)
+
+        # Reading into a slice of a buffer.
+        buf = bytearray(0x10)
+        self.paged_as.read_into(0xffe, memoryview(buf)[4:8])
+        self.assertEqual(str(buf), "\x00" * 4 + "AABB" + "\x00" * 8)
+
+        # The default implementation in BaseAddressSpace.
+        buf = bytearray(4)
+        self.assertEqual(self.base.read_into(0x1ffe, buf), 4)
+        self.assertEqual(str(buf), "BBCC")
+
+
+class BufferAddressSpaceTest(testlib.RekallBaseUnitTestCase):
+    """Test the BufferAddressSpace with different buffer types."""
+
+    def setUp(self):
+        self.session = session.Session()
+
+    def testBufferTypes(self):
+        for data in ("0123456789", bytearray("0123456789"),
+                     memoryview("0123456789"), buffer("0123456789")):
+            buffer_as = addrspace.BufferAddressSpace(
+                session=self.session, data=data, base_offset=1000)
+
+            self.assertEqual(len(buffer_as), 10)
+            self.assertEqual(buffer_as.end(), 1010)
+            self.assertEqual(buffer_as.read(1002, 3), "234")
+            self.assertEqual(buffer_as.read(1008, 4), "89\x00\x00")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,8 @@
 import cPickle
 import cStringIO
+import marshal
 import os
+import sys
 import time
 
 from rekall import config
@@ -15,6 +17,11 @@ config.DeclareOption(
     choices=["file", "memory", "timed"],
     help="Type of cache to use. ")
 
+config.DeclareOption(
+    "--cache_profiles", default=True, type="Boolean",
+    help="Keep a binary copy of the profiles loaded from repositories in the "
+    "cache directory.")
+
 
 class PicklingDirectoryIOManager(io_manager.DirectoryIOManager):
     def Encoder(self, data, **_):
@@ -50,6 +57,103 @@ class PicklingDirectoryIOManager(io_manager.DirectoryIOManager):
         return decoder.Decode(decoded)
 
 
+class MarshalDirectoryIOManager(io_manager.DirectoryIOManager):
+    """Stores data in uncompressed marshal files.
+
+    These are much faster to load than compressed JSON but may only contain
+    primitive types and can only be read by the same Python version.
+    """
+
+    # This is only used by the profile cache and must not be selected by
+    # io_manager.Factory().
+    __abstract = True
+
+    def Encoder(self, data, **_):
+        try:
+            return marshal.dumps(data)
+        except ValueError:
+            raise io_manager.EncodeError("Unable to marshal data")
+
+    def Decoder(self, raw):
+        try:
+            return marshal.loads(raw)
+        except (EOFError, ValueError, TypeError):
+            raise io_manager.DecodeError("Unable to unmarshal cached object")
+
+    def Create(self, name):
+        path = self._GetAbsolutePathName(name)
+        self.EnsureDirectoryExists(os.path.dirname(path))
+        return io_manager.AtomicFile(path)
+
+
+class ProfileCache(object):
+    """A local binary cache of the profiles loaded from the repositories.
+
+    Profiles are stored in the repositories as compressed JSON which is slow to
+    decode, and the profile then has to sort all its constant addresses. The
+    cache keeps the profile data ready to use, including the sorted constant
+    addresses, keyed by the repository and the time the profile was last
+    modified in it.
+    """
+
+    # Increment this when the format of the cached data changes.
+    VERSION = 1
+
+    def __init__(self, session):
+        self.session = session
+        self._io_manager = None
+
+    @property
+    def io_manager(self):
+        if not self.session.GetParameter("cache_profiles", True):
+            return
+
+        cache_dir = self.session.GetParameter("cache_dir", cached=False)
+        if self._io_manager is None and cache_dir:
+            # Cache dir may be specified relative to the home directory.
+            if config.GetHomeDir():
+                cache_dir = os.path.join(config.GetHomeDir(), cache_dir)
+
+            if os.access(cache_dir, os.F_OK | os.R_OK | os.W_OK | os.X_OK):
+                self._io_manager = MarshalDirectoryIOManager(
+                    "%s/profiles" % cache_dir, session=self.session,
+                    mode="w")
+
+        return self._io_manager
+
+    def _GetKey(self, manager, name):
+        last_modified = manager.Metadata(name).get("LastModified")
+        if last_modified is not None:
+            return [self.VERSION, list(sys.version_info[:2]), str(manager),
+                    last_modified]
+
+    def GetData(self, manager, name):
+        """Returns the profile data for name from the repository manager."""
+        cache_manager = self.io_manager
+        key = self._GetKey(manager, name)
+        if cache_manager is None or key is None:
+            return manager.GetData(name)
+
+        cached = cache_manager.GetData(name, default={})
+        if isinstance(cached, dict) and cached.get("key") == key:
+            return cached["data"]
+
+        data = manager.GetData(name)
+        if data:
+            data = obj.Profile.PrepareProfileData(data)
+            # The cache does not need an inventory so we write the file
+            # directly.
+            try:
+                to_write = cache_manager.Encoder(dict(key=key, data=data))
+                with cache_manager.Create(name) as fd:
+                    fd.write(to_write)
+            except (IOError, io_manager.EncodeError) as e:
+                self.session.logging.debug(
+                    "Unable to cache profile %s: %s", name, e)
+
+        return data
+
+
 class Cache(object):
     def __init__(self):
         self.data = {}
@@ -206,16 +310,16 @@ class FileCache(Cache):
     def Flush(self):
         """Write out all dirty items at once."""
         if self.name and self.io_manager:
-            # Save to disk the dirty items.
-            for key, item in self.data.iteritems():
-                if key in self.dirty or getattr(item, "dirty", False):
-                    now = time.time()
-                    self.io_manager.StoreData(
-                        "sessions/%s/%s" % (self.name, key), item)
-                    self.session.logging.debug("Flushed %s in %s" % (
-                        key, (time.time() - now)))
-
-            self.io_manager.FlushInventory()
+            # Save to disk the dirty items. The inventory is written once at
+            # the end.
+            with self.io_manager.BatchWrites():
+                for key, item in self.data.iteritems():
+                    if key in self.dirty or getattr(item, "dirty", False):
+                        now = time.time()
+                        self.io_manager.StoreData(
+                            "sessions/%s/%s" % (self.name, key), item)
+                        self.session.logging.debug("Flushed %s in %s" % (
+                            key, (time.time() - now)))
 
     def DetectImage(self, address_space):
         if not self.io_manager:
@@ -0,0 +1,60 @@
+import os
+import unittest
+
+from rekall import cache
+from rekall import session
+from rekall import testlib
+
+# Import and register all the plugins.
+from rekall import plugins # pylint: disable=unused-import
+
+
+class ProfileCacheTest(testlib.RepositoryTestCase):
+    """Test the binary profile cache."""
+
+    def setUp(self):
+        super(ProfileCacheTest, self).setUp()
+        self.repository.StoreData("test/profile", testlib.TEST_PROFILE)
+
+        self.cache_dir = os.path.join(self.temp_dir, "cache")
+        os.mkdir(self.cache_dir)
+
+    def LoadProfile(self):
+        test_session = session.Session()
+        test_session.SetParameter("cache_dir", self.cache_dir)
+        test_session._repository_managers = [  # pylint: disable=protected-access
+            ("test", self.repository)]
+
+        return test_session.LoadProfile("test/profile")
+
+    def testProfileCache(self):
+        profiles = [self.LoadProfile() for _ in range(3)]
+
+        # The repository is only read the first time.
+        self.assertEqual(len(self.repository.reads), 1)
+
+        for profile in profiles:
+            self.assertEqual(profile.get_constant("first"), 0x2000)
+            self.assertEqual(list(profile.constant_addresses),
+                             [(0x1000, "second"), (0x2000, "first"),
+                              (0x3000, "function")])
+            self.assertEqual(profile.get_obj_size("Test"), 4)
+
+        # Changing the profile in the repository invalidates the cache.
+        data = dict(testlib.TEST_PROFILE, **{"$CONSTANTS": dict(first=0x4000)})
+        self.repository.StoreData("test/profile", data)
+        path = self.repository._GetAbsolutePathName(  # pylint: disable=protected-access
+            "test/profile") + ".gz"
+        os.utime(path, (1, 1))
+
+        profile = self.LoadProfile()
+        self.assertEqual(len(self.repository.reads), 2)
+        self.assertEqual(profile.get_constant("first"), 0x4000)
+
+    def testDisabled(self):
+        data_cache = cache.ProfileCache(session.Session())
+        self.assertEqual(data_cache.io_manager, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
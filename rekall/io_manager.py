@@ -36,10 +36,12 @@ existing files.
 __author__ = "Michael Cohen <scudette@google.com>"
 
 import StringIO
+import contextlib
 import gzip
 import json
 import time
 import os
+import tempfile
 import urllib2
 import urlparse
 import zipfile
@@ -115,6 +117,10 @@ class IOManager(object):
         self._inventory = None
         self.location = ""
 
+        # Inventory updates are deferred while inside BatchWrites().
+        self._batch_depth = 0
+        self._inventory_dirty = False
+
     @property
     def inventory(self):
         if self._inventory is None:
@@ -177,6 +183,28 @@ class IOManager(object):
 
         self.StoreData("inventory", self.inventory)
 
+    @contextlib.contextmanager
+    def BatchWrites(self):
+        """Defer the inventory updates of StoreData() to a single flush.
+
+        Each StoreData() call normally rewrites the entire inventory. When
+        storing many items use:
+
+        with io_manager.BatchWrites():
+            for name, data in items:
+                io_manager.StoreData(name, data)
+
+        The inventory is written once when the outermost batch exits.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._inventory_dirty:
+                self._inventory_dirty = False
+                self.FlushInventory()
+
     def ListFiles(self):
         """Returns a generator over all the files in this container."""
         return []
@@ -280,7 +308,10 @@ class IOManager(object):
             self.inventory.setdefault("$INVENTORY", {})[name] = dict(
                 LastModified=time.time())
 
-            self.FlushInventory()
+            if self._batch_depth:
+                self._inventory_dirty = True
+            else:
+                self.FlushInventory()
 
     def __enter__(self):
         return self
@@ -374,7 +405,7 @@ class DirectoryIOManager(IOManager):
     def Create(self, name):
         path = self._GetAbsolutePathName(name)
         self.EnsureDirectoryExists(os.path.dirname(path))
-        return gzip.open(path + ".gz", "wb")
+        return AtomicFile(path + ".gz", opener=gzip.open)
 
     def Open(self, name):
         path = self._GetAbsolutePathName(name)
@@ -390,6 +421,69 @@ class DirectoryIOManager(IOManager):
         return "Directory:%s" % self.dump_dir
 
 
+# The umask is needed to give files created with tempfile.mkstemp() the usual
+# permissions. It can only be read by setting it.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class AtomicFile(object):
+    """A file which replaces the named file only when closed.
+
+    The data is written to a temporary file next to the target and renamed over
+    it on close, so concurrent readers never see a partially written file. If
+    the file is used as a context manager and the block raises, the target is
+    left untouched.
+    """
+
+    def __init__(self, path, opener=open):
+        self.name = path
+
+        # Each writer gets its own temporary file, even threads in the same
+        # process.
+        fd, self.temp_path = tempfile.mkstemp(
+            prefix=os.path.basename(path) + ".", suffix=".tmp",
+            dir=os.path.dirname(path) or ".")
+        os.close(fd)
+        os.chmod(self.temp_path, 0666 & ~_UMASK)
+
+        self.fd = opener(self.temp_path, "wb")
+
+    def write(self, data):
+        self.fd.write(data)
+
+    def close(self):
+        if self.fd.closed:
+            return
+
+        self.fd.close()
+        try:
+            os.rename(self.temp_path, self.name)
+        except OSError:
+            # On Windows rename does not replace an existing file.
+            os.remove(self.name)
+            os.rename(self.temp_path, self.name)
+
+    def _Cancel(self):
+        self.fd.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def __getattr__(self, attr):
+        return getattr(self.fd, attr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._Cancel()
+
+
 # pylint: disable=protected-access
 
 class SelfClosingFile(StringIO.StringIO):
@@ -0,0 +1,72 @@
+import os
+import unittest
+
+from rekall import io_manager
+from rekall import session
+from rekall import testlib
+
+
+class DirectoryIOManagerTest(testlib.RepositoryTestCase):
+    """Test the batching and atomicity of writes."""
+
+    def testBatchWrites(self):
+        writes = self.repository.inventory_writes
+        self.repository.StoreData("a", dict(a=1))
+        self.assertEqual(self.repository.inventory_writes, writes + 1)
+
+        with self.repository.BatchWrites():
+            for i in range(10):
+                self.repository.StoreData("b/%d" % i, dict(b=i))
+
+            # Nested batches only flush at the end of the outermost one.
+            with self.repository.BatchWrites():
+                self.repository.StoreData("c", dict(c=1))
+
+            self.assertEqual(self.repository.inventory_writes, writes + 1)
+
+        self.assertEqual(self.repository.inventory_writes, writes + 2)
+
+        manager = io_manager.DirectoryIOManager(
+            self.repository_path, version="", session=session.Session())
+        self.assertEqual(len(manager.inventory["$INVENTORY"]), 12)
+        self.assertEqual(manager.GetData("b/3"), dict(b=3))
+
+    def testAtomicWrite(self):
+        self.repository.StoreData("a", dict(a=1))
+
+        try:
+            with self.repository.Create("a") as fd:
+                fd.write("{")
+                raise RuntimeError("Write interrupted.")
+        except RuntimeError:
+            pass
+
+        # The old data is intact and no temporary files are left behind.
+        self.assertEqual(self.repository.GetData("a"), dict(a=1))
+        self.assertEqual(sorted(os.listdir(self.repository_path)),
+                         ["a.gz", "inventory.gz"])
+
+    def testConcurrentWriters(self):
+        directory = os.path.join(self.temp_dir, "concurrent")
+        os.mkdir(directory)
+
+        path = os.path.join(directory, "file")
+        first = io_manager.AtomicFile(path)
+        second = io_manager.AtomicFile(path)
+
+        # Writers of the same file do not share the temporary file.
+        self.assertNotEqual(first.temp_path, second.temp_path)
+
+        first.write("first")
+        second.write("second")
+        first.close()
+        second.close()
+
+        with open(path) as fd:
+            self.assertEqual(fd.read(), "second")
+
+        self.assertEqual(os.listdir(directory), ["file"])
+
+
+if __name__ == "__main__":
+    unittest.main()
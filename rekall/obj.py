@@ -70,6 +70,10 @@ class ProfileLog(object):
     def __init__(self):
         self.data = {}
         self.filename = os.environ.get(self.ENVIRONMENT_VAR)
+
+        # Logging is on every member access path so callers check this flag
+        # instead of calling into the log.
+        self.active = bool(self.filename)
         if self.filename:
             # Ensure we update the object access log when we exit.
             atexit.register(self._DumpData)
@@ -103,7 +107,7 @@ class ProfileLog(object):
 
     def LogFieldAccess(self, profile, obj_type, field_name):
         # Do nothing unless the environment is set.
-        if self.is_active():
+        if self.active:
             profile = self.data.setdefault(profile, {})
             fields = profile.setdefault(obj_type, set())
             if field_name:
@@ -112,9 +116,8 @@ class ProfileLog(object):
     def LogConstant(self, profile, name):
         self.LogFieldAccess(profile, "Constants", name)
 
-    @staticmethod
-    def is_active():
-        return bool(os.environ.get(ProfileLog.ENVIRONMENT_VAR))
+    def is_active(self):
+        return self.active
 
 
 # This is used to store Struct member access when the DEBUG_PROFILE environment
@@ -304,8 +307,18 @@ class ProfileError(Error):
 class BaseObject(object):
     __metaclass__ = registry.UniqueObjectIdMetaclass
 
-    obj_parent = NoneObject("No parent")
-    obj_name = NoneObject("No name")
+    # Millions of objects are created when walking large lists, so the core
+    # object classes keep their attributes in slots rather than in a per
+    # instance __dict__. Derived classes which do not declare __slots__ still
+    # get a __dict__.
+    #
+    # The Struct attributes are declared here rather than in Struct since
+    # classes may derive from both a NativeType and a Struct (e.g. timeval) and
+    # only one of their bases may add slots. Declaring them in NativeType
+    # instead would hide struct members called "value".
+    __slots__ = ("obj_type", "obj_offset", "obj_vm", "obj_parent", "obj_name",
+                 "obj_profile", "obj_context", "obj_session", "_object_id",
+                 "members", "struct_size", "_cache")
 
     # BaseObject implementations may take arbitrary **kwargs. The usual
     # programming pattern is to define the keywords each class takes explicitely
@@ -500,7 +513,7 @@ class BaseObject(object):
 
     def __dir__(self):
         """Hide any members with _."""
-        result = self.__dict__.keys() + dir(self.__class__)
+        result = getattr(self, "__dict__", {}).keys() + dir(self.__class__)
 
         return result
 
@@ -541,6 +554,7 @@ def CreateMixIn(mixin):
 
 class NumericProxyMixIn(object):
     """ This MixIn implements the numeric protocol """
+    __slots__ = ()
     _specials = [
         ## Number protocols
         '__add__', '__sub__', '__mul__',
@@ -565,6 +579,7 @@ class NumericProxyMixIn(object):
 
 class StringProxyMixIn(object):
     """This MixIn implements proxying for strings."""
+    __slots__ = ()
     _specials = [
         ## Comparisons
         '__lt__', '__le__', '__eq__', '__ge__', '__gt__', '__index__',
@@ -580,6 +595,8 @@ CreateMixIn(StringProxyMixIn)
 
 
 class NativeType(NumericProxyMixIn, BaseObject):
+    __slots__ = ("format_string", "value")
+
     def __init__(self, value=None, format_string=None, **kwargs):
         super(NativeType, self).__init__(**kwargs)
         self.format_string = format_string
@@ -610,6 +627,15 @@ class NativeType(NumericProxyMixIn, BaseObject):
         if self.value is not None:
             return self.value
 
+        # Decode from the struct snapshot if we are inside it.
+        snapshot = self.obj_context.get("snapshot")
+        if snapshot is not None:
+            result = snapshot.unpack(self.obj_vm, self.obj_offset,
+                                     self.format_string, self.obj_size)
+            if result is not None:
+                (self.value,) = result
+                return self.value
+
         data = self.obj_vm.read(self.obj_offset, self.obj_size)
         if not data:
             return NoneObject("Unable to read {0} bytes from {1}",
@@ -633,11 +659,13 @@ class NativeType(NumericProxyMixIn, BaseObject):
 
 
 class Bool(NativeType):
-    pass
+    __slots__ = ()
 
 
 class BitField(NativeType):
     """ A class splitting an integer into a bunch of bit. """
+    __slots__ = ("_proxy", "target", "start_bit", "end_bit", "mask")
+
     def __init__(self, start_bit=0, end_bit=32, target=None,
                  native_type=None, **kwargs):
         super(BitField, self).__init__(**kwargs)
@@ -680,6 +708,7 @@ class BitField(NativeType):
 
 class Pointer(NativeType):
     """A pointer reads an 'address' object from the address space."""
+    __slots__ = ("_proxy", "target", "target_args", "target_size", "kwargs")
 
     def __init__(self, target=None, target_args=None, value=None, **kwargs):
         """Constructor.
@@ -895,6 +924,8 @@ class Pointer(NativeType):
 
 
 class Void(Pointer):
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         kwargs['type_name'] = 'unsigned long'
         super(Void, self).__init__(**kwargs)
@@ -1172,6 +1203,8 @@ class ListArray(Array):
 
 class BaseAddressComparisonMixIn(object):
     """A mixin providing comparison operators for its base offset."""
+    __slots__ = ()
+
     def __comparator__(self, other, method):
         # 64 bit addresses are always sign extended so we need to clear the top
         # bits.
@@ -1201,12 +1234,147 @@ class BaseAddressComparisonMixIn(object):
         return self.__comparator__(other, operator.__ne__)
 
 
+class StructSnapshot(object):
+    """The data of a struct read from the address space in a single read.
+
+    Members of a snapshotted struct decode their values from this buffer rather
+    than reading the address space again. Reads which are not fully contained
+    in the buffer (e.g. through pointers leaving the struct) are not served
+    from the snapshot.
+    """
+
+    def __init__(self, vm, offset, data):
+        self.vm = vm
+        self.offset = offset
+        self.data = data
+        self.end = offset + len(data)
+
+    def _contains(self, vm, offset, length):
+        return (vm is self.vm and offset >= self.offset and
+                offset + length <= self.end)
+
+    def read(self, vm, offset, length):
+        """Returns the data at offset or None if it is not in the snapshot."""
+        if self._contains(vm, offset, length):
+            offset -= self.offset
+            return self.data[offset:offset + length]
+
+    def unpack(self, vm, offset, format_string, length):
+        """Unpacks the data at offset or returns None if not available."""
+        if self._contains(vm, offset, length):
+            return struct.unpack_from(format_string, self.data,
+                                      offset - self.offset)
+
+
+class StructLayout(object):
+    """A flat table of the fixed offset native fields of a struct.
+
+    The layout decodes all these fields with a single precompiled struct.Struct
+    which is much faster than instantiating the Struct and its members when
+    many records need to be decoded (e.g. all the entries of the PFN database).
+
+    Members of nested structs are included with dotted names (e.g. "u1.Flink")
+    and pointers are decoded as their integer value. Where fields overlap
+    (e.g. unions) only the first field at each offset is included.
+    """
+
+    def __init__(self, type_name, size, fields):
+        """Constructor.
+
+        Args:
+          type_name: The name of the struct.
+          size: The size of the struct.
+          fields: A list of (name, offset, format_string) for each field.
+        """
+        self.type_name = type_name
+        self.size = size
+        self.fields = []
+        self.offsets = []
+        self.formats = []
+
+        byte_order = "<"
+        format_string = ""
+        end = 0
+        for name, offset, field_format in sorted(
+                fields, key=lambda x: (x[1], x[0])):
+            if field_format[0] in "<>":
+                field_byte_order, field_format = (
+                    field_format[0], field_format[1:])
+
+                # All the fields must use the same byte order.
+                if not self.fields:
+                    byte_order = field_byte_order
+                elif field_byte_order != byte_order:
+                    continue
+
+            field_size = struct.calcsize(byte_order + field_format)
+            if offset < end or offset + field_size > size:
+                continue
+
+            if offset > end:
+                format_string += "%dx" % (offset - end)
+
+            format_string += field_format
+            end = offset + field_size
+
+            self.fields.append(name)
+            self.offsets.append(offset)
+            self.formats.append(byte_order + field_format)
+
+        if size > end:
+            format_string += "%dx" % (size - end)
+
+        self.byte_order = byte_order
+        self.format_string = format_string
+        self.struct = struct.Struct(byte_order + format_string)
+        self.field_index = dict((name, i) for i, name in enumerate(self.fields))
+
+    def unpack(self, data, offset=0):
+        """Decodes a single record at offset into a tuple."""
+        return self.struct.unpack_from(data, offset)
+
+    def unpack_array(self, data, count=None, offset=0):
+        """Decodes consecutive records into a list of tuples in one call."""
+        if count is None:
+            count = (len(data) - offset) // self.size
+
+        if count <= 0:
+            return []
+
+        values = struct.unpack_from(
+            self.byte_order + self.format_string * count, data, offset)
+
+        width = len(self.fields)
+        return [values[i:i + width] for i in xrange(0, len(values), width)]
+
+    def read_array(self, vm, offset, count):
+        """Reads and decodes count consecutive records from vm."""
+        return self.unpack_array(vm.read(offset, self.size * count), count)
+
+    def dtype(self):
+        """Returns an equivalent NumPy structured dtype."""
+        import numpy
+
+        return numpy.dtype(dict(
+            names=self.fields, formats=self.formats, offsets=self.offsets,
+            itemsize=self.size))
+
+    def unpack_numpy(self, data, count=-1, offset=0):
+        """Decodes consecutive records into a NumPy structured array."""
+        import numpy
+
+        return numpy.frombuffer(data, dtype=self.dtype(), count=count,
+                                offset=offset)
+
+
 class Struct(BaseAddressComparisonMixIn, BaseObject):
     """ A Struct is an object which represents a c struct
 
     Structs have members at various fixed relative offsets from our own base
     offset.
     """
+    __slots__ = ()
+
     def __init__(self, members=None, struct_size=0, **kwargs):
         """ This must be instantiated with a dict of members. The keys
         are the offsets, the values are Curried Object classes that
@@ -1220,7 +1388,9 @@ class Struct(BaseAddressComparisonMixIn, BaseObject):
            struct_size: The size of this struct if known (Can be None).
         """
         super(Struct, self).__init__(**kwargs)
-        ACCESS_LOG.LogFieldAccess(self.obj_profile.name, self.obj_type, None)
+        if ACCESS_LOG.active:
+            ACCESS_LOG.LogFieldAccess(
+                self.obj_profile.name, self.obj_type, None)
 
         if not members:
             # Warn rather than raise an error, since some types (_HARDWARE_PTE,
@@ -1331,6 +1501,10 @@ class Struct(BaseAddressComparisonMixIn, BaseObject):
 
         element = self.members.get(attr)
         if element is not None:
+            if ACCESS_LOG.active:
+                ACCESS_LOG.LogFieldAccess(
+                    self.obj_profile.name, self.obj_type, attr)
+
             # Allow the element to be a callable rather than a list - this is
             # useful for aliasing member names
             if callable(element):
@@ -1419,6 +1593,26 @@ class Struct(BaseAddressComparisonMixIn, BaseObject):
         """Returns the raw data of this struct."""
         return self.obj_vm.read(self.obj_offset, self.obj_size)
 
+    def Snapshot(self):
+        """Returns a copy of this struct which decodes from a single read.
+
+        The whole struct is read from the address space at once and its
+        members (including nested structs, arrays and strings) decode their
+        values from this buffer. This is much faster when many members are
+        accessed, but the snapshot does not see later changes to the address
+        space (e.g. on live memory or after writing to a member).
+        """
+        data = self.GetData()
+        if not data:
+            return self
+
+        context = self.obj_context.copy()
+        context["snapshot"] = StructSnapshot(self.obj_vm, self.obj_offset, data)
+
+        return self.obj_profile.Object(
+            type_name=self.obj_type, offset=self.obj_offset, vm=self.obj_vm,
+            parent=self.obj_parent, name=self.obj_name, context=context)
+
 
 ## Profiles are the interface for creating/interpreting
 ## objects
@@ -1512,29 +1706,158 @@ class Profile(object):
             result._SetupProfileFromData(data)  # pylint: disable=protected-access
             return result
 
+    @classmethod
+    def PrepareProfileData(cls, data):
+        """Precomputes the derived sections of the profile data.
+
+        This is used when caching profiles so they load faster. The profile
+        data is returned with the "$CONSTANT_ADDRESSES" section added, which
+        holds the sorted (address, name) pairs of all the constants.
+        """
+        constant_addresses = []
+        for section in ["$CONSTANTS", "$FUNCTIONS"]:
+            constant_addresses.extend(
+                cls._GetConstantAddresses(data.get(section) or {}))
+
+        result = dict(data)
+        result["$CONSTANT_ADDRESSES"] = sorted(constant_addresses)
+
+        return result
+
+    @staticmethod
+    def _GetConstantAddresses(constants):
+        """Returns the (address, name) pairs for a dict of constants."""
+        result = []
+        for k, v in constants.iteritems():
+            try:
+                result.append((Pointer.integer_to_address(v), k))
+            except ValueError:
+                pass
+
+        return result
+
     def _SetupProfileFromData(self, data):
-        """Sets up the current profile."""
+        """Sets up the current profile.
+
+        The sections of the profile data are not loaded here, but when they
+        are first used. Most plugins only use a few of the structs and
+        constants of each profile they load.
+        """
         # The constants are stored both in the $CONSTANTS section and the
         # $FUNCTIONS section. We treat them the same here.
         for section in ["$CONSTANTS", "$FUNCTIONS"]:
             constants = data.get(section)
             if constants:
-                self.add_constants(
-                    constants_are_addresses=True, **constants)
+                self._unloaded_constants.append(constants)
+
+        # Cached profiles have their constant addresses already sorted.
+        constant_addresses = data.get("$CONSTANT_ADDRESSES")
+        if constant_addresses is not None:
+            self._unloaded_constant_addresses.append(constant_addresses)
+        else:
+            self._unloaded_constant_addresses.extend(self._unloaded_constants)
 
         # The enums
         enums = data.get("$ENUMS")
         if enums:
-            self.add_enums(**enums)
+            self._unloaded_enums.append(enums)
 
         # The reverse enums
         reverse_enums = data.get("$REVENUMS")
         if reverse_enums:
-            self.add_reverse_enums(**reverse_enums)
+            self._unloaded_reverse_enums.append(reverse_enums)
 
         types = data.get("$STRUCTS")
         if types:
-            self.add_types(types)
+            self.known_types.update(types)
+            self._unloaded_types.update(types)
+
+    @property
+    def constants(self):
+        if self._unloaded_constants:
+            # Constants added after the profile data was set up (e.g. by
+            # Initialize()) take precedence.
+            constants = {}
+            for section in self._unloaded_constants:
+                constants.update(section)
+
+            constants.update(self._constants)
+            self._constants = constants
+            self._unloaded_constants = []
+
+        return self._constants
+
+    @constants.setter
+    def constants(self, value):
+        self._constants = value
+        self._unloaded_constants = []
+
+    @property
+    def constant_addresses(self):
+        if self._unloaded_constant_addresses:
+            items = list(self._constant_addresses)
+            for section in self._unloaded_constant_addresses:
+                if isinstance(section, dict):
+                    items.extend(self._GetConstantAddresses(section))
+                else:
+                    items.extend(tuple(x) for x in section)
+
+            self._unloaded_constant_addresses = []
+            self._constant_addresses = utils.SortedCollection(
+                items, key=lambda x: x[0])
+
+        return self._constant_addresses
+
+    @constant_addresses.setter
+    def constant_addresses(self, value):
+        self._constant_addresses = value
+        self._unloaded_constant_addresses = []
+
+    @property
+    def enums(self):
+        while self._unloaded_enums:
+            self.add_enums(**self._unloaded_enums.pop(0))
+
+        return self._enums
+
+    @enums.setter
+    def enums(self, value):
+        self._enums = value
+        self._unloaded_enums = []
+
+    @property
+    def reverse_enums(self):
+        while self._unloaded_reverse_enums:
+            self.add_reverse_enums(**self._unloaded_reverse_enums.pop(0))
+
+        return self._reverse_enums
+
+    @reverse_enums.setter
+    def reverse_enums(self, value):
+        self._reverse_enums = value
+        self._unloaded_reverse_enums = []
+
+    @property
+    def vtypes(self):
+        for type_name in list(self._unloaded_types):
+            self._LoadType(type_name)
+
+        return self._vtypes
+
+    @vtypes.setter
+    def vtypes(self, value):
+        self._vtypes = value
+        self._unloaded_types = {}
+
+    def _LoadType(self, type_name):
+        """Loads the vtype of type_name from the profile data if needed."""
+        definition = self._unloaded_types.pop(type_name, None)
+        if definition is not None:
+            self._vtypes[type_name] = copy.deepcopy(definition)
+
+    def _GetVtype(self, type_name, default=None):
+        self._LoadType(type_name)
+        return self._vtypes.get(type_name, default)
 
     @classmethod
     def Initialize(cls, profile):
@@ -1581,6 +1904,14 @@ class Profile(object):
         self.constant_addresses = utils.SortedCollection(key=lambda x: x[0])
         self.enums = {}
         self.reverse_enums = {}
+
+        # Sections of the profile data which are loaded when first used (See
+        # _SetupProfileFromData()).
+        self._unloaded_types = {}
+        self._unloaded_constants = []
+        self._unloaded_constant_addresses = []
+        self._unloaded_enums = []
+        self._unloaded_reverse_enums = []
         self.applied_modifications = set()
         self.object_classes = {}
 
@@ -1611,6 +1942,7 @@ class Profile(object):
 
     def flush_cache(self):
         self.types = {}
+        self.layouts = {}
 
     def copy(self):
         """Makes a copy of this profile."""
@@ -1618,12 +1950,20 @@ class Profile(object):
 
         # pylint: disable=protected-access
         result = self.__class__(name=self.name, session=self.session)
-        result.vtypes = self.vtypes.copy()
+        result.vtypes = self._vtypes.copy()
         result.overlays = self.overlays[:]
-        result.enums = self.enums.copy()
-        result.reverse_enums = self.reverse_enums.copy()
-        result.constants = self.constants.copy()
-        result.constant_addresses = self.constant_addresses.copy()
+        result.enums = self._enums.copy()
+        result.reverse_enums = self._reverse_enums.copy()
+        result.constants = self._constants.copy()
+        result.constant_addresses = self._constant_addresses.copy()
+
+        # The copy loads the sections which are not loaded yet on its own.
+        result._unloaded_types = self._unloaded_types.copy()
+        result._unloaded_constants = self._unloaded_constants[:]
+        result._unloaded_constant_addresses = (
+            self._unloaded_constant_addresses[:])
+        result._unloaded_enums = self._unloaded_enums[:]
+        result._unloaded_reverse_enums = self._unloaded_reverse_enums[:]
 
         # Object classes are shallow dicts.
         result.object_classes = self.object_classes.copy()
@@ -1642,9 +1982,24 @@ class Profile(object):
         """
         other.EnsureInitialized()
 
-        self.vtypes.update(other.vtypes)
+        # pylint: disable=protected-access
+        for type_name in other._vtypes:
+            self._unloaded_types.pop(type_name, None)
+        self._vtypes.update(other._vtypes)
+
+        for type_name, definition in other._unloaded_types.iteritems():
+            self._vtypes.pop(type_name, None)
+            self._unloaded_types[type_name] = definition
+
+        # Queue all the constants as unloaded sections, in increasing order of
+        # precedence, so neither profile's constants are loaded here.
+        sections = self._unloaded_constants + [self._constants]
+        sections += other._unloaded_constants + [dict(other._constants)]
+        self._unloaded_constants = [x for x in sections if x]
+        self._constants = {}
+        # pylint: enable=protected-access
+
         self.overlays += other.overlays
-        self.constants.update(other.constants)
         self.object_classes.update(other.object_classes)
         self.flush_cache()
         self.name = u"%s + %s" % (self.name, other.name)
@@ -1670,7 +2025,7 @@ class Profile(object):
     def has_type(self, type_name):
         # Make sure we are initialized on demand.
         self.EnsureInitialized()
-        return type_name in self.vtypes
+        return type_name in self._vtypes or type_name in self._unloaded_types
 
     def has_class(self, class_name):
         # Make sure we are initialized on demand.
@@ -1692,7 +2047,7 @@ class Profile(object):
         self.flush_cache()
 
         for k, v in kwargs.iteritems():
-            self.constants[k] = v
+            self._constants[k] = v
             if constants_are_addresses:
                 try:
                     # We need to interpret the value as a pointer.
@@ -1729,15 +2084,16 @@ class Profile(object):
         ## definitions).
         for k, v in abstract_types.items():
             if isinstance(v, list):
-                self.vtypes[k] = v
+                self._unloaded_types.pop(k, None)
+                self._vtypes[k] = v
 
             else:
-                original = self.vtypes.get(k, self.EMPTY_DESCRIPTOR)
+                original = self._GetVtype(k, self.EMPTY_DESCRIPTOR)
                 original[1].update(v[1])
                 if v[0]:
                     original[0] = v[0]
 
-                self.vtypes[k] = original
+                self._vtypes[k] = original
 
     def compile_type(self, type_name):
         """Compile the specific type and ensure it exists in the type cache.
@@ -1751,7 +2107,7 @@ class Profile(object):
             return
 
         original_type_descriptor = type_descriptor = copy.deepcopy(
-            self.vtypes.get(type_name, self.EMPTY_DESCRIPTOR))
+            self._GetVtype(type_name, self.EMPTY_DESCRIPTOR))
 
         for overlay in self.overlays:
             type_overlay = copy.deepcopy(overlay.get(type_name))
@@ -1764,7 +2120,7 @@ class Profile(object):
         if isinstance(type_descriptor, str):
             self.compile_type(type_descriptor)
             self.types[type_name] = self.types[type_descriptor]
-            type_descriptor = self.vtypes[type_descriptor]
+            type_descriptor = self._GetVtype(type_descriptor)
 
         if type_descriptor == self.EMPTY_DESCRIPTOR:
             # Mark that this is a pure object - not described by a
@@ -1831,7 +2187,9 @@ class Profile(object):
         # args:
         # http://stackoverflow.com/questions/938429/scope-of-python-lambda-functions-and-their-parameters/938493#938493
 
-        properties = dict(callable_members=callable_members.keys())
+        # The derived class adds no attributes so it does not need a __dict__.
+        properties = dict(callable_members=callable_members.keys(),
+                          __slots__=())
         for name in set(members).union(callable_members):
 
             # Do not mask hand written methods with autogenerated properties.
@@ -1979,6 +2337,42 @@ class Profile(object):
         tmp = self._get_dummy_obj(name)
         return tmp.obj_size
 
+    def get_struct_layout(self, name):
+        """Returns the StructLayout of the fixed offset native fields of name.
+
+        The layout is compiled from the type on first use and cached.
+        """
+        result = self.layouts.get(name)
+        if result is None:
+            tmp = self._get_dummy_obj(name)
+            result = self.layouts[name] = StructLayout(
+                name, tmp.obj_size, self._get_layout_fields(tmp))
+
+        return result
+
+    def _get_layout_fields(self, struct_obj, prefix="", base=0):
+        """Yields (name, offset, format_string) for the native fields."""
+        for member_name, (offset, _) in struct_obj.members.iteritems():
+            if not isinstance(offset, (int, long)):
+                continue
+
+            member = struct_obj.m(member_name)
+            name = prefix + member_name
+            if isinstance(member, Pointer):
+                yield (name, base + offset,
+                       member._proxy.format_string)  # pylint: disable=protected-access
+
+            # Only plain native types are included - derived classes (e.g.
+            # BitField or timestamps) interpret their values differently.
+            elif (isinstance(member, NativeType) and
+                  type(member).v.__func__ is NativeType.v.__func__):
+                yield name, base + offset, member.format_string
+
+            elif isinstance(member, Struct):
+                for field in self._get_layout_fields(
+                        member, prefix=name + ".", base=base + offset):
+                    yield field
+
     def obj_has_member(self, name, member):
         """Returns whether an object has a certain member"""
         ACCESS_LOG.LogFieldAccess(self.name, name, member)
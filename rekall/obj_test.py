@@ -1,4 +1,5 @@
 import logging
+import struct
 
 from rekall import addrspace
 from rekall import obj
@@ -7,6 +8,7 @@ from rekall import obj
 from rekall import plugins # pylint: disable=unused-import
 from rekall import session
 from rekall import testlib
+from rekall.plugins.overlays import basic
 
 
 class ProfileTest(testlib.RekallBaseUnitTestCase):
@@ -212,6 +214,164 @@ class ProfileTest(testlib.RekallBaseUnitTestCase):
         # Can read past the end of the array but this returns all zeros.
         self.assertEqual(test[100], 0)
 
+    def testSnapshot(self):
+        address_space = testlib.RecordingBufferAddressSpace(
+            data="\x10\x00\x00\x00\x2a\x00\x00\x00name\x00\x00\x00\x00"
+            "\x01\x02\x03\x04", session=self.session)
+
+        profile = obj.Profile.classes['Profile32Bits'](session=self.session)
+        profile.add_classes(String=basic.String)
+        profile.add_types({
+            'Test': [0x10, {
+                'ptr': [0x00, ['Pointer', dict(target='unsigned long')]],
+                'value': [0x04, ['unsigned long']],
+                'flags': [0x04, ['BitField', dict(start_bit=1, end_bit=4)]],
+                'name': [0x08, ['String', dict(length=8)]],
+                'array': [0x04, ['Array', dict(target='unsigned char',
+                                               count=4)]],
+                }]})
+
+        def Row(test):
+            return (test.ptr.v(), int(test.ptr.deref()), int(test.value),
+                    int(test.flags), str(test.name),
+                    [int(x) for x in test.array])
+
+        test = profile.Test(offset=0, vm=address_space)
+        expected = Row(test)
+        self.assertEqual(
+            expected, (0x10, 0x04030201, 0x2a, 5, "name", [0x2a, 0, 0, 0]))
+        live_reads = len(address_space.reads)
+
+        # The snapshot reads the struct once, and only dereferencing the
+        # pointer out of the struct needs another read.
+        del address_space.reads[:]
+        snapshot = profile.Test(offset=0, vm=address_space).Snapshot()
+        self.assertEqual(Row(snapshot), expected)
+        self.assertEqual(len(address_space.reads), 2)
+        self.assertLess(len(address_space.reads), live_reads)
+
+        # The snapshot is still the same object.
+        self.assertEqual(snapshot, test)
+
+    def testStructLayout(self):
+        profile = obj.Profile.classes['Profile32Bits'](session=self.session)
+        profile.add_types({
+            'Inner': [0x8, {
+                'a': [0x00, ['unsigned short']],
+                'b': [0x04, ['unsigned long']],
+                }],
+            'Test': [0x14, {
+                'ptr': [0x00, ['Pointer', dict(target='Inner')]],
+                'inner': [0x04, ['Inner']],
+                'union': [0x04, ['unsigned long']],
+                'flags': [0x0c, ['BitField', dict(start_bit=1, end_bit=4)]],
+                'value': [0x10, ['unsigned char']],
+                }]})
+
+        layout = profile.get_struct_layout("Test")
+        self.assertEqual(layout.fields, ["ptr", "inner.a", "inner.b", "value"])
+        self.assertEqual(layout.struct.size, 0x14)
+
+        address_space = addrspace.BufferAddressSpace(
+            data="".join(chr(x) for x in range(0x14 * 3)),
+            session=self.session)
+
+        records = layout.read_array(address_space, 0, 3)
+        self.assertEqual(len(records), 3)
+        for i, record in enumerate(records):
+            test = profile.Test(offset=i * 0x14, vm=address_space)
+            self.assertEqual(
+                record,
+                (test.ptr.v(), test.inner.a, test.inner.b, test.value))
+
+        self.assertEqual(layout.unpack(address_space.read(0x14, 0x14)),
+                         records[1])
+
+    def testSlots(self):
+        # Build a circular chain of list entries.
+        count = 10000
+        data = bytearray(count * 8)
+        for i in range(count):
+            struct.pack_into("<II", data, i * 8, (i + 1) % count * 8,
+                             (i - 1) % count * 8)
+
+        address_space = addrspace.BufferAddressSpace(
+            data=str(data), session=self.session)
+
+        profile = obj.Profile.classes['Profile32Bits'](session=self.session)
+        profile.add_types({
+            '_LIST_ENTRY': [8, {
+                'Flink': [0, ['Pointer', dict(target='_LIST_ENTRY')]],
+                'Blink': [4, ['Pointer', dict(target='_LIST_ENTRY')]],
+                }]})
+
+        entries = list(profile._LIST_ENTRY(
+            offset=0, vm=address_space).walk_list("Flink"))
+        self.assertEqual([x.obj_offset for x in entries],
+                         range(0, count * 8, 8))
+
+        # None of the objects created for the walk carry a __dict__.
+        for item in (entries[1], entries[1].Flink, entries[1].Flink.deref()):
+            self.assertFalse(hasattr(item, "__dict__"))
+
+        self.assertEqual(entries[2].Blink.deref(), entries[1])
+
+    def testLazyLoading(self):
+        profile = obj.Profile.LoadProfileFromData({
+            "$METADATA": dict(ProfileClass="Profile32Bits", Type="Profile"),
+            "$CONSTANTS": dict(first=0x2000),
+            "$FUNCTIONS": dict(function=0x1000),
+            "$ENUMS": dict(Enum={"1": "one"}),
+            "$STRUCTS": {
+                "First": [4, {"field": [0, ["unsigned int"]]}],
+                "Second": [8, {"field": [4, ["unsigned int"]]}],
+                },
+            }, session=self.session, name="Test")
+
+        # pylint: disable=protected-access
+        self.assertTrue(profile.has_type("Second"))
+        self.assertEqual(profile._vtypes, {})
+        self.assertNotIn("first", profile._constants)
+
+        # Only the used struct is loaded.
+        self.assertEqual(profile.get_obj_size("First"), 4)
+        self.assertEqual(profile._vtypes.keys(), ["First"])
+
+        self.assertEqual(profile.get_constant("function"), 0x1000)
+        self.assertEqual(profile.get_nearest_constant_by_address(0x2004),
+                         (0x2000, "first"))
+        self.assertEqual(profile.get_enum("Enum", "1"), "one")
+
+        # Copies load the remaining sections on their own.
+        copy = profile.copy()
+        self.assertEqual(copy.get_obj_size("Second"), 8)
+        self.assertEqual(profile._unloaded_types.keys(), ["Second"])
+        self.assertEqual(sorted(copy.vtypes), ["First", "Second"])
+
+    def testLazyMerge(self):
+        first = obj.Profile.LoadProfileFromData({
+            "$METADATA": dict(ProfileClass="Profile32Bits", Type="Profile"),
+            "$CONSTANTS": dict(first=1, shared=1),
+            }, session=self.session, name="First")
+        first.add_constants(added=1)
+
+        second = obj.Profile.LoadProfileFromData({
+            "$METADATA": dict(ProfileClass="Profile32Bits", Type="Profile"),
+            "$CONSTANTS": dict(second=2, shared=2, added=2),
+            }, session=self.session, name="Second")
+
+        first.merge(second)
+
+        # pylint: disable=protected-access
+        self.assertNotIn("second", first._constants)
+        self.assertNotIn("second", second._constants)
+
+        # The merged profile's constants take precedence.
+        self.assertEqual(first.get_constant("first"), 1)
+        self.assertEqual(first.get_constant("second"), 2)
+        self.assertEqual(first.get_constant("shared"), 2)
+        self.assertEqual(first.get_constant("added"), 2)
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
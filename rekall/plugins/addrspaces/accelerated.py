@@ -16,36 +16,92 @@
 #
 
 """The module provides alternate implementations utilizing C extension modules.
+
+The accelerated address spaces walk the page tables using the native support
+module (built from src/support.c). They are drop in replacements for the pure
+Python address spaces and are selected automatically by
+FindDTB.GetAddressSpaceImplementation() if the support module is available,
+unless the --accelerated option is disabled.
+
+Each accelerated class is named after the class it replaces with an
+"Accelerated" prefix. The Windows address spaces are accelerated in
+rekall.plugins.windows.accelerated.
 """
 
 __author__ = "scudette@google.com (Michael Cohen)"
-import logging
-import os
 
 from rekall import support
 from rekall.plugins.addrspaces import amd64
+from rekall.plugins.addrspaces import intel
+
 
-class AcceleratedAMD64PagedMemory(amd64.AMD64PagedMemory):
-    """An accelerated AMD64 address space."""
+class AcceleratedTranslationMixin(object):
+    """Translates addresses using the native page table walker."""
+
+    # The paging mode of the native walker.
+    support_mode = None
 
     def __init__(self, **kwargs):
-        super(AcceleratedAMD64PagedMemory, self).__init__(**kwargs)
-        self._delegate = support.AMD64PagedMemory(self.base, int(self.dtb))
+        super(AcceleratedTranslationMixin, self).__init__(**kwargs)
+        self._delegate = support.PagedMemory(
+            base=self.base, dtb=int(self.dtb), mode=self.support_mode,
+            valid_mask=int(self.valid_mask), cache=not self.volatile)
+
+    def vtop(self, vaddr):
+        vaddr = long(vaddr)
+        try:
+            return self._tlb.Get(vaddr)
+        except KeyError:
+            pass
+
+        result = self._delegate.vtop(vaddr)
+        if result is None:
+            return self._vtop_unmapped(vaddr)
+
+        self._tlb.Put(vaddr, result)
+        return result
+
+    def _vtop_unmapped(self, vaddr):
+        """Called for addresses which are not mapped by the hardware."""
+        self._tlb.Put(vaddr, None)
+
+
+class AcceleratedPagedMemoryMixin(AcceleratedTranslationMixin):
+    """Also reads and enumerates the address space natively."""
+
+    def read(self, addr, length):
+        if length > self.session.GetParameter("buffer_size"):
+            raise IOError("Too much data to read.")
+
+        return self._delegate.read(long(addr), long(length))
+
+    def read_into(self, addr, buf):
+        data = self.read(addr, len(buf))
+        memoryview(buf)[:len(data)] = data
+
+        return len(data)
+
+    def get_available_addresses(self, start=0):
+        for run in self._delegate.get_available_addresses(start=long(start)):
+            yield run
+
+
+class AcceleratedIA32PagedMemory(AcceleratedPagedMemoryMixin,
+                                 intel.IA32PagedMemory):
+    """An accelerated IA32PagedMemory."""
+
+    support_mode = support.MODE_IA32
 
-    def read(self, offset, length):
-        return self._delegate.read(int(offset), int(length))
 
-    def vtop(self, address):
-        return self._delegate.vtop(int(address))
+class AcceleratedIA32PagedMemoryPae(AcceleratedPagedMemoryMixin,
+                                    intel.IA32PagedMemoryPae):
+    """An accelerated IA32PagedMemoryPae."""
 
-    def get_available_addresses(self):
-        for virt, offset, _ in self._delegate.get_available_addresses():
-            yield virt, offset
+    support_mode = support.MODE_PAE
 
 
-if os.environ.get("FAST"):
-    logging.info("Installing accelerated address spaces.")
-    # Replace the original implementation with the accelerated one.
-    AcceleratedAMD64PagedMemory.classes[
-        "AMD64PagedMemory"] = AcceleratedAMD64PagedMemory
+class AcceleratedAMD64PagedMemory(AcceleratedPagedMemoryMixin,
+                                  amd64.AMD64PagedMemory):
+    """An accelerated AMD64PagedMemory."""
 
+    support_mode = support.MODE_AMD64
@@ -0,0 +1,147 @@
+import unittest
+
+from rekall import addrspace
+from rekall import obj
+from rekall import session
+from rekall import testlib
+from rekall.plugins import core
+from rekall.plugins.addrspaces import amd64
+from rekall.plugins.addrspaces import intel
+
+try:
+    from rekall.plugins.addrspaces import accelerated
+except ImportError:
+    accelerated = None
+
+
+@unittest.skipIf(accelerated is None, "The support module is not available.")
+class AcceleratedConformanceTest(testlib.RekallBaseUnitTestCase):
+    """Check the accelerated address spaces against the Python ones."""
+
+    def setUp(self):
+        self.session = session.Session()
+
+    def CheckConformance(self, image, python_cls, accelerated_cls, dtb,
+                         addresses):
+        base = addrspace.BufferAddressSpace(
+            session=self.session, data=str(image.data))
+
+        # Use separate sessions so the address spaces do not share cached
+        # translations.
+        expected = python_cls(base=base, dtb=dtb, session=session.Session())
+        actual = accelerated_cls(base=base, dtb=dtb,
+                                 session=session.Session())
+
+        for start in [0] + list(addresses):
+            self.assertEqual(
+                list(actual.get_available_addresses(start=start)),
+                list(expected.get_available_addresses(start=start)))
+
+        for vaddr in addresses:
+            for offset in (0, 0x123, 0xfff):
+                self.assertEqual(actual.vtop(vaddr + offset),
+                                 expected.vtop(vaddr + offset))
+
+            for length in (1, 0x10, 0x1000, 0x2345):
+                self.assertEqual(actual.read(vaddr + 0xff8, length),
+                                 expected.read(vaddr + 0xff8, length))
+
+            buf = bytearray(0x3000)
+            actual.read_into(vaddr, buf)
+            self.assertEqual(str(buf), expected.read(vaddr, 0x3000))
+
+    def testIA32(self):
+        # PD at 0x1000 -> PT at 0x2000.
+        image = testlib.SyntheticPageTables("<I", size=0x800000)
+        image.fill_pattern()
+        image.clear_table(0x1000)
+        image.clear_table(0x2000)
+        image.set_entry(0x1000, 0, 0x2000 | 1)
+
+        # A 4mb page.
+        image.set_entry(0x1000, 1, 0x400000 | 1 << 7 | 1)
+
+        # Contiguous, discontiguous and not present pages.
+        for i in range(4):
+            image.set_entry(0x2000, i, (0x10000 + i * 0x1000) | 1)
+        image.set_entry(0x2000, 5, 0x8000 | 1)
+        image.set_entry(0x2000, 7, 0x9000)
+
+        # A PDE high in the address space.
+        image.set_entry(0x1000, 0x300, 0x2000 | 1)
+
+        self.CheckConformance(
+            image, intel.IA32PagedMemory,
+            accelerated.AcceleratedIA32PagedMemory, 0x1000,
+            [0, 0x3000, 0x5000, 0x7000, 0x400000, 0x7ff000, 0xc0001000,
+             0xfffff000])
+
+    def testPAE(self):
+        # PDPT at 0x1000 -> PD at 0x2000 -> PT at 0x3000.
+        image = testlib.SyntheticPageTables("<Q", size=0x800000)
+        image.fill_pattern()
+        for table in (0x1000, 0x2000, 0x3000):
+            image.clear_table(table)
+
+        image.set_entry(0x1000, 0, 0x2000 | 1)
+        image.set_entry(0x1000, 3, 0x2000 | 1)
+        image.set_entry(0x2000, 0, 0x3000 | 1)
+
+        # A 2mb page.
+        image.set_entry(0x2000, 1, 0x200000 | 1 << 7 | 1)
+
+        for i in range(4):
+            image.set_entry(0x3000, i, (0x10000 + i * 0x1000) | 1)
+        image.set_entry(0x3000, 5, 0x8000 | 1)
+        image.set_entry(0x3000, 7, 0x9000)
+
+        self.CheckConformance(
+            image, intel.IA32PagedMemoryPae,
+            accelerated.AcceleratedIA32PagedMemoryPae, 0x1000,
+            [0, 0x3000, 0x5000, 0x7000, 0x200000, 0x3ff000, 0x40000000,
+             0xc0000000, 0xc0201000])
+
+    def testAMD64(self):
+        # PML4 at 0x1000 -> PDPT at 0x2000 -> PD at 0x3000 -> PT at 0x4000.
+        image = testlib.SyntheticPageTables("<Q", size=0x800000)
+        image.fill_pattern()
+        for table in (0x1000, 0x2000, 0x3000, 0x4000):
+            image.clear_table(table)
+
+        image.set_entry(0x1000, 0, 0x2000 | 1)
+        image.set_entry(0x1000, 0x1ff, 0x2000 | 1)
+        image.set_entry(0x2000, 0, 0x3000 | 1)
+
+        # A 1gb page is beyond the image so reads are padded.
+        image.set_entry(0x2000, 2, 0x40000000 | 1 << 7 | 1)
+
+        image.set_entry(0x3000, 0, 0x4000 | 1)
+        image.set_entry(0x3000, 1, 0x200000 | 1 << 7 | 1)
+
+        for i in range(4):
+            image.set_entry(0x4000, i, (0x10000 + i * 0x1000) | 1)
+        image.set_entry(0x4000, 5, 0x8000 | 1)
+        image.set_entry(0x4000, 7, 0x9000)
+
+        self.CheckConformance(
+            image, amd64.AMD64PagedMemory,
+            accelerated.AcceleratedAMD64PagedMemory, 0x1000,
+            [0, 0x3000, 0x5000, 0x7000, 0x200000, 0x3ff000, 0x80000000,
+             0xff8000000000, 0xff8000201000])
+
+    def testImplementationSelection(self):
+        self.session.physical_address_space = addrspace.BufferAddressSpace(
+            session=self.session, data="\x00" * 0x1000)
+        find_dtb = core.FindDTB(session=self.session,
+                                profile=obj.Profile(session=self.session))
+
+        self.assertEqual(find_dtb.GetAddressSpaceClass("AMD64PagedMemory"),
+                         accelerated.AcceleratedAMD64PagedMemory)
+
+        self.session.SetParameter("accelerated", False)
+        self.assertEqual(find_dtb.GetAddressSpaceClass("AMD64PagedMemory"),
+                         amd64.AMD64PagedMemory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -142,6 +142,11 @@ class AMD64PagedMemory(intel.IA32PagedMemoryPae):
         or the offset in physical memory where the address maps.
         '''
         vaddr = long(vaddr)
+        try:
+            return self._tlb.Get(vaddr)
+        except KeyError:
+            pass
+
         pml4e = self.get_pml4e(vaddr)
         if not pml4e & self.valid_mask:
             # Add support for paged out PML4E
@@ -166,8 +171,10 @@ class AMD64PagedMemory(intel.IA32PagedMemoryPae):
             return self.get_two_meg_paddr(vaddr, pde)
 
         pte = self.get_pte(vaddr, pde)
+        res = self.get_phys_addr(vaddr, pte)
 
-        return self.get_phys_addr(vaddr, pte)
+        self._tlb.Put(vaddr, res)
+        return res
 
     def describe_vtop(self, vaddr):
         pml4e_addr = ((self.dtb & 0xffffffffff000) |
@@ -217,38 +224,60 @@ class AMD64PagedMemory(intel.IA32PagedMemoryPae):
             physical_address = (pte_value & 0xffffffffff000) | (vaddr & 0xfff)
             yield "Physical Address", physical_address, None
 
-    def get_available_addresses(self, start=0):
-        """Enumerate all available ranges.
+    def _read_table(self, table_addr):
+        """Reads and decodes an entire paging structure in one read.
 
-        Yields tuples of (vaddr, physical address, length) for all available
-        ranges in the virtual address space.
+        This is much faster than reading each entry separately - and the
+        enumeration of the page tables is HOT!
+
+        Args:
+          table_addr: The physical address of the paging structure.
+
+        Returns:
+          A sequence of the 0x200 entries in the table.
         """
-        # Pages that hold PDEs and PTEs are 0x1000 bytes each.
-        # Each PDE and PTE is eight bytes. Thus there are 0x1000 / 8 = 0x200
-        # PDEs and PTEs we must test.
-        for pml4e in range(0, 0x200):
-            vaddr = pml4e << 39
-
-            next_vaddr = (pml4e + 1) << 39
-            if start >= next_vaddr:
-                continue
+        return self._read_table_page(table_addr)
 
-            pml4e_value = self.get_pml4e(vaddr)
-            if not pml4e_value & self.valid_mask:
-                continue
+    def _get_pml4_table(self):
+        """Returns all the entries of the PML4 table."""
+        return self._read_table(self.dtb & 0xffffffffff000)
 
-            tmp1 = vaddr
-            for pdpte in range(0, 0x200):
-                vaddr = tmp1 | (pdpte << 30)
+    @staticmethod
+    def _get_first_index(table_vaddr, start, shift):
+        """Returns the index of the first entry which is not below start.
 
-                next_vaddr = tmp1 | ((pdpte + 1) << 30)
-                if start >= next_vaddr:
-                    continue
+        Args:
+          table_vaddr: The virtual address mapped by the first table entry.
+          start: The address we start enumerating from.
+          shift: The size of the region mapped by each entry (as a shift).
+        """
+        if start <= table_vaddr:
+            return 0
+
+        return min(0x200, (start - table_vaddr) >> shift)
+
+    def _get_available_pages(self, start=0):
+        """Enumerate all available ranges.
+
+        Yields tuples of (vaddr, physical address, length) for all available
+        ranges in the virtual address space. Physically contiguous pages are
+        coalesced into a single range.
+        """
+        valid_mask = self.valid_mask
+        pml4_table = self._get_pml4_table()
+        for pml4e in xrange(self._get_first_index(0, start, 39), 0x200):
+            pml4e_value = pml4_table[pml4e]
+            if not pml4e_value & valid_mask:
+                continue
 
-                pdpte_value = self.get_pdpte(vaddr, pml4e_value)
-                if not pdpte_value & self.valid_mask:
+            tmp1 = pml4e << 39
+            pdpt_table = self._read_table(pml4e_value & 0xffffffffff000)
+            for pdpte in xrange(self._get_first_index(tmp1, start, 30), 0x200):
+                pdpte_value = pdpt_table[pdpte]
+                if not pdpte_value & valid_mask:
                     continue
 
+                vaddr = tmp1 | (pdpte << 30)
                 if self.page_size_flag(pdpte_value):
                     yield (vaddr,
                            self.get_one_gig_paddr(vaddr, pdpte_value),
@@ -260,51 +289,53 @@ class AMD64PagedMemory(intel.IA32PagedMemoryPae):
 
     def _get_available_PDEs(self, vaddr, pdpte_value, start):
         tmp2 = vaddr
-        for pde in range(0, 0x200):
-            vaddr = tmp2 | (pde << 21)
-
-            next_vaddr = tmp2 | ((pde + 1) << 21)
-            if start >= next_vaddr:
-                continue
-
-            pde_value = self.get_pde(vaddr, pdpte_value)
-            if not pde_value & self.valid_mask:
+        valid_mask = self.valid_mask
+        pd_table = self._read_table(pdpte_value & 0xffffffffff000)
+        for pde in xrange(self._get_first_index(tmp2, start, 21), 0x200):
+            pde_value = pd_table[pde]
+            if not pde_value & valid_mask:
                 continue
 
+            vaddr = tmp2 | (pde << 21)
             if self.page_size_flag(pde_value):
                 yield (vaddr,
                        self.get_two_meg_paddr(vaddr, pde_value),
                        0x200000)
                 continue
 
-            # This reads the entire PTE table at once - On
-            # windows where IO is extremely expensive, its
-            # about 10 times more efficient than reading it
-            # one value at the time - and this loop is HOT!
-            pte_table_addr = ((pde_value & 0xffffffffff000) |
-                              ((vaddr & 0x1ff000) >> 9))
-
-            data = self.base.read(pte_table_addr, 8 * 0x200)
-            pte_table = struct.unpack("<" + "Q" * 0x200, data)
-
+            pte_table = self._read_table(pde_value & 0xffffffffff000)
             for x in self._get_available_PTEs(
                     pte_table, vaddr, start=start):
                 yield x
 
     def _get_available_PTEs(self, pte_table, vaddr, start=0):
+        """Yields coalesced runs of the valid pages in the PTE table."""
         tmp3 = vaddr
-        for i, pte_value in enumerate(pte_table):
-            if not pte_value & self.valid_mask:
+        valid_mask = self.valid_mask
+        run_vaddr = run_paddr = run_length = 0
+
+        for i in xrange(self._get_first_index(tmp3, start, 12), 0x200):
+            pte_value = pte_table[i]
+            if not pte_value & valid_mask:
                 continue
 
+            # This is get_phys_addr() for the page start, inlined because it
+            # is called for every single page.
             vaddr = tmp3 | i << 12
-            next_vaddr = tmp3 | ((i + 1) << 12)
-            if start >= next_vaddr:
+            paddr = pte_value & 0xffffffffff000
+
+            if (run_length and vaddr == run_vaddr + run_length and
+                    paddr == run_paddr + run_length):
+                run_length += 0x1000
                 continue
 
-            yield (vaddr,
-                   self.get_phys_addr(vaddr, pte_value),
-                   0x1000)
+            if run_length:
+                yield run_vaddr, run_paddr, run_length
+
+            run_vaddr, run_paddr, run_length = vaddr, paddr, 0x1000
+
+        if run_length:
+            yield run_vaddr, run_paddr, run_length
 
     def end(self):
         return (2 ** 64) - 1
@@ -369,12 +400,22 @@ class VTxPagedMemory(AMD64PagedMemory):
         self._ept = this_ept
         self.name = "VTxPagedMemory@%#x" % self._ept
 
+        # Our translations depend on the EPT, which was not known when the
+        # base class made the TLB.
+        self._tlb = self._get_tlb()
+
+    def _get_translation_namespace(self):
+        return self.__class__.__name__, self._ept
+
     def get_pml4e(self, vaddr):
         # PML4 for VT-x is in the EPT, not the DTB as AMD64PagedMemory does.
         ept_pml4e_paddr = ((self._ept & 0xffffffffff000) |
                            ((vaddr & 0xff8000000000) >> 36))
         return self.read_long_long_phys(ept_pml4e_paddr)
 
+    def _get_pml4_table(self):
+        return self._read_table(self._ept & 0xffffffffff000)
+
     def __str__(self):
         return "%s@0x%08X" % (self.__class__.__name__, self._ept)
 
@@ -465,6 +506,9 @@ class XenParaVirtAMD64PagedMemory(AMD64PagedMemory):
 
             self.m2p_mapping = new_mapping
             self.session.SetCache("mapping", self.m2p_mapping)
+
+            # Translations made with the old mapping are stale now.
+            self._tlb.Flush()
         finally:
             self.rebuilding_map = False
 
@@ -481,6 +525,16 @@ class XenParaVirtAMD64PagedMemory(AMD64PagedMemory):
             return 0
         return (pfn * 0x1000) | (0xFFF & machine_address)
 
+    def _get_tlb(self):
+        # Our translations change when the m2p mapping is rebuilt so they are
+        # not shared.
+        return addrspace.TranslationLookasideBuffer(1000)
+
+    def _read_table(self, table_addr):
+        # All entries in the page tables refer to machine addresses.
+        return [self.m2p(x) for x in super(
+            XenParaVirtAMD64PagedMemory, self)._read_table(table_addr)]
+
     def get_pml4e(self, vaddr):
         return self.m2p(
             super(XenParaVirtAMD64PagedMemory, self).get_pml4e(vaddr))
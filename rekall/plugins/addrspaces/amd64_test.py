@@ -0,0 +1,173 @@
+import unittest
+
+from rekall import addrspace
+from rekall import obj
+from rekall import scan
+from rekall import session
+from rekall import testlib
+from rekall.plugins.addrspaces import amd64
+
+
+class AMD64PagedMemoryTest(testlib.RekallBaseUnitTestCase):
+    """Test the AMD64 page table walker."""
+
+    def setUp(self):
+        self.session = session.Session()
+
+        # PML4 at 0x1000 -> PDPT at 0x2000 -> PD at 0x3000 -> PT at 0x4000.
+        tables = testlib.SyntheticPageTables()
+        tables.set_entry(0x1000, 0, 0x2000 | 1)
+        tables.set_entry(0x2000, 0, 0x3000 | 1)
+        tables.set_entry(0x3000, 0, 0x4000 | 1)
+
+        # A 2mb page at 0x200000.
+        tables.set_entry(0x3000, 1, 0x200000 | 1 << 7 | 1)
+
+        # Four physically contiguous pages, then a discontiguous one.
+        for i in range(4):
+            tables.set_entry(0x4000, i, (0x10000 + i * 0x1000) | 1)
+
+        tables.set_entry(0x4000, 5, 0x8000 | 1)
+
+        # A page which is not present.
+        tables.set_entry(0x4000, 7, 0x9000)
+
+        self.base = addrspace.BufferAddressSpace(
+            session=self.session, data=str(tables.data))
+        self.address_space = amd64.AMD64PagedMemory(
+            base=self.base, session=self.session, dtb=0x1000)
+
+    def testGetAvailableAddresses(self):
+        self.assertEqual(
+            list(self.address_space.get_available_addresses()),
+            [(0, 0x10000, 0x4000),
+             (0x5000, 0x8000, 0x1000),
+             (0x200000, 0x200000, 0x200000)])
+
+        # Ranges are consistent with vtop().
+        for vaddr, paddr, length in (
+                self.address_space.get_available_addresses()):
+            for offset in range(0, length, 0x1000):
+                self.assertEqual(self.address_space.vtop(vaddr + offset),
+                                 paddr + offset)
+
+        self.assertEqual(self.address_space.vtop(0x7000), None)
+
+    def testGetAvailableAddressesStart(self):
+        self.assertEqual(
+            list(self.address_space.get_available_addresses(start=0x5000)),
+            [(0x5000, 0x8000, 0x1000),
+             (0x200000, 0x200000, 0x200000)])
+
+
+class ScanDiscontiguousPagesTest(testlib.RekallBaseUnitTestCase):
+    """Test scanning virtually contiguous but physically scattered pages."""
+
+    def setUp(self):
+        self.session = session.Session()
+
+        tables = testlib.SyntheticPageTables()
+        tables.set_entry(0x1000, 0, 0x2000 | 1)
+        tables.set_entry(0x2000, 0, 0x3000 | 1)
+        tables.set_entry(0x3000, 0, 0x4000 | 1)
+
+        # Map 64 pages in reverse physical order.
+        for i in range(64):
+            tables.set_entry(0x4000, i, (0x100000 - i * 0x1000) | 1)
+
+        # A needle straddling the boundary between virtual pages 3 and 4.
+        tables.data[0xfdffd:0xfe000] = "NEE"
+        tables.data[0xfc000:0xfc003] = "DLE"
+
+        self.base = testlib.RecordingBufferAddressSpace(
+            session=self.session, data=str(tables.data))
+        self.address_space = amd64.AMD64PagedMemory(
+            base=self.base, session=self.session, dtb=0x1000)
+
+    def testScan(self):
+        # Each page is a separate run.
+        self.assertEqual(
+            len(list(self.address_space.get_available_addresses())), 64)
+
+        # But all the pages form a single virtually contiguous region.
+        self.assertEqual(
+            len(list(self.address_space.get_gather_ranges())), 1)
+
+        scanned_blocks = []
+        self.session.progress.Register(
+            "test", lambda message, *_, **__: scanned_blocks.append(message))
+
+        scanner = scan.BaseScanner(
+            profile=obj.NoneObject(), session=self.session,
+            address_space=self.address_space,
+            checks=[("StringCheck", dict(needle="NEEDLE"))])
+
+        del self.base.reads[:]
+        self.assertEqual(list(scanner.scan()), [0x3ffd])
+
+        # The pages are gathered into a single block with one read per page.
+        # The page tables were already read above and come from the session's
+        # translation cache.
+        self.assertEqual(
+            len([x for x in scanned_blocks if x.startswith("Scanning")]), 1)
+        self.assertEqual(len(self.base.reads), 64)
+
+
+class TranslationCacheTest(testlib.RekallBaseUnitTestCase):
+    """Test sharing translations between address spaces."""
+
+    def setUp(self):
+        self.session = session.Session()
+
+        # Two DTBs sharing the same PDPT.
+        tables = testlib.SyntheticPageTables()
+        tables.set_entry(0x1000, 0, 0x2000 | 1)
+        tables.set_entry(0x5000, 0, 0x2000 | 1)
+        tables.set_entry(0x2000, 0, 0x3000 | 1)
+        tables.set_entry(0x3000, 0, 0x4000 | 1)
+        tables.set_entry(0x4000, 1, 0x10000 | 1)
+
+        self.base = testlib.RecordingBufferAddressSpace(
+            session=self.session, data=str(tables.data))
+
+    def testSharedTranslations(self):
+        address_space = amd64.AMD64PagedMemory(
+            base=self.base, session=self.session, dtb=0x1000)
+        self.assertEqual(address_space.vtop(0x1010), 0x10010)
+
+        # One read for each of the 4 paging structures.
+        self.assertEqual(len(self.base.reads), 4)
+
+        # A new address space for the same DTB reuses the translation.
+        del self.base.reads[:]
+        address_space = amd64.AMD64PagedMemory(
+            base=self.base, session=self.session, dtb=0x1000)
+        self.assertEqual(address_space.vtop(0x1020), 0x10020)
+        self.assertEqual(len(self.base.reads), 0)
+
+        # A different DTB only needs to read its own PML4.
+        address_space = amd64.AMD64PagedMemory(
+            base=self.base, session=self.session, dtb=0x5000)
+        self.assertEqual(address_space.vtop(0x1030), 0x10030)
+        self.assertEqual(len(self.base.reads), 1)
+
+        statistics = self.session.translation_cache.GetStatistics()
+        self.assertEqual(statistics["translation_hits"], 1)
+        self.assertEqual(statistics["translation_misses"], 2)
+
+    def testReset(self):
+        address_space = amd64.AMD64PagedMemory(
+            base=self.base, session=self.session, dtb=0x1000)
+        address_space.vtop(0x1000)
+
+        # Changing the image flushes the cache.
+        self.session.Reset()
+        del self.base.reads[:]
+        address_space = amd64.AMD64PagedMemory(
+            base=self.base, session=self.session, dtb=0x1000)
+        self.assertEqual(address_space.vtop(0x1000), 0x10000)
+        self.assertEqual(len(self.base.reads), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
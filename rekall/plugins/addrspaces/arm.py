@@ -321,7 +321,7 @@ class ArmPagedMemory(addrspace.PagedReader):
         return None
 
 
-    def get_available_addresses(self, start=0):
+    def _get_available_pages(self, start=0):
         """Generate all valid addresses.
 
         Note that ARM requires page table entries for large sections to be
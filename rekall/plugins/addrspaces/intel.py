@@ -84,14 +84,41 @@ class IA32PagedMemory(addrspace.PagedReader):
                             " plugin to search for the dtb.")
         self.name = (name or 'Kernel AS') + "@%#x" % self.dtb
 
-        # Use a TLB to make this faster.
-        self._tlb = addrspace.TranslationLookasideBuffer(1000)
-
         # Our get_available_addresses() refers to the base address space we
         # overlay on.
         self.phys_base = self.base
 
-        self._cache = utils.FastStore(100)
+        # Use a TLB to make this faster. The translations and the paging
+        # structures are shared with all the other address spaces in the
+        # session which read the same page tables.
+        self._tlb = self._get_tlb()
+        self._tables = self._get_table_store()
+
+    def _get_translation_namespace(self):
+        """Returns the key our translations are shared under.
+
+        All address spaces of the same type and DTB translate addresses in the
+        same way so they can share their translations.
+        """
+        return self.__class__.__name__, self.dtb
+
+    def _get_tlb(self):
+        translation_cache = self.session.translation_cache
+
+        # Translations on a live system may change at any time so they are
+        # never shared.
+        if self.volatile or not translation_cache:
+            return addrspace.TranslationLookasideBuffer(1000)
+
+        return translation_cache.GetTLB(
+            self.base, self._get_translation_namespace())
+
+    def _get_table_store(self):
+        translation_cache = self.session.translation_cache
+        if self.volatile or not translation_cache:
+            return utils.FastStore(100)
+
+        return translation_cache.GetTableStore(self.base)
 
     def page_access_flag(self, entry):
         '''
@@ -247,7 +274,7 @@ class IA32PagedMemory(addrspace.PagedReader):
         string = self.base.read(addr, 4)
         return struct.unpack('<I', string)[0]
 
-    def get_available_addresses(self, start=0):
+    def _get_available_pages(self, start=0):
         """Enumerate all valid memory ranges.
 
         Yields:
@@ -260,7 +287,7 @@ class IA32PagedMemory(addrspace.PagedReader):
         for pde in range(0, 0x400):
             vaddr = pde << 22
             next_vaddr = (pde + 1) << 22
-            if start > next_vaddr:
+            if start >= next_vaddr:
                 continue
 
             pde_value = self.get_pde(vaddr)
@@ -288,7 +315,7 @@ class IA32PagedMemory(addrspace.PagedReader):
                 vaddr = tmp1 | i << 12
                 next_vaddr = tmp1 | ((i + 1) << 12)
 
-                if start > next_vaddr:
+                if start >= next_vaddr:
                     continue
 
                 if pte_value & self.valid_mask:
@@ -460,16 +487,24 @@ class IA32PagedMemoryPae(IA32PagedMemory):
         Returns an unsigned 64-bit integer from the address addr in
         physical memory. If unable to read from that location, returns None.
         '''
+        return self._read_table_page(addr & PAGE_MASK)[(addr & 0xfff) >> 3]
+
+    def _read_table_page(self, table_addr):
+        """Returns the decoded entries of the paging structure at table_addr.
+
+        Paging structures are read and decoded a page at a time and cached in
+        the session's translation cache, so address spaces sharing page tables
+        (e.g. the kernel half of every process) only read them once.
+        """
         try:
-            return self._cache.Get(addr)
+            return self._tables.Get(table_addr)
         except KeyError:
-            string = self.base.read(addr, 8)
-            result = struct.unpack('<Q', string)[0]
-            self._cache.Put(addr, result)
+            result = addrspace.DecodeTable(self.base.read(table_addr, 0x1000))
+            self._tables.Put(table_addr, result)
 
             return result
 
-    def get_available_addresses(self, start=0):
+    def _get_available_pages(self, start=0):
         """A generator of address, length tuple for all valid memory regions."""
         # Pages that hold PDEs and PTEs are 0x1000 bytes each.
         # Each PDE and PTE is eight bytes. Thus there are 0x1000 / 8 = 0x200
@@ -94,7 +94,7 @@ class MIPS32PagedMemory(intel.IA32PagedMemory):
         '''
         return pte << 1
 
-    def get_available_addresses(self, start=0):
+    def _get_available_pages(self, start=0):
         """Enumerate all valid memory ranges.
 
         Yields:
@@ -34,7 +34,8 @@ class WindowsProcessParser(common.WindowsEntityCollector):
 
     def collect(self, hint, procs):
         for entity in procs:
-            eproc = entity["Struct/base"]
+            # Decode all the fields we need from a single read.
+            eproc = entity["Struct/base"].Snapshot()
             yield [
                 entity.identity | self.manager.identify({"Process/pid":
                                                          eproc.pid}),
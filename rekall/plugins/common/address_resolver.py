@@ -24,6 +24,7 @@ import re
 
 from rekall import config
 from rekall import obj
+from rekall import utils
 
 
 config.DeclareOption(
@@ -56,12 +57,21 @@ class AddressResolverMixin(object):
         r"(?P<op> *[+-] *)?"            # Possible arithmetic operator.
         r"(?P<offset>[0-9a-fA-Fx]+)?")  # Possible hex offset.
 
+    # The number of formatted addresses we remember.
+    ADDRESS_CACHE_SIZE = 10000
+
     def __init__(self, **kwargs):
         super(AddressResolverMixin, self).__init__(**kwargs)
         self.profiles = {}
 
+        # An LRU of formatted addresses. Key is (process context, address,
+        # max_distance).
+        self._address_cache = utils.FastStore(
+            max_size=self.ADDRESS_CACHE_SIZE)
+
     def Reset(self):
         self.profiles.clear()
+        self._address_cache.Flush()
 
     def NormalizeModuleName(self, module):
         try:
@@ -213,6 +223,37 @@ class AddressResolverMixin(object):
         Returns an empty string if the address is not in a containing module, or
         if the nearest known symbol is farther than max_distance away.
         """
+        address = obj.Pointer.integer_to_address(address)
+
+        # Addresses in user space resolve differently in each process.
+        process_context = self.session.GetParameter("process_context")
+        key = (getattr(process_context, "obj_offset", None), address,
+               max_distance)
+
+        try:
+            return self._address_cache.Get(key)
+        except KeyError:
+            result = self._format_address(address, max_distance=max_distance)
+            self._address_cache.Put(key, result)
+
+            return result
+
+    def format_addresses(self, addresses, max_distance=0x1000):
+        """Format many addresses as symbol names (e.g. a table column).
+
+        Returns a list of the formatted addresses in the same order.
+        """
+        # Resolving the addresses in order visits each module and its symbols
+        # once.
+        results = {}
+        for address in sorted(set(int(x) for x in addresses)):
+            results[address] = self.format_address(
+                address, max_distance=max_distance)
+
+        return [results[int(x)] for x in addresses]
+
+    def _format_address(self, address, max_distance=0x1000):
+        """Format the address as a symbol name (Not cached)."""
         _ = address
         _ = max_distance
         return ""
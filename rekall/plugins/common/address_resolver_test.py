@@ -0,0 +1,52 @@
+import unittest
+
+from rekall import session
+from rekall import testlib
+from rekall.plugins.common import address_resolver
+
+
+class CountingAddressResolver(address_resolver.AddressResolverMixin):
+    """A resolver which knows a single module."""
+
+    def __init__(self, **kwargs):
+        super(CountingAddressResolver, self).__init__()
+        self.session = kwargs["session"]
+        self.calls = []
+
+    def _format_address(self, address, max_distance=0x1000):
+        self.calls.append(address)
+        if 0x1000 <= address < 0x2000:
+            return "mod + %#x" % (address - 0x1000)
+
+        return ""
+
+
+class AddressResolverTest(testlib.RekallBaseUnitTestCase):
+    """Test the address resolver cache."""
+
+    def setUp(self):
+        self.session = session.Session()
+        self.resolver = CountingAddressResolver(session=self.session)
+
+    def testCache(self):
+        self.assertEqual(self.resolver.format_address(0x1010), "mod + 0x10")
+        self.assertEqual(self.resolver.format_address(0x1010), "mod + 0x10")
+        self.assertEqual(self.resolver.format_address(0x3000), "")
+        self.assertEqual(self.resolver.calls, [0x1010, 0x3000])
+
+        # Reset() forgets the resolved addresses.
+        self.resolver.Reset()
+        self.resolver.format_address(0x1010)
+        self.assertEqual(self.resolver.calls, [0x1010, 0x3000, 0x1010])
+
+    def testFormatAddresses(self):
+        addresses = [0x1800, 0x1010, 0x3000, 0x1800]
+        self.assertEqual(self.resolver.format_addresses(addresses),
+                         ["mod + 0x800", "mod + 0x10", "", "mod + 0x800"])
+
+        # Each address is resolved once, in order.
+        self.assertEqual(self.resolver.calls, [0x1010, 0x1800, 0x3000])
+
+
+if __name__ == "__main__":
+    unittest.main()
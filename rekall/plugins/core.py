@@ -38,6 +38,11 @@ from rekall import testlib
 from rekall import utils
 
 
+config.DeclareOption(
+    "--accelerated", default=True, type="Boolean",
+    help="Use the native address space implementations when available.")
+
+
 class Info(plugin.Command):
     """Print information about various subsystems."""
 
@@ -284,9 +289,21 @@ class FindDTB(plugin.PhysicalASMixin, plugin.ProfileCommand):
         else:
             impl = 'IA32PagedMemory'
 
+        return self.GetAddressSpaceClass(impl)
+
+    def GetAddressSpaceClass(self, impl):
+        """Returns the address space class named impl.
+
+        If an accelerated implementation of the class is available it is
+        preferred, unless disabled by the --accelerated option.
+        """
+        classes = addrspace.BaseAddressSpace.classes
+        if self.session.GetParameter("accelerated", True):
+            accelerated_class = classes.get("Accelerated" + impl)
+            if accelerated_class is not None:
+                return accelerated_class
 
-        as_class = addrspace.BaseAddressSpace.classes[impl]
-        return as_class
+        return classes[impl]
 
 
 class LoadAddressSpace(plugin.Command):
@@ -596,14 +613,11 @@ class DirectoryDumperMixin(object):
         """
         BUFFSIZE = 1024 * 1024
 
-        for offset, _, length in address_space.get_available_addresses(
-                start=start):
-
-            if start > offset:
-                continue
+        # All the data is copied through the same buffer.
+        buf = memoryview(bytearray(BUFFSIZE))
 
-            if offset >= end:
-                break
+        for offset, _, length in address_space.get_address_ranges(
+                start=start, end=end):
 
             out_offset = offset - start
             self.session.report_progress("Dumping %s Mb", out_offset/BUFFSIZE)
@@ -612,10 +626,12 @@ class DirectoryDumperMixin(object):
 
             # Now copy the region in fixed size buffers.
             while i < offset + length:
-                to_read = min(BUFFSIZE, length)
+                to_read = min(BUFFSIZE, offset + length - i)
 
-                data = address_space.read(i, to_read)
-                outfd.write(data)
+                # Only write what was read. Some outfds (e.g. StringIO) can
+                # not write a memoryview directly.
+                bytes_read = address_space.read_into(i, buf[:to_read])
+                outfd.write(buf[:bytes_read].tobytes())
 
                 i += to_read
 
@@ -16,10 +16,65 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 #
 
+import StringIO
+import unittest
+
+from rekall import addrspace
+from rekall import session
 from rekall import testlib
+from rekall.plugins import core
+
+
+class ShortReadAddressSpace(addrspace.BufferAddressSpace):
+    """An address space which only reads half of what is asked."""
+
+    __abstract = True
+
+    def read_into(self, addr, buf):
+        view = memoryview(buf)
+        return super(ShortReadAddressSpace, self).read_into(
+            addr, view[:len(view) / 2])
+
+
+class Dumper(core.DirectoryDumperMixin):
+    """Just enough of a plugin to call CopyToFile()."""
+
+    def __init__(self, session=None):  # pylint: disable=super-init-not-called
+        self.session = session
+
+
+class CopyToFileTest(testlib.RekallBaseUnitTestCase):
+    """Test dumping an address space into a file."""
+
+    def setUp(self):
+        self.session = session.Session()
+        self.data = "".join(chr(x % 251) for x in xrange(0x3000))
+
+    def testCopyToStringIO(self):
+        address_space = addrspace.BufferAddressSpace(
+            session=self.session, data=self.data)
+        outfd = StringIO.StringIO()
+        Dumper(session=self.session).CopyToFile(
+            address_space, 0x1000, 0x3000, outfd)
+
+        self.assertEqual(outfd.getvalue(), self.data[0x1000:])
+
+    def testShortRead(self):
+        address_space = ShortReadAddressSpace(
+            session=self.session, data=self.data)
+        outfd = StringIO.StringIO()
+        Dumper(session=self.session).CopyToFile(
+            address_space, 0, 0x3000, outfd)
+
+        # Only the data which was read is written.
+        self.assertEqual(outfd.getvalue(), self.data[:0x1800])
 
 
 class TestGrep(testlib.SimpleTestCase):
     PARAMETERS = dict(
         commandline="grep %(keyword)s --offset %(offset)s"
         )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -154,9 +154,7 @@ class LinuxAddressResolver(address_resolver.AddressResolverMixin,
 
         return nearest_offset, full_name
 
-    def format_address(self, address, max_distance=0x1000):
-        address = obj.Pointer.integer_to_address(address)
-
+    def _format_address(self, address, max_distance=0x1000):
         # Try to locate the symbol below it.
         offset, name = self.get_nearest_constant_by_address(address)
         difference = address - offset
@@ -357,9 +357,15 @@ class LinProcessFilter(LinuxPlugin):
                               len(self.cache[k]), k)
                 seen.update(self.cache[k])
 
+        tasks = [self.profile.task_struct(x) for x in seen]
+
+        # On a memory image each task is read once and its members decoded
+        # from that buffer. Live memory may change, so read it as needed.
+        if not self.kernel_address_space.volatile:
+            tasks = [x.Snapshot() for x in tasks]
+
         # Sort by pid so that the output ordering remains stable.
-        return sorted([self.profile.task_struct(x) for x in seen],
-                      key=lambda x: x.pid)
+        return sorted(tasks, key=lambda x: x.pid)
 
 
     def filter_processes(self):
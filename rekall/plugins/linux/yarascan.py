@@ -61,6 +61,7 @@ class LinYaraScan(common.LinProcessFilter):
           yara_expression: If provided we scan for this yarra expression.
         """
         super(LinYaraScan, self).__init__(**kwargs)
+        self.rules_source = None
         if yara_expression:
             self.rules_source = yara_expression
             self.rules = yara.compile(source=self.rules_source)
@@ -83,7 +84,7 @@ class LinYaraScan(common.LinProcessFilter):
         scanner = yarascanner.BaseYaraASScanner(
             profile=self.profile, session=self.session,
             address_space=address_space,
-            rules=self.rules)
+            rules=self.rules, rules_source=self.rules_source)
 
         return scanner.scan()
 
@@ -85,7 +85,14 @@ class String(obj.StringProxyMixIn, obj.NativeType):
 
         # TODO: Make this read in chunks to support very large reads.
         vm = vm or self.obj_vm
-        data = vm.read(self.obj_offset, length)
+        data = None
+        snapshot = self.obj_context.get("snapshot")
+        if snapshot is not None:
+            data = snapshot.read(vm, self.obj_offset, length)
+
+        if data is None:
+            data = vm.read(self.obj_offset, length)
+
         if self.term is not None:
             left, sep, _ = data.partition(self.term)
             data = left + sep
@@ -163,7 +170,13 @@ class UnicodeString(String):
     def v(self, vm=None):
         vm = vm or self.obj_vm
 
-        data = vm.read(self.obj_offset, self.length)
+        data = None
+        snapshot = self.obj_context.get("snapshot")
+        if snapshot is not None:
+            data = snapshot.read(vm, self.obj_offset, self.length)
+
+        if data is None:
+            data = vm.read(self.obj_offset, self.length)
 
         # Try to interpret it as a unicode encoded string.
         data = data.decode(self.encoding, "ignore")
@@ -915,7 +915,8 @@ class _HANDLE_TABLE(obj.Struct):
         is the _HANDLE_TABLE_ENTRY so that an object can be linked to its
         GrantedAccess.
         """
-        return entry.Object.dereference_as("_OBJECT_HEADER", parent=entry)
+        return entry.Object.dereference_as(
+            "_OBJECT_HEADER", parent=entry, vm=self.obj_vm)
 
     def _make_handle_array(self, table_offset, level):
         """ Returns an array of _HANDLE_TABLE_ENTRY rooted at offset,
@@ -925,8 +926,16 @@ class _HANDLE_TABLE(obj.Struct):
         # _HANDLE_TABLE_ENTRY, otherwise, it means we are a table of pointers to
         # lower tables.
         if level == 0:
+            # Read the whole table at once instead of reading each entry
+            # separately. The entries are dereferenced in our own address
+            # space by get_item().
+            table_vm = addrspace.BufferAddressSpace(
+                data=self.obj_vm.read(table_offset, 0x1000),
+                base_offset=table_offset, session=self.obj_session)
+
             table = self.obj_profile.Array(
                 offset=table_offset,
+                vm=table_vm,
                 target="_HANDLE_TABLE_ENTRY",
                 size=0x1000)
 
@@ -935,11 +944,11 @@ class _HANDLE_TABLE(obj.Struct):
 
         else:
             table = self.obj_profile.PointerArray(
-                offset=table_offset, size=0x1000)
+                offset=table_offset, vm=self.obj_vm, size=0x1000)
 
             for entry in table:
                 if entry:
-                    for item in self._make_handle_array(entry, level-1):
+                    for item in self._make_handle_array(entry.v(), level-1):
                         yield item
 
     def handles(self):
@@ -116,6 +116,9 @@ class CachingManager(io_manager.IOManager):
     def StoreData(self, name, data, **options):
         self.cache_io_manager.StoreData(name, data, **options)
 
+    def BatchWrites(self):
+        return self.cache_io_manager.BatchWrites()
+
     def CheckUpstreamRepository(self):
         """Checks the repository for freshness."""
         upstream_inventory = self.url_manager.inventory
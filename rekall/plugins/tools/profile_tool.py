@@ -90,6 +90,7 @@ import StringIO
 import yaml
 
 from rekall import io_manager
+from rekall import obj
 from rekall import plugin
 from rekall import registry
 from rekall import testlib
@@ -689,6 +690,164 @@ class BuildIndex(plugin.Command):
         renderer.write(utils.PPrint(result))
 
 
+class MinimizeProfile(core.OutputFileMixin, plugin.Command):
+    """Produce a profile with only the parts of a profile which are used.
+
+    When the DEBUG_PROFILE environment variable points at a file, Rekall logs
+    every struct, field and constant it accesses in each profile to that file
+    (see obj.ProfileLog). This plugin takes these access logs and a full
+    profile, and writes a minimized profile containing only the accessed
+    constants and structs, the accessed fields of the structs, and all the
+    types and enums these fields refer to.
+
+    Minimized profiles load much faster. Store them in the repository under the
+    "minimized/" prefix (e.g. minimized/nt/GUID/...) and set the
+    --minimized_profiles option to prefer them.
+    """
+
+    __name = "minimize_profile"
+
+    # These sections are reduced, all others are copied as they are.
+    MINIMIZED_SECTIONS = ["$CONSTANTS", "$FUNCTIONS", "$STRUCTS", "$ENUMS",
+                          "$REVENUMS"]
+
+    @classmethod
+    def args(cls, parser):
+        """Declare the command line args we need."""
+        parser.add_argument(
+            "profile",
+            help="The name of the profile in the repository or its filename.")
+
+        parser.add_argument(
+            "--access_logs", type="ArrayStringParser", required=True,
+            help="The access logs written with DEBUG_PROFILE.")
+
+        parser.add_argument(
+            "--log_name", default=None,
+            help="The name of the profile in the access logs. Defaults to "
+            "the profile name.")
+
+        super(MinimizeProfile, cls).args(parser)
+
+    def __init__(self, profile=None, access_logs=None, log_name=None,
+                 **kwargs):
+        super(MinimizeProfile, self).__init__(**kwargs)
+        self.profile = profile
+        self.access_logs = access_logs or []
+        self.log_name = log_name or profile
+
+    def _GetProfileData(self, name):
+        """Returns the raw data of the profile from a file or a repository."""
+        if os.access(name, os.R_OK) or os.access(name + ".gz", os.R_OK):
+            container = io_manager.DirectoryIOManager(
+                os.path.dirname(name) or ".", version=None,
+                session=self.session)
+
+            return container.GetData(os.path.basename(name))
+
+        for _, manager in self.session.repository_managers:
+            if manager.CheckInventory(name):
+                data = manager.GetData(name)
+                if data:
+                    return data
+
+        raise IOError("Profile %s not found." % name)
+
+    def _GetAccesses(self):
+        """Merge the access logs into a dict of type name -> set of fields."""
+        result = {}
+        for filename in self.access_logs:
+            with open(filename, "rb") as fd:
+                data = json.loads(
+                    fd.read(), object_hook=obj.ProfileLog.JSONEncoder.as_set)
+
+            for type_name, fields in data.get(self.log_name, {}).iteritems():
+                result.setdefault(type_name, set()).update(fields)
+
+        return result
+
+    @staticmethod
+    def _GetReferences(definition):
+        """Yields all the strings in a vtype definition.
+
+        Type and enum names can appear anywhere in a member definition (e.g. a
+        Pointer's target or an Enumeration's enum_name).
+        """
+        if isinstance(definition, basestring):
+            yield definition
+
+        elif isinstance(definition, (list, tuple)):
+            for item in definition:
+                for reference in MinimizeProfile._GetReferences(item):
+                    yield reference
+
+        elif isinstance(definition, dict):
+            for item in definition.itervalues():
+                for reference in MinimizeProfile._GetReferences(item):
+                    yield reference
+
+    def Minimize(self, data, accesses):
+        """Returns a minimized copy of the profile data.
+
+        Args:
+          data: The full profile data.
+          accesses: A dict of type name -> fields accessed in the type. The
+            constants are listed under "Constants".
+        """
+        result = dict((k, v) for k, v in data.iteritems()
+                      if k not in self.MINIMIZED_SECTIONS)
+
+        constants = accesses.get("Constants", set())
+        for section in ("$CONSTANTS", "$FUNCTIONS"):
+            if section in data:
+                result[section] = dict(
+                    (k, v) for k, v in data[section].iteritems()
+                    if k in constants)
+
+        all_structs = data.get("$STRUCTS", {})
+        all_enums = data.get("$ENUMS", {})
+        structs = {}
+        enums = set()
+
+        # Follow the kept fields to the types they refer to, keeping the
+        # logged fields of those types too.
+        pending = [x for x in accesses if x in all_structs]
+        while pending:
+            type_name = pending.pop()
+            if type_name in structs:
+                continue
+
+            size, fields = all_structs[type_name]
+            fields = dict((k, v) for k, v in fields.iteritems()
+                          if k in accesses.get(type_name, ()))
+            structs[type_name] = [size, fields]
+
+            for reference in self._GetReferences(fields.values()):
+                if reference in all_structs:
+                    pending.append(reference)
+
+                elif reference in all_enums:
+                    enums.add(reference)
+
+        result["$STRUCTS"] = structs
+        if "$ENUMS" in data:
+            result["$ENUMS"] = dict((k, all_enums[k]) for k in enums)
+
+        if "$REVENUMS" in data:
+            result["$REVENUMS"] = dict(
+                (k, v) for k, v in data["$REVENUMS"].iteritems()
+                if k in enums)
+
+        return result
+
+    def render(self, renderer):
+        result = self.Minimize(self._GetProfileData(self.profile),
+                               self._GetAccesses())
+
+        with renderer.open(filename=self.out_file, mode="wb") as output:
+            output.write(utils.PPrint(result))
+
+
 class BuildProfileLocally(plugin.Command):
     """Download and builds a profile locally in one step.
 
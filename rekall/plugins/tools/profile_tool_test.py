@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from rekall import addrspace
+from rekall import obj
+from rekall import session
+from rekall import testlib
+
+# Import and register all the plugins.
+from rekall import plugins # pylint: disable=unused-import
+from rekall.plugins.overlays import basic
+from rekall.plugins.tools import profile_tool
+
+
+PROFILE = {
+    "$METADATA": dict(ProfileClass="Profile32Bits", Type="Profile"),
+    "$CONSTANTS": dict(used=0x1000, unused=0x2000),
+    "$FUNCTIONS": dict(function=0x3000),
+    "$ENUMS": {"Color": {"0": "Red", "1": "Green"},
+               "Unused": {"0": "Off"}},
+    "$STRUCTS": {
+        "Outer": [16, {
+            "Inner": [0, ["Inner"]],
+            "Next": [8, ["Pointer", dict(target="Linked")]],
+            "Ignored": [12, ["Unrelated"]],
+            }],
+        "Inner": [8, {
+            "Color": [0, ["Enumeration", dict(enum_name="Color",
+                                              target="unsigned int")]],
+            "Value": [4, ["unsigned int"]],
+            }],
+        "Linked": [4, {"Value": [0, ["unsigned int"]]}],
+        "Unrelated": [4, {"Value": [0, ["unsigned int"]]}],
+        },
+    }
+
+
+class MinimizeProfileTest(testlib.RekallBaseUnitTestCase):
+    """Test the minimized profile builder."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.session = session.Session()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def LogAccesses(self, profile_data):
+        """Access some of the profile while logging it."""
+        profile = obj.Profile.LoadProfileFromData(
+            profile_data, session=self.session, name="test")
+        profile.add_classes(Enumeration=basic.Enumeration)
+        buf = addrspace.BufferAddressSpace(
+            session=self.session, data="\x01" + "\x00" * 15)
+
+        # The log reads DEBUG_PROFILE once at import time.
+        obj.ACCESS_LOG.active = True
+        try:
+            outer = profile.Outer(vm=buf)
+            result = (str(outer.Inner.Color), int(outer.Next),
+                      profile.get_constant("used"))
+        finally:
+            obj.ACCESS_LOG.active = False
+
+        return result, obj.ACCESS_LOG.data.pop("test")
+
+    def testMinimize(self):
+        expected, accesses = self.LogAccesses(PROFILE)
+        self.assertEqual(expected, ("Green", 0, 0x1000))
+
+        filename = os.path.join(self.temp_dir, "access.json")
+        with open(filename, "wb") as fd:
+            json.dump(dict(test=accesses), fd,
+                      cls=obj.ProfileLog.JSONEncoder)
+
+        plugin = profile_tool.MinimizeProfile(
+            session=self.session, profile="test", access_logs=[filename],
+            out_file=os.path.join(self.temp_dir, "out"))
+        minimized = plugin.Minimize(PROFILE, plugin._GetAccesses())
+
+        self.assertEqual(minimized["$CONSTANTS"], dict(used=0x1000))
+        self.assertEqual(minimized["$FUNCTIONS"], {})
+        self.assertEqual(minimized["$ENUMS"].keys(), ["Color"])
+
+        # The pointer target is kept even though it was not dereferenced.
+        self.assertEqual(sorted(minimized["$STRUCTS"]),
+                         ["Inner", "Linked", "Outer"])
+        self.assertEqual(sorted(minimized["$STRUCTS"]["Outer"][1]),
+                         ["Inner", "Next"])
+        self.assertEqual(minimized["$STRUCTS"]["Linked"], [4, {}])
+
+        # The minimized profile works the same for the logged accesses.
+        self.assertEqual(self.LogAccesses(minimized)[0], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
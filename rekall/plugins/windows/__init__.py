@@ -29,6 +29,7 @@ from rekall.plugins.windows import network
 from rekall.plugins.windows import pagefile
 from rekall.plugins.windows import pas2kas
 from rekall.plugins.windows import pfn
+from rekall.plugins.windows import poolscan
 from rekall.plugins.windows import procdump
 from rekall.plugins.windows import procinfo
 from rekall.plugins.windows import pstree
@@ -37,3 +38,9 @@ from rekall.plugins.windows import registry
 from rekall.plugins.windows import ssdt
 from rekall.plugins.windows import taskmods
 from rekall.plugins.windows import vadinfo
+
+# The accelerated address spaces require the native support module.
+try:
+    from rekall.plugins.windows import accelerated
+except ImportError:
+    pass
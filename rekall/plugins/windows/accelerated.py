@@ -0,0 +1,51 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+"""Accelerated versions of the Windows address spaces.
+
+See rekall.plugins.addrspaces.accelerated.
+"""
+
+from rekall import support
+from rekall.plugins.addrspaces import accelerated
+from rekall.plugins.windows import pagefile
+
+
+class AcceleratedWindowsMixin(accelerated.AcceleratedTranslationMixin):
+    """Accelerates the Windows address spaces.
+
+    Valid pages are translated natively. Everything else (transition, prototype
+    and pagefile PTEs) is resolved by the Windows address space, which also
+    reads and enumerates the address space since it needs to consult the VADs.
+    """
+
+    def _vtop_unmapped(self, vaddr):
+        return super(accelerated.AcceleratedTranslationMixin, self).vtop(vaddr)
+
+
+class AcceleratedWindowsIA32PagedMemoryPae(
+        AcceleratedWindowsMixin, pagefile.WindowsIA32PagedMemoryPae):
+    """An accelerated WindowsIA32PagedMemoryPae."""
+
+    support_mode = support.MODE_PAE
+
+
+class AcceleratedWindowsAMD64PagedMemory(
+        AcceleratedWindowsMixin, pagefile.WindowsAMD64PagedMemory):
+    """An accelerated WindowsAMD64PagedMemory."""
+
+    support_mode = support.MODE_AMD64
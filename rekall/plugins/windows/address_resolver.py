@@ -40,6 +40,12 @@ config.DeclareOption(
     help="When autodetect_build_local is set to 'basic' we fetch these "
     "modules directly from the symbol server.")
 
+config.DeclareOption(
+    "autodetect_prefetch_profiles", default=False, type="Boolean",
+    group="Autodetection Overrides",
+    help="Fetch the profiles of all the kernel modules concurrently as soon "
+    "as the module list is known.")
+
 
 class KernelModule(object):
     def __init__(self, session):
@@ -76,6 +82,10 @@ class WindowsAddressResolver(address_resolver.AddressResolverMixin,
             except AttributeError:
                 self.modules = None
 
+            if (self.modules is not None and
+                    self.session.GetParameter("autodetect_prefetch_profiles")):
+                self.PrefetchProfiles()
+
         # In kernel context no need for vads.
         if (self.vad is None and hasattr(self.session.plugins, "vad") and
                 self.session.GetParameter("process_context")):
@@ -238,6 +248,40 @@ class WindowsAddressResolver(address_resolver.AddressResolverMixin,
         self.profiles[module_name] = result
         return result
 
+    def PrefetchProfiles(self, module_names=None):
+        """Fetch the profiles for many modules concurrently.
+
+        Looking up addresses in many modules otherwise loads each profile from
+        the repositories one at a time. This finds the GUIDs of the modules and
+        has the session fetch all their profiles at once, so that
+        LoadProfileForDll() finds them in the profile cache.
+
+        Args:
+          module_names: The normalized names of the modules. Defaults to all
+            the kernel modules.
+        """
+        self._EnsureInitialized()
+        if module_names is None:
+            module_names = self.modules_by_name.keys()
+
+        profile_names = []
+        for module_name in module_names:
+            module = self.modules_by_name.get(module_name)
+            if module is None or module_name in self.profiles:
+                continue
+
+            pe_helper = pe_vtypes.PE(
+                address_space=self.session.GetParameter(
+                    "default_address_space"),
+                image_base=module.base,
+                session=self.session)
+
+            guid_age = pe_helper.RSDS.GUID_AGE
+            if guid_age:
+                profile_names.append("%s/GUID/%s" % (module_name, guid_age))
+
+        self.session.PrefetchProfiles(profile_names)
+
     def _build_local_profile(self, module_name, profile_name):
         """Fetch a build a local profile from the symbol server."""
         mode = self.session.GetParameter("autodetect_build_local")
@@ -357,9 +401,7 @@ class WindowsAddressResolver(address_resolver.AddressResolverMixin,
         else:
             return "%s!+%#x" % (profile.name, address - profile.image_base)
 
-    def format_address(self, address, max_distance=0x1000):
-        address = obj.Pointer.integer_to_address(address)
-
+    def _format_address(self, address, max_distance=0x1000):
         # Try to locate the symbol below it.
         offset, name = self.get_nearest_constant_by_address(address)
         difference = address - offset
@@ -583,11 +625,9 @@ class PEAddressResolver(address_resolver.AddressResolverMixin,
 
         self._initialized = True
 
-    def format_address(self, address, max_distance=0x1000):
+    def _format_address(self, address, max_distance=0x1000):
         self._EnsureInitialized()
 
-        address = obj.Pointer.integer_to_address(address)
-
         # Try to locate the symbol below it.
         offset, name = self.get_nearest_constant_by_address(address)
         difference = address - offset
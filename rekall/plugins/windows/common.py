@@ -26,7 +26,6 @@
 
 import re
 
-from rekall import addrspace
 from rekall import scan
 from rekall import obj
 from rekall import kb
@@ -180,8 +179,7 @@ class WinFindDTB(AbstractWindowsCommandPlugin, core.FindDTB):
         else:
             return super(WinFindDTB, self).GetAddressSpaceImplementation()
 
-        as_class = addrspace.BaseAddressSpace.classes[impl]
-        return as_class
+        return self.GetAddressSpaceClass(impl)
 
     def render(self, renderer):
         renderer.table_header(
@@ -213,6 +211,9 @@ class PoolTagCheck(scan.StringCheck):
         return super(PoolTagCheck, self).skip(
             buffer_as, offset + self.tag_offset)
 
+    def get_needles(self):
+        return [(self.needle, self.tag_offset)]
+
     def check(self, buffer_as, offset):
         return super(PoolTagCheck, self).check(
             buffer_as, offset + self.tag_offset)
@@ -234,6 +235,9 @@ class MultiPoolTagCheck(scan.MultiStringFinderCheck):
         return super(MultiPoolTagCheck, self).skip(
             buffer_as, offset + self.tag_offset)
 
+    def get_needles(self):
+        return [(needle, self.tag_offset) for needle in self.needles]
+
     def check(self, buffer_as, offset):
         return super(MultiPoolTagCheck, self).check(
             buffer_as, offset + self.tag_offset)
@@ -294,11 +298,25 @@ class PoolScanner(scan.BaseScanner):
 
     def scan(self, offset=0, maxlen=None):
         """Yields instances of _POOL_HEADER which potentially match."""
+        hits = None
+        if offset == 0 and maxlen is None:
+            hits = self.get_cached_hits()
 
-        maxlen = maxlen or self.profile.get_constant("MaxPointer")
-        for hit in super(PoolScanner, self).scan(offset=offset, maxlen=maxlen):
+        if hits is None:
+            maxlen = maxlen or self.profile.get_constant("MaxPointer")
+            hits = super(PoolScanner, self).scan(offset=offset, maxlen=maxlen)
+
+        for hit in hits:
             yield self.profile._POOL_HEADER(vm=self.address_space, offset=hit)
 
+    def get_cached_hits(self):
+        """Returns the hits of a full scan cached by poolscan_all or None."""
+        if self.address_space is not self.session.physical_address_space:
+            return
+
+        pool_scan_hits = self.session.GetParameter("pool_scan_hits") or {}
+        return pool_scan_hits.get(self.__class__.__name__)
+
 
 class PoolScannerPlugin(plugin.KernelASMixin, AbstractWindowsCommandPlugin):
     """A base class for all pool scanner plugins."""
@@ -534,9 +552,15 @@ class WinProcessFilter(WindowsCommandPlugin):
                 for proc in self.session.GetParameter("pslist_%s" % method):
                     seen.add(proc)
 
+        procs = [self.profile._EPROCESS(x) for x in seen]
+
+        # On a memory image each process is read once and its members decoded
+        # from that buffer. Live memory may change, so read it as needed.
+        if not self.kernel_address_space.volatile:
+            procs = [x.Snapshot() for x in procs]
+
         # Sort by pid so that the output ordering remains stable.
-        return sorted([self.profile._EPROCESS(x) for x in seen],
-                      key=lambda x: x.pid)
+        return sorted(procs, key=lambda x: x.pid)
 
     # Maintain the order of methods.
     METHODS = [
@@ -30,6 +30,9 @@ class Handles(common.WinProcessFilter):
 
     __name = "handles"
 
+    # The maximum number of object names to cache.
+    NAME_CACHE_SIZE = 100000
+
     @classmethod
     def args(cls, parser):
         """Declare the command line args we need."""
@@ -55,11 +58,69 @@ class Handles(common.WinProcessFilter):
 
         super(Handles, self).__init__(*args, **kwargs)
 
+    def _GetCache(self, name):
+        """Returns a cache which is kept in the session across processes."""
+        cache = self.session.GetParameter(name, None)
+        if cache is None:
+            cache = utils.FastStore(max_size=self.NAME_CACHE_SIZE)
+            self.session.SetCache(name, cache)
+
+        return cache
+
+    def _GetObjectType(self, handle, type_cache):
+        # Windows 7 and later store an index into the object type table while
+        # older versions store a pointer to the _OBJECT_TYPE.
+        type_pointer = handle.m("Type")
+        if type_pointer == None:
+            key = int(handle.TypeIndex)
+        else:
+            key = type_pointer.v()
+
+        try:
+            return type_cache.Get(key)
+        except KeyError:
+            object_type = handle.get_object_type(self.kernel_address_space)
+            type_cache.Put(key, object_type)
+            return object_type
+
+    def _GetObjectName(self, handle, object_type):
+        if object_type == "File":
+            file_obj = handle.dereference_as("_FILE_OBJECT")
+            return file_obj.file_name_with_device()
+
+        elif object_type == "Key":
+            key_obj = handle.dereference_as("_CM_KEY_BODY")
+            return key_obj.full_key_name()
+
+        elif object_type == "Process":
+            proc_obj = handle.dereference_as("_EPROCESS")
+            return u"{0}({1})".format(
+                utils.SmartUnicode(proc_obj.ImageFileName),
+                proc_obj.UniqueProcessId)
+
+        elif object_type == "Thread":
+            thrd_obj = handle.dereference_as("_ETHREAD")
+            return u"TID {0} PID {1}".format(
+                thrd_obj.Cid.UniqueThread,
+                thrd_obj.Cid.UniqueProcess)
+
+        elif handle.NameInfo.Name == None:
+            return ""
+
+        return handle.NameInfo.Name
+
     def enumerate_handles(self, task):
+        """Yields (handle, object_type, name) for the task's handles.
+
+        Objects are often shared between many processes so their types and
+        names are cached in the session.
+        """
+        type_cache = self._GetCache("handle_object_types")
+        name_cache = self._GetCache("handle_object_names")
+
         if task.ObjectTable.HandleTableList:
             for handle in task.ObjectTable.handles():
-                name = ""
-                object_type = handle.get_object_type(self.kernel_address_space)
+                object_type = self._GetObjectType(handle, type_cache)
 
                 if object_type == None:
                     continue
@@ -67,43 +128,20 @@ class Handles(common.WinProcessFilter):
                 if self.object_list and object_type not in self.object_list:
                     continue
 
-                elif object_type == "File":
-                    file_obj = handle.dereference_as("_FILE_OBJECT")
-                    name = file_obj.file_name_with_device()
-                elif object_type == "Key":
-                    key_obj = handle.dereference_as("_CM_KEY_BODY")
-                    name = key_obj.full_key_name()
-                elif object_type == "Process":
-                    proc_obj = handle.dereference_as("_EPROCESS")
-                    name = u"{0}({1})".format(
-                        utils.SmartUnicode(proc_obj.ImageFileName),
-                        proc_obj.UniqueProcessId)
-
-                elif object_type == "Thread":
-                    thrd_obj = handle.dereference_as("_ETHREAD")
-                    name = u"TID {0} PID {1}".format(
-                        thrd_obj.Cid.UniqueThread,
-                        thrd_obj.Cid.UniqueProcess)
-
-                elif handle.NameInfo.Name == None:
-                    name = ""
-                else:
-                    name = handle.NameInfo.Name
+                key = (object_type, handle.Body.obj_offset)
+                try:
+                    name = name_cache.Get(key)
+                except KeyError:
+                    name = self._GetObjectName(handle, object_type)
+                    name_cache.Put(key, name)
 
                 if not name and self.named_only:
                     continue
 
                 yield handle, object_type, name
 
-    def render(self, renderer):
-        renderer.table_header([("_OBJECT_HEADER", "offset_v", "[addrpad]"),
-                               dict(name="_EPROCESS", type="_EPROCESS"),
-                               ("Handle", "handle", "[addr]"),
-                               ("Access", "access", "[addr]"),
-                               ("Type", "obj_type", "16"),
-                               ("Details", "details", "")
-                              ])
-
+    def handles(self):
+        """Yields (task, handle, object_type, name) for all the processes."""
         for task in self.filter_processes():
             for count, (handle, object_type, name) in enumerate(
                     self.enumerate_handles(task)):
@@ -115,12 +153,24 @@ class Handles(common.WinProcessFilter):
                     if len(utils.SmartUnicode(name).replace("'", "")) == 0:
                         continue
 
-                renderer.table_row(
-                    handle,
-                    task,
-                    handle.HandleValue,
-                    handle.GrantedAccess,
-                    object_type, name)
+                yield task, handle, object_type, name
+
+    def render(self, renderer):
+        renderer.table_header([("_OBJECT_HEADER", "offset_v", "[addrpad]"),
+                               dict(name="_EPROCESS", type="_EPROCESS"),
+                               ("Handle", "handle", "[addr]"),
+                               ("Access", "access", "[addr]"),
+                               ("Type", "obj_type", "16"),
+                               ("Details", "details", "")
+                              ])
+
+        for task, handle, object_type, name in self.handles():
+            renderer.table_row(
+                handle,
+                task,
+                handle.HandleValue,
+                handle.GrantedAccess,
+                object_type, name)
 
 
 class TestHandles(testlib.SimpleTestCase):
@@ -0,0 +1,219 @@
+# Rekall Memory Forensics
+#
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+"""Tests for the handle table walker and the handles plugin."""
+import struct
+import unittest
+
+from rekall import addrspace
+from rekall import obj
+from rekall import session
+from rekall import testlib
+from rekall.plugins.overlays import basic
+from rekall.plugins.overlays.windows import common
+from rekall.plugins.windows import handles
+
+
+HANDLE_TABLE_VTYPES = {
+    "_HANDLE_TABLE": [0x10, {
+        "TableCode": [0, ["unsigned long long"]],
+        "HandleTableList": [8, ["unsigned long long"]],
+        }],
+    "_HANDLE_TABLE_ENTRY": [0x10, {
+        "Object": [0, ["Pointer", dict(target="_OBJECT_HEADER")]],
+        "GrantedAccess": [8, ["unsigned int"]],
+        }],
+    "_OBJECT_TYPE": [0x10, {
+        "Name": [0, ["String", dict(length=8)]],
+        }],
+    }
+
+# Windows 10 stores an obfuscated index into the object type table.
+WIN10_OBJECT_HEADER = {
+    "_OBJECT_HEADER": [0x30, {
+        "TypeIndex": [0x18, ["unsigned char"]],
+        "Body": [0x30, ["unsigned int"]],
+        }],
+    }
+
+# Windows XP stores a pointer to the _OBJECT_TYPE.
+XP_OBJECT_HEADER = {
+    "_OBJECT_HEADER": [0x30, {
+        "Type": [8, ["Pointer", dict(target="_OBJECT_TYPE")]],
+        "Body": [0x30, ["unsigned int"]],
+        }],
+    }
+
+
+class Win10ObjectHeader(obj.Struct):
+    """An object header with an obfuscated type index."""
+
+    COOKIE = 0x5A
+    TYPES = {5: "File", 7: "Key"}
+
+    @classmethod
+    def Obfuscate(cls, offset, type_index):
+        return type_index ^ ((offset >> 8) & 0xFF) ^ cls.COOKIE
+
+    @property
+    def TypeIndex(self):
+        return self.Obfuscate(self.obj_offset, int(self.m("TypeIndex")))
+
+    def get_object_type(self, vm=None):
+        _ = vm
+        return self.TYPES[self.TypeIndex]
+
+
+class XPObjectHeader(obj.Struct):
+    """An object header pointing at its _OBJECT_TYPE."""
+
+    def get_object_type(self, vm=None):
+        return self.obj_profile._OBJECT_TYPE(
+            vm=vm or self.obj_vm, offset=self.Type).Name.v().rstrip("\x00")
+
+
+class Task(object):
+    """Stands in for the _EPROCESS owning a handle table."""
+
+    def __init__(self, object_table):
+        self.ObjectTable = object_table
+
+
+class HandleTableTest(testlib.RekallBaseUnitTestCase):
+    """Test walking one and two level handle tables."""
+
+    # The object headers: offset: (type index, type object).
+    HEADERS = {
+        0x8000: (5, 0x9000),
+        0x8100: (5, 0x9000),
+        0x8200: (7, 0x9100),
+        }
+
+    def setUp(self):
+        self.session = session.Session()
+        self.data = bytearray(0x10000)
+
+        # A one level table. Empty entries point at the zeroed first page.
+        self.WriteTable(0x100, 0x1000)
+        self.WriteEntry(0x1000, 1, 0x8000, 0x1F)
+        self.WriteEntry(0x1000, 3, 0x8100, 0x2F)
+
+        # A two level table sharing an object with the first table.
+        self.WriteTable(0x200, 0x2000 | 1)
+        struct.pack_into("<QQ", self.data, 0x2000, 0x3000, 0x4000)
+        self.WriteEntry(0x3000, 2, 0x8000, 0x3F)
+        self.WriteEntry(0x4000, 2, 0x8200, 0x4F)
+
+        struct.pack_into("8s", self.data, 0x9000, "File")
+        struct.pack_into("8s", self.data, 0x9100, "Key")
+
+    def WriteTable(self, offset, table_code):
+        struct.pack_into("<QQ", self.data, offset, table_code, 1)
+
+    def WriteEntry(self, table, index, header, access):
+        struct.pack_into("<QI", self.data, table + index * 0x10, header, access)
+
+    def LoadProfile(self, header_vtypes, header_class):
+        for offset, (type_index, type_object) in self.HEADERS.iteritems():
+            if header_class is Win10ObjectHeader:
+                self.data[offset + 0x18] = Win10ObjectHeader.Obfuscate(
+                    offset, type_index)
+            else:
+                struct.pack_into("<Q", self.data, offset + 8, type_object)
+
+        self.address_space = addrspace.BufferAddressSpace(
+            session=self.session, data=str(self.data))
+
+        profile = basic.ProfileLLP64(session=self.session)
+        profile.add_types(HANDLE_TABLE_VTYPES)
+        profile.add_types(header_vtypes)
+        profile.add_classes(String=basic.String,
+                            _HANDLE_TABLE=common._HANDLE_TABLE,
+                            _OBJECT_HEADER=header_class)
+
+        return [profile._HANDLE_TABLE(offset=offset, vm=self.address_space)
+                for offset in (0x100, 0x200)]
+
+    def MakePlugin(self):
+        plugin = handles.Handles.__new__(handles.Handles)
+        plugin.session = self.session
+        plugin.kernel_address_space = self.address_space
+        plugin.object_list = None
+        plugin.named_only = False
+
+        # Record the name lookups instead of parsing the objects.
+        plugin.name_lookups = []
+        def _GetObjectName(handle, object_type):
+            plugin.name_lookups.append(handle.obj_offset)
+            return u"%s@%#x" % (object_type, handle.obj_offset)
+
+        plugin._GetObjectName = _GetObjectName
+
+        return plugin
+
+    def CheckHandles(self, tables):
+        self.assertEqual(
+            [[(handle.obj_offset, handle.HandleValue,
+               int(handle.obj_parent.GrantedAccess), handle.obj_vm)
+              for handle in table.handles()] for table in tables],
+            [[(0x8000, 4, 0x1F, self.address_space),
+              (0x8100, 12, 0x2F, self.address_space)],
+             [(0x8000, 8, 0x3F, self.address_space),
+              (0x8200, (0x100 + 2) * 4, 0x4F, self.address_space)]])
+
+    def CheckCaches(self, tables, type_keys):
+        plugin = self.MakePlugin()
+        results = [[(handle.obj_offset, object_type, name)
+                    for handle, object_type, name in plugin.enumerate_handles(
+                        Task(table))] for table in tables]
+
+        self.assertEqual(results, [
+            [(0x8000, "File", "File@0x8000"), (0x8100, "File", "File@0x8100")],
+            [(0x8000, "File", "File@0x8000"), (0x8200, "Key", "Key@0x8200")]])
+
+        # Each object type is only looked up once.
+        type_cache = plugin._GetCache("handle_object_types")
+        self.assertEqual(type_cache.misses, 2)
+        for key in type_keys:
+            self.assertTrue(key in type_cache)
+
+        # Objects shared between processes are only named once.
+        name_cache = plugin._GetCache("handle_object_names")
+        self.assertEqual(plugin.name_lookups, [0x8000, 0x8100, 0x8200])
+        self.assertEqual(name_cache.misses, 3)
+        for key in (("File", 0x8030), ("File", 0x8130), ("Key", 0x8230)):
+            self.assertTrue(key in name_cache)
+
+    def testWin10Handles(self):
+        tables = self.LoadProfile(WIN10_OBJECT_HEADER, Win10ObjectHeader)
+        self.CheckHandles(tables)
+
+        # The cache is keyed by the decoded type index.
+        self.CheckCaches(tables, [5, 7])
+
+    def testXPHandles(self):
+        tables = self.LoadProfile(XP_OBJECT_HEADER, XPObjectHeader)
+        self.CheckHandles(tables)
+
+        # The cache is keyed by the address of the _OBJECT_TYPE.
+        self.CheckCaches(tables, [0x9000, 0x9100])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -95,6 +95,7 @@ class Malfind(core.DirectoryDumperMixin, common.WinProcessFilter):
 
     def render(self, renderer):
         cc = self.session.plugins.cc()
+        vad_plugin = self.session.plugins.vad()
         for task in self.filter_processes():
             task_as = task.get_process_address_space()
             if not task_as:
@@ -102,7 +103,9 @@ class Malfind(core.DirectoryDumperMixin, common.WinProcessFilter):
 
             with cc:
                 cc.SwitchProcessContext(task)
-                for vad in task.RealVadRoot.traverse():
+
+                # Use the VAD index shared with the process address space.
+                for _, _, _, vad in vad_plugin.GetVadsForProcess(task) or []:
                     self.session.report_progress("Checking %r of pid %s",
                                                  vad, task.UniqueProcessId)
 
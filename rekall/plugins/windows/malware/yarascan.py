@@ -107,7 +107,7 @@ class WinYaraScan(common.WinProcessFilter):
         scanner = yarascanner.BaseYaraASScanner(
             profile=self.profile, session=self.session,
             address_space=address_space,
-            rules=self.rules)
+            rules=self.rules, rules_source=self.rules_source)
 
         return scanner.scan()
 
@@ -153,7 +153,8 @@ class WinYaraScan(common.WinProcessFilter):
         task_as = task.get_process_address_space()
 
         scanner = VadYaraScanner(
-            session=self.session, rules=self.rules, task=task)
+            session=self.session, rules=self.rules,
+            rules_source=self.rules_source, task=task)
 
         for rule, address, _, _ in scanner.scan():
             renderer.format("Rule: {0}\n", rule)
@@ -59,6 +59,9 @@ class Modules(common.WindowsCommandPlugin):
         self.address_space = load_as.ResolveAddressSpace(address_space)
         self.modlist = []
 
+        # The end addresses of the modules in modlist (same order).
+        self.modends = []
+
     def lsmod(self):
         """ A Generator for modules (uses _KPCR symbols) """
         if not self.mod_lookup:
@@ -85,6 +88,8 @@ class Modules(common.WindowsCommandPlugin):
             self.mod_lookup[l.DllBase.v()] = l
 
         self.modlist = sorted(self.mod_lookup.keys())
+        self.modends = [base + self.mod_lookup[base].SizeOfImage.v()
+                        for base in self.modlist]
 
     def find_module(self, addr):
         """Uses binary search to find what module a given address resides in.
@@ -99,11 +104,9 @@ class Modules(common.WindowsCommandPlugin):
         pos = bisect.bisect_right(self.modlist, addr) - 1
         if pos == -1:
             return obj.NoneObject("Unknown")
-        mod = self.mod_lookup[self.modlist[pos]]
-
-        if (addr >= mod.DllBase.v() and
-                addr < mod.DllBase.v() + mod.SizeOfImage.v()):
-            return mod
+        # Avoid reading the module from the image for each lookup.
+        if addr < self.modends[pos]:
+            return self.mod_lookup[self.modlist[pos]]
 
         return obj.NoneObject("Unknown")
 
@@ -30,6 +30,7 @@ metadata.
 """
 
 __author__ = "Michael Cohen <scudette@google.com>"
+import collections
 import struct
 
 from rekall import obj
@@ -49,6 +50,12 @@ class WindowsPagedMemoryMixin(object):
     # On windows translation pages are also valid.
     valid_mask = 1 << 11 | 1
 
+    # Set to a collections.Counter() to count the pages of each PTE type seen
+    # by get_available_addresses(). Only pages at or below page_class_end are
+    # counted.
+    page_class_counts = None
+    page_class_end = None
+
     def __init__(self, **kwargs):
         super(WindowsPagedMemoryMixin, self).__init__(**kwargs)
 
@@ -59,6 +66,9 @@ class WindowsPagedMemoryMixin(object):
         self._resolve_vads = True
         self._vad = None
 
+        # Pages of prototype PTEs read from the VADs.
+        self._prototype_pages = utils.FastStore(max_size=1000)
+
         # We cache these bitfields in order to speed up mask calculations. We
         # derive them initially from the profile so we do not need to hardcode
         # any bit positions.
@@ -70,6 +80,7 @@ class WindowsPagedMemoryMixin(object):
         self.proto_protoaddress_mask = pte.u.Proto.ProtoAddress.mask
         self.proto_protoaddress_start = pte.u.Proto.ProtoAddress.start_bit
         self.soft_pagefilehigh_mask = pte.u.Soft.PageFileHigh.mask
+        self.soft_pagefilehigh_start = pte.u.Soft.PageFileHigh.start_bit
 
         # Combined masks for faster checking.
         self.proto_transition_mask = self.prototype_mask | self.transition_mask
@@ -78,9 +89,14 @@ class WindowsPagedMemoryMixin(object):
         self.transition_valid_mask = self.transition_mask | self.valid_mask
         self.task = None
 
+        if pte.obj_size == 8:
+            self.prototype_pte_format = "<Q"
+        else:
+            self.prototype_pte_format = "<I"
+
     @property
     def vad(self):
-        """Returns a cached RangedCollection() of vad ranges."""
+        """Returns a cached IntervalIndex() of vad ranges."""
 
         # If this dtb is the same as the kernel dtb - there are no vads.
         if self.dtb == self.session.GetParameter("dtb"):
@@ -108,27 +124,44 @@ class WindowsPagedMemoryMixin(object):
                 # for some of the address transition.
                 self.task = self.session.GetParameter("dtb2task").get(self.dtb)
 
-            self._vad = utils.RangedCollection()
-            for x in self.session.plugins.vad().GetVadsForProcess(
-                    self.session.profile._EPROCESS(self.task)):
-                self._vad.insert(x[0], x[1], (x[0], x[1], x[3]))
+            # The vad plugin shares the index with the rest of the session.
+            # It is None while the index is being built.
+            vads = self.session.plugins.vad().GetVadsForProcess(
+                self.session.profile._EPROCESS(self.task))
+            if vads is None:
+                return obj.NoneObject("vads not available right now")
 
+            self._vad = vads
             return self._vad
         finally:
             self._resolve_vads = True
 
+    def _ReadPrototypePTE(self, mmvad, pte_address):
+        """Reads the prototype PTE a page at a time from the kernel."""
+        page = pte_address & ~0xFFF
+        try:
+            data = self._prototype_pages.Get(page)
+        except KeyError:
+            data = mmvad.obj_vm.read(page, 0x1000)
+            self._prototype_pages.Put(page, data)
+
+        return struct.unpack_from(
+            self.prototype_pte_format, data, pte_address & 0xFFF)[0]
+
     def _ConsultVad(self, virtual_address, pte_value):
         if self.vad:
             vad_hit = self.vad.get_range(virtual_address)
             if vad_hit:
-                start, _, mmvad = vad_hit
+                start, _, _, mmvad = vad_hit
 
                 # If the MMVAD has PTEs resolve those..
                 if "FirstPrototypePte" in mmvad.members:
-                    pte = mmvad.FirstPrototypePte[
-                        (virtual_address - start) >> 12]
+                    pte_address = (
+                        mmvad.m("FirstPrototypePte").v() +
+                        ((virtual_address - start) >> 12) *
+                        struct.calcsize(self.prototype_pte_format))
 
-                    return "Vad", pte.u.Long.v() or 0
+                    return "Vad", self._ReadPrototypePTE(mmvad, pte_address)
 
         # Virtual address does not exist in any VAD region.
         return "Demand Zero", pte_value
@@ -213,25 +246,25 @@ class WindowsPagedMemoryMixin(object):
 
         # Regular _MMPTE_SOFTWARE entry - return physical offset into pagefile.
         if self.pagefile_mapping is not None:
-            pte = self.session.profile._MMPTE()
-            pte.u.Long = pte_value
-
-            return "Pagefile", (
-                pte.u.Soft.PageFileHigh * 0x1000 + self.pagefile_mapping +
-                (virtual_address & 0xFFF))
+            return "Pagefile", self._GetPagefileAddress(
+                pte_value, virtual_address)
 
         return "Pagefile", None
 
+    def _GetPagefileAddress(self, pte_value, virtual_address):
+        page_file_high = ((pte_value & self.soft_pagefilehigh_mask) >>
+                          self.soft_pagefilehigh_start)
+
+        return (page_file_high * 0x1000 + self.pagefile_mapping +
+                (virtual_address & 0xFFF))
+
     def _get_available_PDEs(self, vaddr, pdpte_value, start):
         tmp2 = vaddr
-        for pde in range(0, 0x200):
+        pd_table = self._read_table(pdpte_value & 0xffffffffff000)
+        for pde in xrange(self._get_first_index(tmp2, start, 21), 0x200):
             vaddr = tmp2 | (pde << 21)
 
-            next_vaddr = tmp2 | ((pde + 1) << 21)
-            if start >= next_vaddr:
-                continue
-
-            pde_value = self.get_pde(vaddr, pdpte_value)
+            pde_value = pd_table[pde]
             if not pde_value & self.valid_mask:
                 # An invalid PDE means we read the vad, i.e. it is the same as
                 # an array of zero PTEs.
@@ -242,65 +275,106 @@ class WindowsPagedMemoryMixin(object):
                 continue
 
             if self.page_size_flag(pde_value):
+                if (self.page_class_counts is not None and
+                        vaddr <= self.page_class_end):
+                    self.page_class_counts["Valid"] += min(
+                        0x200, ((self.page_class_end - vaddr) >> 12) + 1)
+
                 yield (vaddr,
                        self.get_two_meg_paddr(vaddr, pde_value),
                        0x200000)
                 continue
 
-            # This reads the entire PTE table at once - On
-            # windows where IO is extremely expensive, its
-            # about 10 times more efficient than reading it
-            # one value at the time - and this loop is HOT!
-            pte_table_addr = ((pde_value & 0xffffffffff000) |
-                              ((vaddr & 0x1ff000) >> 9))
-
-            data = self.base.read(pte_table_addr, 8 * 0x200)
-            pte_table = struct.unpack("<" + "Q" * 0x200, data)
-
+            pte_table = self._read_table(pde_value & 0xffffffffff000)
             for x in self._get_available_PTEs(
                     pte_table, vaddr, start=start):
                 yield x
 
-    def _get_available_PTEs(self, pte_table, vaddr, start=0):
-        """Scan the PTE table and yield address ranges which are valid."""
-        tmp = vaddr
-        if self.vad:
-            vads = sorted([(x[0], x[1]) for x in self.vad.collection],
-                          reverse=True)
-        else:
-            vads = []
+    def _ClassifyPTEs(self, pte_table, vaddr, start=0):
+        """Classifies a whole table of PTEs at once.
 
-        for i in xrange(0, len(pte_table)):
-            pfn = i << 12
-            pte_value = pte_table[i]
+        This is the same as calling get_phys_addr() on each PTE but the
+        prototype PTEs are read a page at a time rather than one by one.
 
-            vaddr = tmp | pfn
-            next_vaddr = tmp | (pfn + 0x1000)
-            if start >= next_vaddr:
+        Returns:
+          a list of (virtual address, description, physical address) for the
+          entries at or above start. The physical address is None if the page
+          is not available. Unmapped pages (zero PTEs outside the vads) are
+          skipped.
+        """
+        vads = self.vad
+        pte_size = struct.calcsize(self.prototype_pte_format)
+        entries = []
+        prototype_pages = {}
+        for i, pte_value in enumerate(pte_table):
+            virtual_address = vaddr | (i << 12)
+            if start >= virtual_address + 0x1000:
                 continue
 
-            # Remove all the vads that end below this address. This optimization
-            # allows us to skip DemandZero pages which occur outsize the VAD
-            # ranges.
-            if vads:
-                while vads and vads[-1][1] < vaddr:
-                    vads.pop(-1)
-
-                # Address is below the next available vad's start. We are not
-                # inside a vad range and a 0 PTE is unmapped.
-                if (pte_value == 0 and vads and
-                        vaddr < vads[-1][0]):
+            if pte_value & self.valid_mask:
+                desc = "Valid"
+
+            # Not a prototype but in transition.
+            elif (pte_value & self.proto_transition_mask ==
+                  self.transition_mask):
+                desc = "Transition"
+
+            # A prototype which refers to the vad.
+            elif (pte_value & self.prototype_mask and
+                  self.proto_protoaddress_mask & pte_value >>
+                  self.proto_protoaddress_start == 0xffffffff0000):
+                desc, pte_value = self._ConsultVad(virtual_address, pte_value)
+
+            # Regular prototype PTE - we read it below.
+            elif pte_value & self.prototype_mask:
+                desc = "Prototype"
+                pte_value >>= self.proto_protoaddress_start
+                prototype_pages[pte_value & ~0xFFF] = None
+
+            elif pte_value & self.soft_pagefilehigh_mask == 0:
+                # A zero PTE outside the vads is not mapped at all.
+                if pte_value == 0 and not (
+                        vads and vads.get_range(virtual_address)):
                     continue
 
-            elif pte_value == 0:
-                continue
+                desc, pte_value = self._ConsultVad(virtual_address, pte_value)
+
+            else:
+                desc = "Pagefile"
+
+            entries.append((virtual_address, desc, pte_value))
+
+        # The prototype PTEs are allocated from pool in the kernel's address
+        # space so they tend to be close together. We read a little more than
+        # a page in case a PTE straddles the page boundary.
+        for page in prototype_pages:
+            prototype_pages[page] = self.read(page, 0x1000 + pte_size)
+
+        result = []
+        for virtual_address, desc, pte_value in entries:
+            if desc == "Prototype":
+                pte_value = struct.unpack_from(
+                    self.prototype_pte_format,
+                    prototype_pages[pte_value & ~0xFFF],
+                    pte_value & 0xFFF)[0]
+
+            result.append((virtual_address, desc, self._ResolvePTE(
+                virtual_address, desc, pte_value)))
+
+        return result
 
-            phys_addr = self.get_phys_addr(vaddr, pte_value)
+    def _get_available_PTEs(self, pte_table, vaddr, start=0):
+        """Scan the PTE table and yield address ranges which are valid."""
+        for virtual_address, desc, phys_addr in self._ClassifyPTEs(
+                pte_table, vaddr, start=start):
+            if (self.page_class_counts is not None and
+                    virtual_address <= self.page_class_end):
+                self.page_class_counts[desc] += 1
 
             # Only yield valid physical addresses. This will skip DemandZero
             # pages and File mappings into the filesystem.
             if phys_addr is not None:
-                yield (vaddr, phys_addr, 0x1000)
+                yield (virtual_address, phys_addr, 0x1000)
 
     def get_phys_addr(self, virtual_address, pte_value):
         """First level resolution of PTEs.
@@ -309,7 +383,10 @@ class WindowsPagedMemoryMixin(object):
         PTEs which are prototype PTEs).
         """
         desc, pte_value = self.DeterminePTEType(pte_value, virtual_address)
+        return self._ResolvePTE(virtual_address, desc, pte_value)
 
+    def _ResolvePTE(self, virtual_address, desc, pte_value):
+        """Returns the physical address for a PTE classified as desc."""
         # Transition pages can be treated as Valid, let the hardware resolve
         # it.
         if desc == "Transition" or desc == "Valid":
@@ -324,11 +401,27 @@ class WindowsPagedMemoryMixin(object):
             return self.ResolveProtoPTE(pte_value, virtual_address)[1]
 
         elif desc == "Pagefile" and self.pagefile_mapping:
-            pte = self.session.profile._MMPTE()
-            pte.u.Long = pte_value
+            return self._GetPagefileAddress(pte_value, virtual_address)
+
+    def GetPageClassCounts(self, end=2**64):
+        """Counts the pages at or below end of each PTE type.
+
+        Returns:
+          a collections.Counter() of description to page count.
+        """
+        self.page_class_counts = collections.Counter()
+        self.page_class_end = end
+        try:
+            # The runs are coalesced so the tables are read a little past end.
+            # Pages above end are not counted.
+            for virtual_address, _, _ in self.get_available_addresses():
+                if virtual_address > end:
+                    break
 
-            return (pte.u.Soft.PageFileHigh * 0x1000 +
-                    self.pagefile_mapping + (virtual_address & 0xFFF))
+            return self.page_class_counts
+        finally:
+            self.page_class_counts = None
+            self.page_class_end = None
 
 
 class WindowsIA32PagedMemoryPae(WindowsPagedMemoryMixin,
@@ -367,7 +460,11 @@ class WindowsIA32PagedMemoryPae(WindowsPagedMemoryMixin,
             pte = self.get_pte(vaddr, pde)
             res = self.get_phys_addr(vaddr, pte)
 
-            self._tlb.Put(vaddr, res)
+            # The TLB is shared with other address spaces so we must not cache
+            # translations which failed because the vads were unavailable.
+            if self._resolve_vads:
+                self._tlb.Put(vaddr, res)
+
             return res
 
 
@@ -420,7 +517,11 @@ class WindowsAMD64PagedMemory(WindowsPagedMemoryMixin, amd64.AMD64PagedMemory):
             pte = self.get_pte(vaddr, pde)
             res = self.get_phys_addr(vaddr, pte)
 
-            self._tlb.Put(vaddr, res)
+            # The TLB is shared with other address spaces so we must not cache
+            # translations which failed because the vads were unavailable.
+            if self._resolve_vads:
+                self._tlb.Put(vaddr, res)
+
             return res
 
 
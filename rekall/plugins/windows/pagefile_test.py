@@ -0,0 +1,224 @@
+# Rekall Memory Forensics
+#
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+"""Tests for the windows paged address spaces."""
+import collections
+import struct
+import unittest
+
+from rekall import addrspace
+from rekall import session
+from rekall import testlib
+from rekall import utils
+from rekall.plugins.overlays import basic
+from rekall.plugins.windows import pagefile
+
+
+def _BitField(start_bit, end_bit):
+    return ["BitField", dict(start_bit=start_bit, end_bit=end_bit,
+                             native_type="unsigned long long")]
+
+
+# A cut down AMD64 _MMPTE.
+MMPTE_VTYPES = {
+    "_MMPTE": [8, {
+        "u": [0, ["_MMPTE_u"]],
+        }],
+    "_MMPTE_u": [8, {
+        "Hard": [0, ["_MMPTE_HARDWARE"]],
+        "Proto": [0, ["_MMPTE_PROTOTYPE"]],
+        "Trans": [0, ["_MMPTE_TRANSITION"]],
+        "Subsect": [0, ["_MMPTE_SUBSECTION"]],
+        "Soft": [0, ["_MMPTE_SOFTWARE"]],
+        }],
+    "_MMPTE_HARDWARE": [8, {"Valid": [0, _BitField(0, 1)]}],
+    "_MMPTE_PROTOTYPE": [8, {
+        "Prototype": [0, _BitField(10, 11)],
+        "ProtoAddress": [0, _BitField(16, 64)],
+        }],
+    "_MMPTE_TRANSITION": [8, {"Transition": [0, _BitField(11, 12)]}],
+    "_MMPTE_SUBSECTION": [8, {"Subsection": [0, _BitField(10, 11)]}],
+    "_MMPTE_SOFTWARE": [8, {"PageFileHigh": [0, _BitField(32, 64)]}],
+    "_MMVAD": [8, {
+        "FirstPrototypePte": [0, ["Pointer", dict(target="_MMPTE")]],
+        }],
+    }
+
+VALID = 1
+PROTOTYPE = 1 << 10
+TRANSITION = 1 << 11
+
+
+def _Prototype(address):
+    return address << 16 | PROTOTYPE
+
+
+def _Pagefile(page):
+    return page << 32 | 0x80
+
+
+class ClassifyPTEsTest(testlib.RekallBaseUnitTestCase):
+    """Test the bulk PTE classification against get_phys_addr()."""
+
+    DTB = 0x10000
+    PTE_TABLE = 0x13000
+    PAGEFILE = 0x80000000
+
+    # The virtual pages of the prototype PTEs.
+    PROTOTYPES = 0x100000
+    VAD_PROTOTYPES = 0x101000
+
+    # The vad covers virtual pages 0x10 to 0x1F.
+    VAD_START = 0x10000
+    VAD_END = 0x1FFFF
+
+    # Index into the PTE table: PTE value.
+    PTES = {
+        1: 0x30000 | VALID,
+        2: 0x31000 | TRANSITION,
+        3: _Prototype(PROTOTYPES + 8),
+        4: _Prototype(PROTOTYPES + 0x10),
+        # The last prototype PTE of the page.
+        5: _Prototype(PROTOTYPES + 0xFF8),
+        6: _Pagefile(7),
+        # A demand zero page outside the vad. Zero PTEs outside the vad are
+        # not mapped at all.
+        8: 0x80,
+        # A prototype which refers to the vad.
+        0x10: _Prototype(0xFFFFFFFF0000),
+        # The zero PTEs inside the vad are resolved from the vad.
+        0x20: _Pagefile(9),
+        0x100: 0x20000 | VALID,
+        0x101: 0x21000 | VALID,
+        }
+
+    # Virtual address: prototype PTE value.
+    PROTOTYPE_PTES = {
+        PROTOTYPES + 8: 0x32000 | VALID,
+        PROTOTYPES + 0x10: _Pagefile(5),
+        PROTOTYPES + 0xFF8: 0x35000 | TRANSITION,
+        VAD_PROTOTYPES: 0x33000 | VALID,
+        VAD_PROTOTYPES + 8: 0x34000 | TRANSITION,
+        }
+
+    # The virtual address of the _MMVAD.
+    MMVAD = VAD_PROTOTYPES + 0xF00
+
+    def setUp(self):
+        self.session = session.Session()
+        self.session.SetCache("dtb", 0x90000)
+
+        profile = basic.ProfileLLP64(session=self.session)
+        profile.add_types(MMPTE_VTYPES)
+        self.session.profile = profile
+
+        self.data = bytearray(0x100000)
+
+        # Map the first 2mb of the address space to our PTE table and the
+        # second 2mb with a large page.
+        struct.pack_into("<Q", self.data, self.DTB, 0x11000 | VALID)
+        struct.pack_into("<Q", self.data, 0x11000, 0x12000 | VALID)
+        struct.pack_into("<QQ", self.data, 0x12000, self.PTE_TABLE | VALID,
+                         0x400000 | 0x80 | VALID)
+
+        for index, pte_value in self.PTES.iteritems():
+            struct.pack_into("<Q", self.data, self.PTE_TABLE + index * 8,
+                             pte_value)
+
+        for address, pte_value in self.PROTOTYPE_PTES.iteritems():
+            struct.pack_into("<Q", self.data, self.PhysicalAddress(address),
+                             pte_value)
+
+        struct.pack_into("<Q", self.data, self.PhysicalAddress(self.MMVAD),
+                         self.VAD_PROTOTYPES)
+
+        self.address_space = pagefile.WindowsAMD64PagedMemory(
+            base=addrspace.BufferAddressSpace(
+                session=self.session, data=str(self.data)),
+            dtb=self.DTB, session=self.session)
+        self.address_space.pagefile_mapping = self.PAGEFILE
+
+        mmvad = profile._MMVAD(offset=self.MMVAD, vm=self.address_space)
+        self.address_space._vad = utils.IntervalIndex(
+            [(self.VAD_START, self.VAD_END, "", mmvad)])
+
+    def PhysicalAddress(self, virtual_address):
+        pte_value = self.PTES[virtual_address >> 12]
+        return (pte_value & ~0xFFF) | (virtual_address & 0xFFF)
+
+    def PTETable(self):
+        return [self.PTES.get(i, 0) for i in range(0x200)]
+
+    def testClassifyPTEs(self):
+        result = self.address_space._ClassifyPTEs(self.PTETable(), 0)
+
+        expected = []
+        for i, pte_value in enumerate(self.PTETable()):
+            virtual_address = i << 12
+            if pte_value == 0 and not (
+                    self.VAD_START <= virtual_address <= self.VAD_END):
+                continue
+
+            desc, _ = self.address_space.DeterminePTEType(
+                pte_value, virtual_address)
+            expected.append((virtual_address, desc,
+                             self.address_space.get_phys_addr(
+                                 virtual_address, pte_value)))
+
+        self.assertEqual(result, expected)
+        self.assertEqual(result[:12], [
+            (0x1000, "Valid", 0x30000),
+            (0x2000, "Transition", 0x31000),
+            (0x3000, "Prototype", 0x32000),
+            (0x4000, "Prototype", self.PAGEFILE + 0x5000),
+            (0x5000, "Prototype", 0x35000),
+            (0x6000, "Pagefile", self.PAGEFILE + 0x7000),
+            (0x8000, "Demand Zero", None),
+            (0x10000, "Vad", 0x33000),
+            (0x11000, "Vad", 0x34000),
+            (0x12000, "Vad", None),
+            (0x13000, "Vad", None),
+            (0x14000, "Vad", None)])
+
+        # Entries below start are skipped.
+        self.assertEqual(
+            self.address_space._ClassifyPTEs(self.PTETable(), 0, start=0x10000),
+            [x for x in expected if x[0] >= 0x10000])
+
+    def testPageClassCounts(self):
+        counts = collections.Counter(
+            desc for _, desc, _ in self.address_space._ClassifyPTEs(
+                self.PTETable(), 0))
+        counts["Valid"] += 0x200
+
+        self.assertEqual(self.address_space.GetPageClassCounts(), counts)
+
+        # Only the pages at or below end are counted.
+        self.assertEqual(
+            self.address_space.GetPageClassCounts(end=0x10FFF),
+            dict(Valid=1, Transition=1, Prototype=3, Pagefile=1,
+                 Vad=1, **{"Demand Zero": 1}))
+
+        counts = self.address_space.GetPageClassCounts(end=0x201000)
+        self.assertEqual(counts["Valid"], 3 + 2)
+        self.assertEqual(counts["Vad"], 0x10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -29,6 +29,65 @@ from rekall.plugins.windows import common
 class WinPas2Vas(pas2kas.Pas2VasMixin, common.WinProcessFilter):
     """Resolves a physical address to a virtual addrress in a process."""
 
+    def __init__(self, **kwargs):
+        super(WinPas2Vas, self).__init__(**kwargs)
+        self._ptov = None
+
+    def _PfnLookup(self, physical_address, tasks):
+        """Find the single owner of a private page from the PFN database.
+
+        Returns (virtual address, task or "Kernel") or None if the page may be
+        mapped more than once or the owner is not known.
+        """
+        if self._ptov is None:
+            self._ptov = self.session.plugins.ptov()
+
+        try:
+            if not self._ptov.pfn_plugin.pfn_index.is_private(
+                    physical_address):
+                return
+        except RuntimeError:
+            return
+
+        virtual_address, structures = self._ptov.ptov(physical_address)
+        if virtual_address == None:
+            return
+
+        if virtual_address > self.session.GetParameter(
+                "highest_usermode_address"):
+            # Kernel addresses are canonical on AMD64.
+            if virtual_address & (1 << 47):
+                virtual_address |= 0xFFFF000000000000
+
+            return virtual_address, "Kernel"
+
+        dtb_page = structures[0][1] >> 12
+        owners = [task for task in tasks
+                  if task.dtb != None and int(task.dtb) >> 12 == dtb_page]
+
+        if len(owners) == 1:
+            return virtual_address, owners[0]
+
+    def get_virtual_address(self, physical_address, tasks=None):
+        """Answer from the PFN database where possible.
+
+        Building the address maps of all the processes is slow. A page which
+        is mapped by a single hardware PTE (i.e. not through a prototype PTE)
+        belongs to one address space, which the PFN database tells us
+        directly.
+        """
+        if tasks is None:
+            tasks = list(self.filter_processes())
+
+        result = self._PfnLookup(physical_address, tasks)
+        if result:
+            yield result
+            return
+
+        for result in super(WinPas2Vas, self).get_virtual_address(
+                physical_address, tasks=tasks):
+            yield result
+
 
 class WinPas2VasResolver(pas2kas.Pas2VasResolver):
     def GetTaskStruct(self, address):
@@ -26,10 +26,17 @@
 
 # pylint: disable=protected-access
 
+import array
+import struct
+
 from rekall import testlib
 from rekall import obj
 from rekall import plugin
+from rekall import scan
+from rekall import utils
 from rekall.plugins import core
+from rekall.plugins.addrspaces import amd64
+from rekall.plugins.addrspaces import intel
 from rekall.plugins.windows import common
 from rekall.plugins.overlays import basic
 
@@ -88,6 +95,149 @@ class PFNModification(obj.ProfileModification):
             })
 
 
+class PFNDatabase(object):
+    """A columnar copy of the PFN database.
+
+    Resolving a physical address to a virtual address needs several PFN records
+    and instantiating each _MMPFN struct is slow. This reads the database in
+    large blocks and decodes only the fields needed for address translation
+    into compact arrays, indexed by PFN.
+    """
+
+    # The number of records read and decoded at once.
+    BLOCK_RECORDS = 0x1000
+
+    # The PageLocation of pages which are mapped by a valid PTE.
+    ACTIVE_AND_VALID = 6
+
+    # The _MMPFN fields we keep, by their paths in the struct.
+    FIELDS = [("PteFrame", "u4.PteFrame"),
+              ("PteAddress", "PteAddress"),
+              ("PageLocation", "u3.e1.PageLocation"),
+              ("PrototypePte", "u3.e1.PrototypePte")]
+
+    def __init__(self, profile, address_space, offset):
+        """Constructor.
+
+        Args:
+          profile: The kernel profile.
+          address_space: The address space the PFN database is in.
+          offset: The address of the first _MMPFN record.
+        """
+        self.address_space = address_space
+        self.offset = offset
+
+        # (pte_frame, pte_offset, page_location, prototype) arrays per block.
+        self.blocks = {}
+
+        dummy = profile._get_dummy_obj("_MMPFN")
+        self.record_size = dummy.obj_size
+
+        # Bit fields are decoded from their storage with a mask and shift.
+        self.bits = {}
+        layout_fields = []
+        for name, path in self.FIELDS:
+            member = dummy.m(path)
+            if isinstance(member, obj.NoneObject):
+                raise RuntimeError("_MMPFN has no member %s." % path)
+
+            if isinstance(member, obj.BitField):
+                format_string = member._proxy.format_string
+                self.bits[name] = (
+                    (1 << member.end_bit) - 1, member.start_bit)
+
+            elif isinstance(member, obj.Pointer):
+                format_string = member._proxy.format_string
+
+            else:
+                format_string = member.format_string
+
+            layout_fields.append((name, member.obj_offset, format_string))
+
+        self.layout = obj.StructLayout("_MMPFN", self.record_size,
+                                       layout_fields)
+        if len(self.layout.fields) != len(self.FIELDS):
+            raise RuntimeError("Unable to decode the _MMPFN fields.")
+
+    def _GetColumn(self, records, name):
+        values = records[self.layout.field_index[name]]
+        if name in self.bits:
+            mask, shift = self.bits[name]
+            return [(x & mask) >> shift for x in values]
+
+        return values
+
+    def _LoadBlock(self, block):
+        data = self.address_space.read(
+            self.offset + block * self.BLOCK_RECORDS * self.record_size,
+            self.BLOCK_RECORDS * self.record_size)
+
+        # Transpose the records into a tuple of values for each field.
+        records = zip(*self.layout.unpack_array(data, self.BLOCK_RECORDS))
+        frame, address, location, prototype = [
+            self._GetColumn(records, name) for name, _ in self.FIELDS]
+
+        result = self.blocks[block] = (
+            array.array("L", frame),
+            array.array("H", [x & 0xFFF for x in address]),
+            array.array("B", location),
+            array.array("B", prototype))
+
+        return result
+
+    def __getitem__(self, pfn):
+        """Returns (PteFrame, PteAddress & 0xFFF, PageLocation, PrototypePte)."""
+        block, index = divmod(pfn, self.BLOCK_RECORDS)
+        columns = self.blocks.get(block) or self._LoadBlock(block)
+
+        return (columns[0][index], columns[1][index], columns[2][index],
+                columns[3][index])
+
+    def ptov(self, physical_address, levels):
+        """Converts the physical address to a virtual address.
+
+        The PTE which maps each page is found from its PFN record, and the page
+        table containing it in turn from the PFN record of the table.
+
+        Args:
+          physical_address: The physical address to convert.
+
+          levels: A list of (name, shift, mask, error) for each paging level
+            from the PTE up. The address of the entry at each level, shifted
+            and masked, gives the bits of the virtual address it translates.
+
+        Returns:
+          A tuple of the virtual address (or a NoneObject) and a list of (name,
+          address) of the DTB and the paging entries.
+        """
+        result = physical_address & 0xFFF
+        structures = []
+        pfn = physical_address >> 12
+        for name, shift, mask, error in levels:
+            pte_frame, pte_offset, location, _ = self[pfn]
+            if location != self.ACTIVE_AND_VALID:
+                return obj.NoneObject(error), []
+
+            address = (pte_frame << 12) | pte_offset
+            result |= (address << shift) & mask
+            structures.insert(0, (name, address))
+            pfn = pte_frame
+
+        # The DTB is the page containing the top level table.
+        structures.insert(0, ("DTB", self[pfn][0] << 12))
+
+        return result, structures
+
+    def is_private(self, physical_address):
+        """Is the page mapped by a single hardware PTE?
+
+        Pages which are shared through prototype PTEs may be mapped into many
+        address spaces.
+        """
+        _, _, location, prototype = self[physical_address >> 12]
+        return location == self.ACTIVE_AND_VALID and not prototype
+
+
 class VtoP(core.VtoPMixin, common.WinProcessFilter):
     """Prints information about the virtual to physical translation."""
 
@@ -184,6 +334,17 @@ class PFNInfo(common.WindowsCommandPlugin):
 
         self.pfn = pfn
         self.physical_address = physical_address
+        self._pfn_index = None
+
+    @property
+    def pfn_index(self):
+        """A PFNDatabase for fast access to many records."""
+        if self._pfn_index is None:
+            pfn_array = self.pfn_database.deref()
+            self._pfn_index = PFNDatabase(
+                self.profile, pfn_array.obj_vm, pfn_array.obj_offset)
+
+        return self._pfn_index
 
     def pfn_record(self, pfn=None, physical_address=None):
         """Returns the pfn record for a pfn or a virtual address."""
@@ -474,6 +635,25 @@ class PtoV(common.WinProcessFilter):
         parser.add_argument("physical_address", type="IntParser",
                             help="The Virtual Address to examine.")
 
+    # The paging levels of each memory model, from the PTE up: (name, shift,
+    # mask, error). The address of the paging entry at each level, shifted and
+    # masked, gives the bits of the virtual address it translates.
+    I386_LEVELS = [
+        ("PTE", 10, 0x3FF000, "PTE invalid."),
+        ("PDE", 20, 0xffc00000, "PDE invalid (Is this a large page?)."),
+        ]
+
+    PAE_LEVELS = [
+        ("PTE", 9, 0x1FF000, "PTE invalid."),
+        ("PDE", 18, 0x3fe00000, "PDE invalid (Is this a large page?)."),
+        ("PDPTE", 27, 0x7FC0000000,
+         "PDPTE invalid (Is this a one gig page?)."),
+        ]
+
+    AMD64_LEVELS = PAE_LEVELS + [
+        ("PML4E", 36, 0xff8000000000, "PML4E invalid."),
+        ]
+
     def __init__(self, physical_address=None, **kwargs):
         """Converts a physical address to a virtual address."""
         super(PtoV, self).__init__(**kwargs)
@@ -482,191 +662,161 @@ class PtoV(common.WinProcessFilter):
         self.pfn_plugin = self.session.plugins.pfn(session=self.session)
         self.physical_address = physical_address
 
-    def _ptov_x86(self, physical_address):
-        """An implementation of ptov for x86."""
-        result = physical_address & 0xFFF
-
-        # Get the pte for this physical_address using the pfn database.
-        pfn_obj = self.pfn_plugin.pfn_record(physical_address >> self.PAGE_BITS)
-
-        if pfn_obj.Type != "ActiveAndValid":
-            return obj.NoneObject("PTE invalid."), []
-
-        containing_page = int(pfn_obj.u4.PteFrame)
-        pte_address = ((containing_page << self.PAGE_BITS) |
-                       (int(pfn_obj.PteAddress) & 0xFFF))
-
-        result |= (pte_address << 10) & 0x3FF000
-
-        # Get the PDE now:
-        pfn_obj = self.pfn_plugin.pfn_record(containing_page)
-
-        if pfn_obj.Type != "ActiveAndValid":
-            return obj.NoneObject("PDE invalid (Is this a large page?)."), []
-
-        containing_page = int(pfn_obj.u4.PteFrame)
-        pde_address = ((containing_page << self.PAGE_BITS) |
-                       (int(pfn_obj.PteAddress) & 0xFFF))
-
-        result |= (pde_address << 20) & 0xffc00000
-
-        # Now get the DTB.
-        pfn_obj = self.pfn_plugin.pfn_record(containing_page)
-
-        containing_page = int(pfn_obj.u4.PteFrame)
-        dtb_address = containing_page << self.PAGE_BITS
-
-        return result, (("DTB", dtb_address),
-                        ("PDE", pde_address),
-                        ("PTE", pte_address))
-
-    def _ptov_x86_pae(self, physical_address):
-        """An implementation of ptov for x86 pae."""
-        result = physical_address & 0xFFF
-        # Get the pte for this physical_address using the pfn database.
-        pfn_obj = self.pfn_plugin.pfn_record(physical_address >> self.PAGE_BITS)
-
-        if pfn_obj.Type != "ActiveAndValid":
-            return obj.NoneObject("PTE invalid."), []
-
-        containing_page = int(pfn_obj.u4.PteFrame)
-        pte_address = ((containing_page << self.PAGE_BITS) |
-                       (int(pfn_obj.PteAddress) & 0xFFF))
-
-        result |= (pte_address << 9) & 0x1FF000
-
-        # Get the PDE now:
-        pfn_obj = self.pfn_plugin.pfn_record(containing_page)
-
-        if pfn_obj.Type != "ActiveAndValid":
-            return obj.NoneObject("PDE invalid (Is this a large page?)."), []
-
-        containing_page = int(pfn_obj.u4.PteFrame)
-        pde_address = ((containing_page << self.PAGE_BITS) |
-                       (int(pfn_obj.PteAddress) & 0xFFF))
-
-        result |= (pde_address << 18) & 0x3fe00000
-
-        # Get the PDPTE now:
-        pfn_obj = self.pfn_plugin.pfn_record(containing_page)
-
-        if pfn_obj.Type != "ActiveAndValid":
-            return obj.NoneObject(
-                "PDPTE invalid (Is this a one gig page?)."), []
-
-        containing_page = int(pfn_obj.u4.PteFrame)
-        pdpte_address = ((containing_page << self.PAGE_BITS) |
-                         (int(pfn_obj.PteAddress) & 0xFFF))
-
-        result |= (pdpte_address << 27) & 0x7FC0000000
-
-        # Now get the DTB.
-        pfn_obj = self.pfn_plugin.pfn_record(containing_page)
+    def _GetLevels(self):
+        """Returns the paging levels for PFNDatabase.ptov()."""
+        if self.profile.metadata("arch") == "I386":
+            if self.profile.metadata("pae"):
+                return self.PAE_LEVELS
 
-        containing_page = int(pfn_obj.u4.PteFrame)
-        dtb_address = containing_page << self.PAGE_BITS
+            return self.I386_LEVELS
 
-        return result, (("DTB", dtb_address),
-                        ("PDPTE", pdpte_address),
-                        ("PDE", pde_address),
-                        ("PTE", pte_address))
+        elif self.profile.metadata("arch") == "AMD64":
+            return self.AMD64_LEVELS
 
-    def _ptov_x64(self, physical_address):
-        """An implementation of ptov for x64."""
-        result = physical_address & 0xFFF
+    def ptov(self, physical_address):
+        """Convert the physical address to a virtual address.
 
-        # Get the pte for this physical_address using the pfn database.
-        pfn_obj = self.pfn_plugin.pfn_record(physical_address >> self.PAGE_BITS)
+        Returns:
+          a tuple (virtual address, list of (name, address) for the DTB and the
+          paging structures).
+        """
+        levels = self._GetLevels()
+        if levels is None:
+            return obj.NoneObject("Memory model not supported."), []
 
-        if pfn_obj.Type != "ActiveAndValid":
-            return obj.NoneObject("PTE invalid."), []
+        return self.pfn_plugin.pfn_index.ptov(physical_address, levels)
 
-        containing_page = int(pfn_obj.u4.PteFrame)
-        pte_address = ((containing_page << self.PAGE_BITS) |
-                       (int(pfn_obj.PteAddress) & 0xFFF))
+    def render(self, renderer):
+        if self.physical_address is None:
+            return
 
-        result |= (pte_address << 9) & 0x1FF000
+        result, structures = self.ptov(self.physical_address)
+        if result:
+            renderer.format("Physical Address {0:#x} => "
+                            "Virtual Address {1:#x}\n",
+                            self.physical_address, result)
 
-        # Get the PDE now:
-        pfn_obj = self.pfn_plugin.pfn_record(containing_page)
+            for type, phys_addr in structures:
+                renderer.format("{0} @ {1:#x}\n", type, phys_addr)
+        else:
+            renderer.format("Error converting Physical Address {0:#x}: "
+                            "{1}\n", self.physical_address, result)
 
-        if pfn_obj.Type != "ActiveAndValid":
-            return obj.NoneObject("PDE invalid (Is this a large page?)."), []
 
-        containing_page = int(pfn_obj.u4.PteFrame)
-        pde_address = ((containing_page << self.PAGE_BITS) |
-                       (int(pfn_obj.PteAddress) & 0xFFF))
+class DTBCheck(scan.ScannerCheck):
+    """Checks if the page tables at the offset map known kernel addresses.
 
-        result |= (pde_address << 18) & 0x3fe00000
+    Building an address space for each candidate DTB is slow. This check walks
+    the page tables of the candidate by hand using the raw table entries. The
+    top level entries are read from the scan buffer and the lower level tables,
+    which are shared by many candidates, are cached.
+    """
 
-        # Get the PDPTE now:
-        pfn_obj = self.pfn_plugin.pfn_record(containing_page)
+    # The mask of the physical address in a 64 bit paging entry.
+    ADDRESS_MASK = 0xffffffffff000
 
-        if pfn_obj.Type != "ActiveAndValid":
-            return obj.NoneObject(
-                "PDPTE invalid (Is this a one gig page?)."), []
+    def __init__(self, mode="AMD64", step=0x1000, symbol_checks=None,
+                 **kwargs):
+        """Constructor.
 
-        containing_page = int(pfn_obj.u4.PteFrame)
-        pdpte_address = ((containing_page << self.PAGE_BITS) |
-                         (int(pfn_obj.PteAddress) & 0xFFF))
+        Args:
+          mode: The paging mode - "AMD64", "PAE" or "IA32".
+          step: The alignment of the DTB.
+          symbol_checks: A list of (virtual address, physical address) which
+            the DTB must translate.
+        """
+        super(DTBCheck, self).__init__(**kwargs)
+        self.step = step
+        self.symbol_checks = symbol_checks or []
+        self.vtop = dict(AMD64=self._vtop_amd64, PAE=self._vtop_pae,
+                         IA32=self._vtop_ia32)[mode]
+
+        self.pages = utils.FastStore(max_size=1000)
+
+    def _ReadEntry(self, address, format_string):
+        page = address & ~0xFFF
+        try:
+            data = self.pages.Get(page)
+        except KeyError:
+            data = self.address_space.read(page, 0x1000)
+            self.pages.Put(page, data)
+
+        return struct.unpack_from(format_string, data, address & 0xFFF)[0]
+
+    def _ReadTopEntry(self, buffer_as, address, format_string):
+        offset = address - buffer_as.base_offset
+        if 0 <= offset <= len(buffer_as.data) - struct.calcsize(format_string):
+            return struct.unpack_from(format_string, buffer_as.data, offset)[0]
+
+        return self._ReadEntry(address, format_string)
+
+    def _vtop_pd(self, pdpte, vaddr):
+        """Translates through the page directory (PAE and AMD64)."""
+        pde = self._ReadEntry((pdpte & self.ADDRESS_MASK) |
+                              ((vaddr >> 18) & 0xff8), "<Q")
+        if not pde & 1:
+            return
 
-        result |= (pdpte_address << 27) & 0x7FC0000000
+        # A 2mb page.
+        if pde & 0x80:
+            return (pde & 0xfffffffe00000) | (vaddr & 0x1fffff)
 
-        # Get the PML4E now:
-        pfn_obj = self.pfn_plugin.pfn_record(containing_page)
+        pte = self._ReadEntry((pde & self.ADDRESS_MASK) |
+                              ((vaddr >> 9) & 0xff8), "<Q")
+        if pte & 1:
+            return (pte & self.ADDRESS_MASK) | (vaddr & 0xfff)
 
-        if pfn_obj.Type != "ActiveAndValid":
-            return obj.NoneObject("PML4E invalid."), []
+    def _vtop_amd64(self, buffer_as, dtb, vaddr):
+        pml4e = self._ReadTopEntry(
+            buffer_as, (dtb & self.ADDRESS_MASK) | ((vaddr >> 36) & 0xff8),
+            "<Q")
+        if not pml4e & 1:
+            return
 
-        containing_page = int(pfn_obj.u4.PteFrame)
-        pml4e_address = ((containing_page << self.PAGE_BITS) |
-                         (int(pfn_obj.PteAddress) & 0xFFF))
+        pdpte = self._ReadEntry((pml4e & self.ADDRESS_MASK) |
+                                ((vaddr >> 27) & 0xff8), "<Q")
+        if not pdpte & 1:
+            return
 
-        result |= (pml4e_address << 36) & 0xff8000000000
+        # A 1gb page.
+        if pdpte & 0x80:
+            return (pdpte & 0xfffffc0000000) | (vaddr & 0x3fffffff)
 
-        # Now get the DTB.
-        pfn_obj = self.pfn_plugin.pfn_record(containing_page)
+        return self._vtop_pd(pdpte, vaddr)
 
-        containing_page = int(pfn_obj.u4.PteFrame)
-        dtb_address = containing_page << self.PAGE_BITS
+    def _vtop_pae(self, buffer_as, dtb, vaddr):
+        pdpte = self._ReadTopEntry(
+            buffer_as, (dtb & 0xffffffe0) | ((vaddr >> 27) & 0x18), "<Q")
+        if pdpte & 1:
+            return self._vtop_pd(pdpte, vaddr)
 
-        return result, (("DTB", dtb_address),
-                        ("PML4E", pml4e_address),
-                        ("PDPTE", pdpte_address),
-                        ("PDE", pde_address),
-                        ("PTE", pte_address))
+    def _vtop_ia32(self, buffer_as, dtb, vaddr):
+        pde = self._ReadTopEntry(
+            buffer_as, (dtb & 0xfffff000) | ((vaddr >> 20) & 0xffc), "<I")
+        if not pde & 1:
+            return
 
-    def ptov(self, physical_address):
-        """Convert the physical address to a virtual address.
+        # A 4mb page.
+        if pde & 0x80:
+            return (pde & 0xffc00000) | (vaddr & 0x3fffff)
 
-        Returns:
-          a tuple (_EPROCESS of owning process, virtual address in process AS).
-        """
-        if self.profile.metadata("arch") == "I386":
-            if self.profile.metadata("pae"):
-                return self._ptov_x86_pae(physical_address)
-            else:
-                return self._ptov_x86(physical_address)
-        elif self.profile.metadata("arch") == "AMD64":
-            return self._ptov_x64(physical_address)
+        pte = self._ReadEntry((pde & 0xfffff000) | ((vaddr >> 10) & 0xffc),
+                              "<I")
+        if pte & 1:
+            return (pte & 0xfffff000) | (vaddr & 0xfff)
 
-        return obj.NoneObject("Memory model not supported."), []
+    def check(self, buffer_as, offset):
+        if offset % self.step:
+            return False
 
-    def render(self, renderer):
-        if self.physical_address is None:
-            return
+        for vaddr, paddr in self.symbol_checks:
+            if self.vtop(buffer_as, offset, vaddr) != paddr:
+                return False
 
-        result, structures = self.ptov(self.physical_address)
-        if result:
-            renderer.format("Physical Address {0:#x} => "
-                            "Virtual Address {1:#x}\n",
-                            self.physical_address, result)
+        return True
 
-            for type, phys_addr in structures:
-                renderer.format("{0} @ {1:#x}\n", type, phys_addr)
-        else:
-            renderer.format("Error converting Physical Address {0:#x}: "
-                            "{1}\n", self.physical_address, result)
+    def skip(self, buffer_as, offset):
+        return self.step - offset % self.step
 
 
 class DTBScan2(common.WindowsCommandPlugin):
@@ -681,12 +831,23 @@ class DTBScan2(common.WindowsCommandPlugin):
 
     name = "dtbscan2"
 
-    def TestVAddr(self, test_as, vaddr, symbol_checks):
+    def TestVAddr(self, test_as, symbol_checks):
         for vaddr, paddr in symbol_checks:
             if test_as.vtop(vaddr) != paddr:
                 return False
         return True
 
+    def GetPagingMode(self):
+        """Returns the paging mode and DTB alignment for DTBCheck."""
+        address_space = self.session.kernel_address_space
+        if isinstance(address_space, amd64.AMD64PagedMemory):
+            return "AMD64", 0x1000
+
+        elif isinstance(address_space, intel.IA32PagedMemoryPae):
+            return "PAE", 0x20
+
+        return "IA32", 0x1000
+
     def render(self, renderer):
         dtb_map = {}
         pslist_plugin = self.session.plugins.pslist()
@@ -696,11 +857,9 @@ class DTBScan2(common.WindowsCommandPlugin):
 
         symbols = ["nt", "nt!MmGetPhysicalMemoryRanges"]
         if self.session.profile.metadata("arch") == "AMD64":
-            dtb_step = 0x1000
             # Add _KUSER_SHARED_DATA
             symbols.append(0xFFFFF78000000000)
         else:
-            dtb_step = 0x20
             symbols.append(0xFFDF0000)
 
         symbol_checks = []
@@ -720,16 +879,27 @@ class DTBScan2(common.WindowsCommandPlugin):
                 target="_PHYSICAL_MEMORY_DESCRIPTOR",
                 ))
 
+        # The candidates are checked by a scanner so they can be checked in
+        # parallel (see --scan_workers).
+        mode, dtb_step = self.GetPagingMode()
+        scanner = scan.BaseScanner(
+            profile=self.profile, address_space=self.physical_address_space,
+            session=self.session, checks=[
+                ("DTBCheck", dict(mode=mode, step=dtb_step,
+                                  symbol_checks=symbol_checks))])
+
         for memory_range in descriptor.Run:
             start = memory_range.BasePage * 0x1000
             length = memory_range.PageCount * 0x1000
 
-            for page in range(start, start+length, dtb_step):
-                self.session.report_progress("Checking %#x", page)
+            for page in scanner.scan(offset=start, maxlen=length):
+                # Only build an address space for the candidates which pass
+                # the fast check to confirm them.
                 test_as = self.session.kernel_address_space.__class__(
-                    dtb=page, base=self.physical_address_space)
+                    dtb=page, base=self.physical_address_space,
+                    session=self.session)
 
-                if self.TestVAddr(test_as, vaddr, symbol_checks):
+                if self.TestVAddr(test_as, symbol_checks):
                     renderer.table_row(
                         page,
                         dtb_map.get(page, obj.NoneObject("Unknown"))
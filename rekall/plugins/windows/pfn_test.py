@@ -21,7 +21,16 @@
 #
 
 """Tests for the pfn plugins."""
+import struct
+
+from rekall import addrspace
+from rekall import obj
+from rekall import scan
+from rekall import session
 from rekall import testlib
+from rekall.plugins.addrspaces import amd64
+from rekall.plugins.overlays import basic
+from rekall.plugins.windows import pfn
 
 class TestVtoP(testlib.SimpleTestCase):
     # Create a test case by running the vadmap plugin and selecting at least one
@@ -47,3 +56,184 @@ class TestPFN(testlib.SimpleTestCase):
         commandline="pfn %(pfn)s",
         pfn=0
     )
+
+
+# A cut down AMD64 _MMPFN.
+MMPFN_VTYPES = {
+    "_MMPFN": [0x30, {
+        "u1": [0, ["unsigned long long"]],
+        "PteAddress": [8, ["Pointer", dict(target="unsigned long long")]],
+        "u3": [0x18, ["_MMPFN_u3"]],
+        "u4": [0x28, ["_MMPFN_u4"]],
+        }],
+    "_MMPFN_u3": [4, {
+        "e1": [2, ["_MMPFNENTRY"]],
+        }],
+    "_MMPFNENTRY": [2, {
+        "PageLocation": [0, ["BitField", dict(
+            start_bit=0, end_bit=3, native_type="unsigned char")]],
+        "PrototypePte": [1, ["BitField", dict(
+            start_bit=2, end_bit=3, native_type="unsigned char")]],
+        }],
+    "_MMPFN_u4": [8, {
+        "PteFrame": [0, ["BitField", dict(
+            start_bit=0, end_bit=52, native_type="unsigned long long")]],
+        }],
+    }
+
+
+class PFNDatabaseTest(testlib.RekallBaseUnitTestCase):
+    """Test the columnar PFN database."""
+
+    # pfn: (PteFrame, PteAddress, PageLocation, PrototypePte)
+    RECORDS = {
+        # A page mapped at 0x200C0401000 through four levels of tables.
+        0x100: (0x200, 0xFFFFF6FB40001008, 6, 0),
+        0x200: (0x300, 0xFFFFF6FB7DA00010, 6, 0),
+        0x300: (0x400, 0xFFFFF6FB7DBED018, 6, 0),
+        0x400: (0x187, 0xFFFFF6FB7DBED020, 6, 0),
+        0x187: (0x187, 0xFFFFF6FB7DBEDF68, 6, 0),
+
+        # A shared page.
+        0x101: (0x200, 0xFFFFF8A000001000, 6, 1),
+
+        # A standby page.
+        0x102: (0x200, 0xFFFFF6FB40001010, 2, 0),
+        }
+
+    def setUp(self):
+        self.session = session.Session()
+        self.profile = basic.ProfileLLP64(session=self.session)
+        self.profile.add_types(MMPFN_VTYPES)
+
+        data = bytearray(0x30 * 0x500)
+        for number, (frame, address, location, prototype) in (
+                self.RECORDS.iteritems()):
+            offset = number * 0x30
+            struct.pack_into("<Q", data, offset + 8, address)
+            struct.pack_into("<BB", data, offset + 0x1A, location,
+                             prototype << 2)
+            struct.pack_into("<Q", data, offset + 0x28, frame)
+
+        self.address_space = addrspace.BufferAddressSpace(
+            session=self.session, data=str(data))
+
+        self.index = pfn.PFNDatabase(self.profile, self.address_space, 0)
+
+        # Use small blocks so lookups span many blocks.
+        self.index.BLOCK_RECORDS = 0x100
+
+    def testRecords(self):
+        for number in range(0x500):
+            record = self.profile._MMPFN(  # pylint: disable=protected-access
+                offset=number * 0x30, vm=self.address_space)
+
+            self.assertEqual(self.index[number], (
+                int(record.u4.PteFrame), int(record.PteAddress) & 0xFFF,
+                int(record.u3.e1.PageLocation),
+                int(record.u3.e1.PrototypePte)))
+
+        self.assertEqual(sorted(self.index.blocks), [0, 1, 2, 3, 4])
+
+    def testPtoV(self):
+        virtual_address, structures = self.index.ptov(
+            0x100123, pfn.PtoV.AMD64_LEVELS)
+
+        self.assertEqual(virtual_address, 0x200C0401123)
+        self.assertEqual(structures, [("DTB", 0x187000),
+                                      ("PML4E", 0x187020),
+                                      ("PDPTE", 0x400018),
+                                      ("PDE", 0x300010),
+                                      ("PTE", 0x200008)])
+
+        self.assertTrue(self.index.is_private(0x100000))
+        self.assertFalse(self.index.is_private(0x101000))
+        self.assertFalse(self.index.is_private(0x102000))
+
+        virtual_address, structures = self.index.ptov(
+            0x102000, pfn.PtoV.AMD64_LEVELS)
+        self.assertTrue(isinstance(virtual_address, obj.NoneObject))
+        self.assertEqual(structures, [])
+
+
+class DTBCheckTest(testlib.RekallBaseUnitTestCase):
+    """Test the fast DTB verification against the address space."""
+
+    KERNEL = 0xFFFFF80002800000
+    KUSER_SHARED_DATA = 0xFFFFF78000000000
+
+    def setUp(self):
+        self.session = session.Session()
+        self.data = bytearray(0x100000)
+        self.next_table = 0x80000
+
+    def AllocateTable(self):
+        self.next_table += 0x1000
+        return self.next_table
+
+    def Map(self, dtb, vaddr, paddr, large=False):
+        """Maps a 4kb (or 2mb if large) page in the AMD64 page tables."""
+        table = dtb
+        for shift in (39, 30, 21):
+            address = table + ((vaddr >> shift) & 0x1ff) * 8
+            if shift == 21 and large:
+                struct.pack_into("<Q", self.data, address, paddr | 0x81)
+                return
+
+            entry = struct.unpack_from("<Q", self.data, address)[0]
+            if not entry & 1:
+                entry = self.AllocateTable() | 1
+                struct.pack_into("<Q", self.data, address, entry)
+
+            table = entry & 0xffffffffff000
+
+        struct.pack_into("<Q", self.data, table + ((vaddr >> 12) & 0x1ff) * 8,
+                         paddr | 1)
+
+    def testDTBCheck(self):
+        # The real DTB.
+        self.Map(0x10000, self.KERNEL, 0x200000, large=True)
+        self.Map(0x10000, self.KERNEL + 0x201000, 0x5000)
+        self.Map(0x10000, self.KUSER_SHARED_DATA, 0x6000)
+
+        # Maps the kernel but not KUSER_SHARED_DATA.
+        self.Map(0x20000, self.KERNEL, 0x200000, large=True)
+        self.Map(0x20000, self.KERNEL + 0x201000, 0x5000)
+
+        # Maps KUSER_SHARED_DATA to the wrong page.
+        self.Map(0x30000, self.KERNEL, 0x200000, large=True)
+        self.Map(0x30000, self.KERNEL + 0x201000, 0x5000)
+        self.Map(0x30000, self.KUSER_SHARED_DATA, 0x7000)
+
+        physical_as = addrspace.BufferAddressSpace(
+            session=self.session, data=str(self.data))
+        kernel_as = amd64.AMD64PagedMemory(
+            base=physical_as, dtb=0x10000, session=self.session)
+
+        symbol_checks = [
+            (vaddr, kernel_as.vtop(vaddr)) for vaddr in (
+                self.KERNEL + 0x123, self.KERNEL + 0x201123,
+                self.KUSER_SHARED_DATA)]
+        self.assertEqual([x[1] for x in symbol_checks],
+                         [0x200123, 0x5123, 0x6000])
+
+        scanner = scan.BaseScanner(
+            profile=basic.ProfileLLP64(session=self.session),
+            address_space=physical_as, session=self.session, checks=[
+                ("DTBCheck", dict(mode="AMD64", step=0x1000,
+                                  symbol_checks=symbol_checks))])
+
+        self.assertEqual(list(scanner.scan(maxlen=len(self.data))), [0x10000])
+
+        # The fast check agrees with the address space for every candidate.
+        check = pfn.DTBCheck(address_space=physical_as,
+                             symbol_checks=symbol_checks)
+        buffer_as = addrspace.BufferAddressSpace(
+            session=self.session, data=str(self.data[:0x40000]))
+        for dtb in range(0x1000, len(self.data), 0x1000):
+            test_as = amd64.AMD64PagedMemory(
+                base=physical_as, dtb=dtb, session=session.Session())
+
+            for vaddr, _ in symbol_checks:
+                self.assertEqual(check.vtop(buffer_as, dtb, vaddr),
+                                 test_as.vtop(vaddr))
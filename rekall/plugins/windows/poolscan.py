@@ -0,0 +1,137 @@
+# Rekall Memory Forensics
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+"""Run all the pool scanners in a single pass over the image."""
+
+# pylint: disable=protected-access
+
+from rekall import scan
+
+from rekall.plugins.windows import common
+from rekall.plugins.windows import connscan
+from rekall.plugins.windows import filescan
+from rekall.plugins.windows import modscan
+from rekall.plugins.windows import netscan
+
+
+class PoolScanAll(common.PoolScannerPlugin):
+    """Scan for the pool allocations of all the pool scanners at once.
+
+    Each pool scanner plugin (e.g. filescan or psscan) makes its own pass over
+    the image. This plugin runs all their scanners in a single pass and caches
+    the hits in the session, so the pool scanner plugins run afterwards do not
+    need to scan the image again.
+    """
+
+    __name = "poolscan_all"
+
+    # The scanners we run: (plugin name, scanner class, profile name). A
+    # scanner only runs if its plugin is active for this image. The profile
+    # name is the module whose profile the scanner needs (None for the kernel).
+    SCANNERS = [
+        ("filescan", filescan.PoolScanFile, None),
+        ("driverscan", filescan.PoolScanDriver, None),
+        ("symlinkscan", filescan.PoolScanSymlink, None),
+        ("mutantscan", filescan.PoolScanMutant, None),
+        ("psscan", filescan.PoolScanProcess, None),
+        ("modscan", modscan.PoolScanModuleFast, None),
+        ("thrdscan", modscan.PoolScanThreadFast, None),
+        ("connscan", connscan.PoolScanConnFast, "tcpip"),
+        ("netscan", netscan.PoolScanTcpListener, "tcpip"),
+        ("netscan", netscan.PoolScanTcpEndpoint, "tcpip"),
+        ("netscan", netscan.PoolScanUdpEndpoint, "tcpip"),
+        ]
+
+    def _GetProfile(self, profile_name):
+        if profile_name is None:
+            return self.profile
+
+        return self.session.address_resolver.LoadProfileForName(profile_name)
+
+    def _GetScanners(self):
+        """Returns a dict of scanners to run keyed by scanner class name."""
+        scanners = {}
+        for plugin_name, scanner_cls, profile_name in self.SCANNERS:
+            if self.session.plugins.GetPluginClass(plugin_name) == None:
+                continue
+
+            profile = self._GetProfile(profile_name)
+            if not profile:
+                self.session.logging.debug(
+                    "Unable to load the %s profile, skipping %s.",
+                    profile_name, scanner_cls.__name__)
+                continue
+
+            try:
+                scanner = scanner_cls(profile=profile, session=self.session,
+                                      address_space=self.address_space)
+            except RuntimeError as e:
+                self.session.logging.debug(
+                    "Unable to create %s: %s", scanner_cls.__name__, e)
+                continue
+
+            scanners[scanner_cls.__name__] = scanner
+
+        return scanners
+
+    def generate_hits(self):
+        """Yields (scanner name, result) for all the pool scanners.
+
+        The result is what the scanner's own scan() method yields for the hit.
+        """
+        group = scan.ScannerGroup(
+            scanners=self._GetScanners(), profile=self.profile,
+            session=self.session, address_space=self.address_space)
+
+        for name, result in group.scan():
+            yield name, result
+
+        # The scan is complete so we can cache the hits of all the scanners
+        # which were run from the automaton. PoolScanner only uses the cache
+        # for the physical address space.
+        if self.address_space is not self.session.physical_address_space:
+            return
+
+        pool_scan_hits = dict(self.session.GetParameter("pool_scan_hits") or {})
+        for name in group.scanners:
+            if name not in group.other_scanners:
+                pool_scan_hits[name] = group.result.get(name, [])
+
+        self.session.SetCache("pool_scan_hits", pool_scan_hits)
+
+    def render(self, renderer):
+        renderer.table_header([
+            ("Scanner", "scanner", "20"),
+            (" ", "allocated", "1"),
+            ("Offset(P)", "offset_p", "[addrpad]"),
+            ("Tag", "tag", "4"),
+            ("Size", "size", "[addr]"),
+            ])
+
+        for name, result in self.generate_hits():
+            # Some scanners yield the pool header together with their object.
+            pool_obj = result
+            if isinstance(result, tuple):
+                pool_obj = result[0]
+
+            renderer.table_row(
+                name,
+                "F" if pool_obj.FreePool else "",
+                pool_obj.obj_offset,
+                pool_obj.Tag,
+                pool_obj.BlockSize * self.profile.constants["PoolAlignment"])
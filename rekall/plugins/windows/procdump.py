@@ -104,8 +104,9 @@ class PEDump(common.WindowsCommandPlugin):
             size_of_section = min(10e6, section.SizeOfRawData)
             physical_offset = min(100e6, int(section.PointerToRawData))
 
-            data = section.obj_vm.read(
-                section.VirtualAddress + image_base, size_of_section)
+            data = bytearray(int(size_of_section))
+            section.obj_vm.read_into(
+                section.VirtualAddress + image_base, data)
 
             fd.seek(physical_offset, 0)
             fd.write(data)
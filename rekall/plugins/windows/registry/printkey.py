@@ -64,13 +64,13 @@ class PrintKey(registry.RegistryPlugin):
         self.key = key
         self.recursive = recursive
 
-    def _list_keys(self, key=None):
-        yield key
+    def _list_keys(self, reg, key=None):
+        if not self.recursive or not key:
+            yield key
+            return
 
-        if self.recursive:
-            for subkey in key.subkeys():
-                for subkey in self._list_keys(subkey):
-                    yield subkey
+        for _, subkey in reg.walk(key):
+            yield subkey
 
     def list_keys(self):
         """Return the keys that match."""
@@ -82,7 +82,7 @@ class PrintKey(registry.RegistryPlugin):
                 hive_offset=hive_offset)
 
             key = reg.open_key(self.key)
-            for subkey in self._list_keys(key):
+            for subkey in self._list_keys(reg, key):
                 if subkey in seen:
                     break
 
@@ -194,21 +194,7 @@ class HiveDump(registry.RegistryPlugin):
 
     __name = "hivedump"
 
-    def _key_iterator(self, key, seen):
-        yield key
-
-        if key in seen:
-            return
-
-        seen.add(key)
-
-        for subkey in key.subkeys():
-            for subsubkey in self._key_iterator(subkey, seen):
-                yield subsubkey
-
     def render(self, renderer):
-        seen = set()
-
         for hive_offset in self.hive_offsets:
             reg = registry.RegistryHive(
                 hive_offset=hive_offset, session=self.session,
@@ -221,8 +207,8 @@ class HiveDump(registry.RegistryPlugin):
             renderer.table_header([("Last Written", "timestamp", "<24"),
                                    ("Key", "key", "")])
 
-            for key in self._key_iterator(reg.root, seen):
-                renderer.table_row(key.LastWriteTime, key.Path)
+            for path, key in reg.walk():
+                renderer.table_row(key.LastWriteTime, path)
 
 
 # Special types to parse the SAM data structures.
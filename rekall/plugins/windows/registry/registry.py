@@ -27,6 +27,7 @@ __author__ = ("Michael Cohen <scudette@gmail.com> based on original code "
 
 # pylint: disable=protected-access
 
+import itertools
 import ntpath
 import re
 import struct
@@ -189,11 +190,45 @@ class HiveAddressSpace(HiveBaseAddressSpace):
         self.flat = self.hive.Hive.Flat.v() > 0
         self.storage = self.hive.Hive.Storage
 
-        # This is a quick lookup for blocks.
+        # This is a quick lookup for blocks outside the block maps.
         self.block_cache = utils.FastStore(max_size=1000)
 
+        # The block addresses of the stable and volatile storage, indexed by
+        # the table and block parts of the cell index.
+        self.block_maps = [[], []]
+        if not self.flat:
+            self.block_maps = [self._BuildBlockMap(self.storage[ci_type])
+                               for ci_type in (0, 1)]
+
         self.logging = self.session.logging.getChild("addrspace.hive")
 
+    def _BuildBlockMap(self, storage):
+        """Decodes the whole map of the storage into a list of blocks.
+
+        Each _HMAP_TABLE is read at once rather than looking up the
+        _HMAP_DIRECTORY for each cell.
+        """
+        blocks = storage.Length.v() / self.BLOCK_SIZE
+        directory = storage.Map.Directory
+        result = []
+        for ci_table in xrange((blocks + 511) / 512):
+            count = min(512, blocks - len(result))
+            table = directory[ci_table].dereference()
+            if not table:
+                result.extend([None] * count)
+                continue
+
+            table_vm = addrspace.BufferAddressSpace(
+                data=self.base.read(table.obj_offset, table.obj_size),
+                base_offset=table.obj_offset, session=self.session)
+
+            entries = self.profile._HMAP_TABLE(
+                offset=table.obj_offset, vm=table_vm).Table
+            for ci_block in xrange(count):
+                result.append(int(entries[ci_block].BlockAddress) or None)
+
+        return result
+
     def vtop(self, vaddr):
         vaddr = int(vaddr)
 
@@ -207,6 +242,16 @@ class HiveAddressSpace(HiveBaseAddressSpace):
         ci_block = (vaddr & self.CI_BLOCK_MASK) >> self.CI_BLOCK_SHIFT
         ci_off = (vaddr & self.CI_OFF_MASK) >> self.CI_OFF_SHIFT
 
+        block_map = self.block_maps[ci_type]
+        index = ci_table * 512 + ci_block
+        if index < len(block_map):
+            block = block_map[index]
+            if block is None:
+                return None
+
+            return block + ci_off + 4
+
+        # The cell is beyond the length of the storage when the map was built.
         try:
             block = self.block_cache.Get((ci_type, ci_table, ci_block))
         except KeyError:
@@ -263,10 +308,10 @@ class HiveAddressSpace(HiveBaseAddressSpace):
         for i in xrange(0, length, self.BLOCK_SIZE):
             i = ci(i)
             data = None
-            paddr = self.vtop(i) - 4
+            paddr = self.vtop(i)
 
             if paddr:
-                data = self.base.read(paddr, self.BLOCK_SIZE)
+                data = self.base.read(paddr - 4, self.BLOCK_SIZE)
             else:
                 bad_blocks_reg += 1
                 continue
@@ -346,8 +391,12 @@ class _CM_KEY_NODE(obj.Struct):
 
     def values(self):
         """Enumerate all the values of the key."""
-        for value_ptr in self.ValueList.List.dereference():
-            value = value_ptr.dereference()
+        value_list = self.ValueList
+        for value_offset in ReadCellOffsets(
+                self.obj_vm, value_list.m("List").v(), value_list.Count.v()):
+            value = self.obj_profile._CM_KEY_VALUE(
+                offset=value_offset, vm=self.obj_vm, parent=self)
+
             if value.Signature == self.VK_SIG:
                 yield value
 
@@ -398,32 +447,40 @@ class _CM_KEY_INDEX(obj.Struct):
         """Iterate over all the keys in the index.
 
         Depending on our type (from the Signature) we use different methods."""
-        if self.Signature == self.LH_SIG or self.Signature == self.LF_SIG:
+        signature = self.Signature.v()
+        list_offset = self.m("List").obj_offset
+        count = self.Count.v()
+
+        if signature == self.LH_SIG or signature == self.LF_SIG:
             # The List contains alternating pointers/hash elements here. We do
             # not care about the hash at all, so we skip every other entry. See
             # http://www.sentinelchicken.com/data/TheWindowsNTRegistryFileFormat.pdf
-            key_list = self.List
-            for i in xrange(self.Count * 2):
-                nk = key_list[i]
-                if nk.Signature == self.NK_SIG:
-                    yield nk
-
-        elif self.Signature == self.RI_SIG:
-            for i in xrange(self.Count):
-                # This is a pointer to another _CM_KEY_INDEX
-                for subkey in self.obj_profile.Object(
-                        "Pointer32", offset=self.List[i].v(),
-                        vm=self.obj_vm, parent=self.obj_parent,
-                        target="_CM_KEY_INDEX"):
-                    if subkey.Signature == self.NK_SIG:
-                        yield subkey
-
-        elif self.Signature == self.LI_SIG:
-            key_list = self.List
-            for i in xrange(self.Count):
-                nk = key_list[i]
-                if nk.Signature == self.NK_SIG:
-                    yield nk
+            offsets = itertools.islice(ReadCellOffsets(
+                self.obj_vm, list_offset, count * 2), 0, None, 2)
+
+        elif signature == self.LI_SIG:
+            offsets = ReadCellOffsets(self.obj_vm, list_offset, count)
+
+        elif signature == self.RI_SIG:
+            # Each entry is another _CM_KEY_INDEX.
+            for index_offset in ReadCellOffsets(
+                    self.obj_vm, list_offset, count):
+                for subkey in self.obj_profile._CM_KEY_INDEX(
+                        offset=index_offset, vm=self.obj_vm,
+                        parent=self.obj_parent):
+                    yield subkey
+
+            return
+
+        else:
+            return
+
+        for offset in offsets:
+            nk = self.obj_profile._CM_KEY_NODE(
+                offset=offset, vm=self.obj_vm, parent=self.obj_parent)
+
+            if nk.Signature == self.NK_SIG:
+                yield nk
 
 
 class _CM_KEY_VALUE(obj.Struct):
@@ -480,6 +537,15 @@ class _CM_KEY_VALUE(obj.Struct):
         return data
 
 
+def ReadCellOffsets(vm, offset, count, chunk_size=1024):
+    """Reads a list of 32 bit cell offsets a chunk at a time."""
+    for i in xrange(0, count, chunk_size):
+        chunk = min(chunk_size, count - i)
+        data = vm.read(offset + i * 4, chunk * 4)
+        for cell_offset in struct.unpack("<%dI" % chunk, data):
+            yield cell_offset
+
+
 def RekallRegisteryImplementation(profile):
     """The standard rekall registry parsing subsystem."""
     profile.add_classes(dict(
@@ -558,6 +624,35 @@ class Registry(object):
 
         return key.open_value(ntpath.basename(path))
 
+    def walk(self, key=None):
+        """Walks the tree of keys below key (the root by default).
+
+        The keys are visited depth first, in the same order as recursing
+        through key.subkeys(), but the path of each key is built as we go
+        rather than by following its parents.
+
+        Yields:
+          (path, key) for each key.
+        """
+        if key is None:
+            key = self.root
+
+        seen = set()
+        stack = [(key.Path, key)]
+        while stack:
+            path, key = stack.pop()
+            yield path, key
+
+            # Guard against loops in the tree.
+            if key.obj_offset in seen:
+                continue
+
+            seen.add(key.obj_offset)
+
+            children = [(u"%s/%s" % (path, unicode(subkey.Name)), subkey)
+                        for subkey in key.subkeys()]
+            stack.extend(reversed(children))
+
     def CurrentControlSet(self):
         """Return the key for the CurrentControlSet."""
         current = self.open_value("Select/Current").DecodedData
@@ -0,0 +1,117 @@
+import struct
+import unittest
+
+from rekall import addrspace
+from rekall import session
+from rekall import testlib
+from rekall.plugins.overlays import basic
+from rekall.plugins.windows.registry import registry
+
+
+# Just enough of the registry structs to parse the test hive.
+REGISTRY_VTYPES = {
+    "_CM_KEY_NODE": [0x50, {
+        "Signature": [0, ["String", dict(length=2)]],
+        "Flags": [2, ["unsigned short"]],
+        "LastWriteTime": [4, ["unsigned long long"]],
+        "Parent": [0x10, ["unsigned int"]],
+        "SubKeyCounts": [0x14, ["Array", dict(
+            count=2, target="unsigned int")]],
+        "SubKeyLists": [0x1c, ["Array", dict(
+            count=2, target="unsigned int")]],
+        "ValueList": [0x24, ["_CHILD_LIST"]],
+        "NameLength": [0x48, ["unsigned short"]],
+        "Name": [0x4c, ["String"]],
+        }],
+    "_CHILD_LIST": [8, {
+        "Count": [0, ["unsigned int"]],
+        "List": [4, ["unsigned int"]],
+        }],
+    "_CM_KEY_INDEX": [8, {
+        "Signature": [0, ["String", dict(length=2)]],
+        "Count": [2, ["unsigned short"]],
+        "List": [4, ["unsigned int"]],
+        }],
+    "_CM_KEY_VALUE": [0x18, {
+        "Signature": [0, ["String", dict(length=2)]],
+        "NameLength": [2, ["unsigned short"]],
+        "DataLength": [4, ["unsigned int"]],
+        "Data": [8, ["unsigned int"]],
+        "Type": [0xc, ["unsigned int"]],
+        "Name": [0x14, ["String"]],
+        }],
+    }
+
+
+class RegistryTestProfile(basic.ProfileLLP64, basic.BasicClasses):
+    """A profile with the test registry structs."""
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(RegistryTestProfile, cls).Initialize(profile)
+        profile.add_types(REGISTRY_VTYPES)
+
+
+class RegistryTest(testlib.RekallBaseUnitTestCase):
+    """Test walking the keys of a hive."""
+
+    def setUp(self):
+        self.session = session.Session()
+        self.data = bytearray(0x1000)
+
+        # The root has two subkeys in a lf list and a value.
+        self.Key(0x20, "ROOT", subkeys=(1, 0x100), values=(1, 0x180))
+        self.Index(0x100, "lf", [0x200, 0x1234, 0x300, 0x5678])
+        struct.pack_into("<I", self.data, 0x180, 0x1a0)
+        struct.pack_into("<2sHIIII", self.data, 0x1a0, "vk", 3, 0x80000004,
+                         7, 4, 0)
+        self.data[0x1b4:0x1b7] = "Val"
+
+        # A has a ri list of a li list.
+        self.Key(0x200, "A", subkeys=(1, 0x400))
+        self.Index(0x400, "ri", [0x480])
+        self.Index(0x480, "li", [0x500])
+        self.Key(0x300, "B")
+
+        # C refers back to A.
+        self.Key(0x500, "C", subkeys=(1, 0x600))
+        self.Index(0x600, "lh", [0x200, 0])
+
+        self.registry = registry.Registry(
+            session=self.session, profile=RegistryTestProfile(session=self.session),
+            address_space=addrspace.BufferAddressSpace(
+                session=self.session, data=str(self.data)))
+
+    def Key(self, offset, name, subkeys=(0, 0), values=(0, 0)):
+        # The name is stored in ascii (KEY_COMP_NAME).
+        struct.pack_into("<2sH", self.data, offset, "nk", 1 << 5)
+        struct.pack_into("<IIIIII", self.data, offset + 0x14, subkeys[0], 0,
+                         subkeys[1], 0, values[0], values[1])
+        struct.pack_into("<H", self.data, offset + 0x48, len(name))
+        self.data[offset + 0x4c:offset + 0x4c + len(name)] = name
+
+    def Index(self, offset, signature, cells):
+        count = len(cells)
+        if signature in ("lf", "lh"):
+            count /= 2
+
+        struct.pack_into("<2sH%dI" % len(cells), self.data, offset,
+                         signature, count, *cells)
+
+    def testWalk(self):
+        self.assertEqual(
+            [(path, key.obj_offset) for path, key in self.registry.walk()],
+            [("ROOT", 0x20), ("ROOT/A", 0x200), ("ROOT/A/C", 0x500),
+             ("ROOT/A/C/A", 0x200), ("ROOT/B", 0x300)])
+
+        # The paths are the same as following the parents.
+        for path, key in self.registry.walk():
+            self.assertEqual(key.Path, path)
+
+    def testOpenKey(self):
+        self.assertEqual(self.registry.open_key("A/C").obj_offset, 0x500)
+        self.assertEqual(self.registry.open_value("Val").DecodedData, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -122,16 +122,65 @@ class WinMemMap(core.MemmapMixIn, common.WinProcessFilter):
     """Calculates the memory regions mapped by a process."""
     __name = "memmap"
 
+    # Set this to False in subclasses which do not render the map.
+    pagefile_option = True
+
+    @classmethod
+    def args(cls, parser):
+        super(WinMemMap, cls).args(parser)
+        if cls.pagefile_option:
+            parser.add_argument(
+                "--pagefile", default=False, type="Boolean",
+                help="Only count the pages of each type (e.g. Valid, "
+                "Transition, Pagefile) instead of listing them.")
+
+    def __init__(self, *pos_args, **kwargs):
+        self.pagefile = kwargs.pop("pagefile", False)
+        if self.pagefile and not self.pagefile_option:
+            raise plugin.PluginError(
+                "%s does not support the pagefile option." % self.name)
+
+        super(WinMemMap, self).__init__(*pos_args, **kwargs)
+
     def _get_highest_user_address(self):
         return self.profile.get_constant_object(
             "MmHighestUserAddress", "Pointer").v()
 
+    def _render_map(self, task_space, renderer, highest_address):
+        if not self.pagefile:
+            return super(WinMemMap, self)._render_map(
+                task_space, renderer, highest_address)
+
+        if not hasattr(task_space, "GetPageClassCounts"):
+            renderer.format("Address space {0} does not support paging.\n",
+                            task_space)
+            return
+
+        renderer.format(u"Pages of address space at DTB {0:#x}\n\n",
+                        task_space.dtb)
+
+        renderer.table_header([("Type", "type", "20"),
+                               ("Pages", "pages", ">10"),
+                               ("Size", "size", "[addr]")])
+
+        if self.all:
+            highest_address = 2**64
+
+        counts = task_space.GetPageClassCounts(end=highest_address)
+        for desc, pages in sorted(counts.items()):
+            renderer.table_row(desc, pages, pages * 0x1000)
+
 
 class WinMemDump(core.DirectoryDumperMixin, WinMemMap):
     """Dump the addressable memory for a process"""
 
     __name = "memdump"
 
+    # The pages are dumped rather than counted.
+    pagefile_option = False
+
+    BUFFERSIZE = 1024 * 1024
+
     def dump_process(self, eprocess, fd, index_fd):
         task_as = eprocess.get_process_address_space()
         highest_address = self._get_highest_user_address()
@@ -149,10 +198,14 @@ class WinMemDump(core.DirectoryDumperMixin, WinMemMap):
                 if not self.all and virt_address > highest_address:
                     break
 
-                data = self.physical_address_space.read(phys_address, length)
-
                 temp_renderer.table_row(fd.tell(), length, virt_address)
-                fd.write(data)
+
+                # Runs of contiguous pages can be large so copy them in
+                # blocks.
+                for offset in xrange(0, length, self.BUFFERSIZE):
+                    fd.write(self.physical_address_space.read(
+                        phys_address + offset,
+                        min(self.BUFFERSIZE, length - offset)))
 
     def render(self, renderer):
         if self.dump_dir is None:
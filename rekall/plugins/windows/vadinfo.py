@@ -218,6 +218,9 @@ class VAD(common.WinProcessFilter):
 
     __name = "vad"
 
+    # The number of processes to keep the VAD index for.
+    VAD_INDEX_CACHE_SIZE = 1000
+
     @classmethod
     def args(cls, parser):
         super(VAD, cls).args(parser)
@@ -232,7 +235,6 @@ class VAD(common.WinProcessFilter):
     def __init__(self, *args, **kwargs):
         self.regex = kwargs.pop("regex", None)
         self.offset = kwargs.pop("offset", None)
-        self._cache = {}
 
         # Pass positional args to the WinProcessFilter constructor.
         super(VAD, self).__init__(*args, **kwargs)
@@ -251,26 +253,34 @@ class VAD(common.WinProcessFilter):
             return None
 
     def _make_cache(self, task):
-        result = utils.SortedCollection(key=lambda x: x[0])
         self.session.report_progress(
             " Enumerating VADs in %s (%s)", task.name, task.pid)
 
-        for vad in task.RealVadRoot.traverse():
-            result.insert(
-                (vad.Start, vad.End, self._get_filename(vad), vad))
-
-        return result
+        return utils.IntervalIndex(
+            (vad.Start, vad.End, self._get_filename(vad), vad)
+            for vad in task.RealVadRoot.traverse())
 
     def GetVadsForProcess(self, task):
+        """Returns an IntervalIndex of (start, end, filename, vad).
+
+        The index is cached in the session so it is shared by all the users of
+        the vads (e.g. the process address space and the address resolver).
+        """
+        cache = self.session.GetParameter("vad_index_cache", None)
+        if cache is None:
+            cache = utils.FastStore(max_size=self.VAD_INDEX_CACHE_SIZE)
+            self.session.SetCache("vad_index_cache", cache)
+
         try:
-            resolver = self._cache[task]
+            resolver = cache.Get(task.obj_offset)
         except KeyError:
             # Break the recursion by placing a None for the resolver. The
             # self._make_cache() call will run the vad plugin which might
             # resolve a VAD PTE, calling this code. This means that we can only
             # use non-VAD PTEs to read the VAD itself.
-            self._cache[task] = None
-            resolver = self._cache[task] = self._make_cache(task)
+            cache.Put(task.obj_offset, None)
+            resolver = self._make_cache(task)
+            cache.Put(task.obj_offset, resolver)
 
         return resolver
 
@@ -20,19 +20,162 @@
 
 
 """A Rekall Memory Forensics scanner which uses yara."""
+import heapq
+import re
+
+import acora
+import yara
+
 from rekall import scan
 
 
+# Yara string definitions: text strings, hex strings and regular expressions,
+# followed by their modifiers.
+STRING_DEFINITION_RE = re.compile(
+    r"""\$\w*\s*=\s*("(?:[^"\\]|\\.)*"|\{[^}]*\}|/(?:[^/\\]|\\.)*/\w*)"""
+    r"""((?:[ \t]+\w+)*)""")
+
+# Conditions which are satisfied only if one of the rule's strings matches.
+STRING_CONDITION_RE = re.compile(
+    r"\bany\s+of\s+(?:them|\([^)]*\))|\$\w*|\bor\b|[()\s]")
+
+
+def _UnescapeText(text):
+    """Decodes the escape sequences of a yara text string."""
+    def _Unescape(match):
+        escape = match.group(1)
+        if escape[0] == "x":
+            return chr(int(escape[1:], 16))
+
+        return dict(n="\n", t="\t").get(escape, escape)
+
+    return re.sub(r"\\(x[0-9a-fA-F]{2}|.)", _Unescape, text)
+
+
+def _GetHexAtom(hex_string):
+    """Returns the longest run of fixed bytes in a yara hex string."""
+    hex_string = re.sub(r"\s", "", hex_string)
+
+    # We do not expand alternatives or negated bytes.
+    if "(" in hex_string or "|" in hex_string or "~" in hex_string:
+        return
+
+    longest = current = ""
+    for token in re.findall(r"\[[^\]]*\]|..", hex_string):
+        if re.match("^[0-9a-fA-F]{2}$", token):
+            current += chr(int(token, 16))
+            longest = max(longest, current, key=len)
+        else:
+            current = ""
+
+    return longest or None
+
+
+def _GetStringAtoms(definition, modifiers):
+    """Returns the literals one of which a match of the string contains."""
+    modifiers = set(modifiers.split())
+    if modifiers - set(["ascii", "wide", "fullword", "private"]):
+        return
+
+    if definition.startswith('"'):
+        atom = _UnescapeText(definition[1:-1])
+    elif definition.startswith("{"):
+        atom = _GetHexAtom(definition[1:-1])
+    else:
+        # Regular expressions.
+        return
+
+    if not atom:
+        return
+
+    atoms = []
+    if "wide" not in modifiers or "ascii" in modifiers:
+        atoms.append(atom)
+
+    if "wide" in modifiers:
+        atoms.append("".join(c + "\x00" for c in atom))
+
+    return atoms
+
+
+def GetPrefilterAtoms(rules_source):
+    """Extracts literals which must be present for any rule to match.
+
+    A buffer which contains none of the literals can not match any of the
+    rules, so it does not need to be scanned with yara at all. We only
+    understand rules whose conditions require one of their strings to match,
+    and whose strings contain a literal.
+
+    Returns:
+      A list of literal strings or None if the rules are not understood.
+    """
+    # Everything before the first rule (e.g. imports or includes).
+    chunks = re.split(r"(?:\b(?:private|global)\s+)*\brule\s+\w+",
+                      rules_source)
+    if chunks[0].strip() or len(chunks) < 2:
+        return
+
+    atoms = set()
+    for chunk in chunks[1:]:
+        match = re.match(
+            r"[^{]*\{\s*(?:meta:.*?)?strings:(.*)condition:(.*)\}\s*$",
+            chunk, re.S)
+        if not match:
+            return
+
+        strings, condition = match.groups()
+        if STRING_CONDITION_RE.sub("", condition):
+            return
+
+        # All the strings must be understood.
+        if STRING_DEFINITION_RE.sub("", strings).strip():
+            return
+
+        for definition, modifiers in STRING_DEFINITION_RE.findall(strings):
+            string_atoms = _GetStringAtoms(definition, modifiers)
+            if not string_atoms:
+                return
+
+            atoms.update(string_atoms)
+
+    return sorted(atoms)
+
+
 class BaseYaraASScanner(scan.BaseScanner):
     """An address space scanner for Yara signatures."""
     overlap = 1024
 
-    def __init__(self, rules=None, **kwargs):
+    def __init__(self, rules=None, rules_source=None, **kwargs):
+        """An address space scanner for Yara signatures.
+
+        Args:
+          rules: The compiled yara rules.
+          rules_source: The source of the rules. If provided, buffers which
+            can not match are skipped without running yara and physical
+            images may be scanned by worker processes.
+        """
         super(BaseYaraASScanner, self).__init__(**kwargs)
+        if rules is None:
+            rules = yara.compile(source=rules_source)
+
         self.rules = rules
+        self.rules_source = rules_source
+
+        # A heap of (offset, rule, name, value) for the current buffer.
         self.hits = []
         self.base_offset = None
 
+        self.prefilter = None
+        if rules_source:
+            atoms = GetPrefilterAtoms(rules_source)
+            if atoms:
+                self.prefilter = acora.AcoraBuilder(*atoms).build()
+
+    def get_worker_spec(self):
+        # Workers compile the rules once from the source.
+        if self.rules_source:
+            return "BaseYaraASScanner", dict(rules_source=self.rules_source)
+
     def _match_rules(self, buffer_as):
         """Compatibility for yara modules.
 
@@ -50,6 +193,13 @@ class BaseYaraASScanner(scan.BaseScanner):
         Yields:
           a tuple of (offset, rule_name, name, value)
         """
+        # None of the rules' literals are in the buffer.
+        if self.prefilter:
+            for _ in self.prefilter.finditer(buffer_as.data):
+                break
+            else:
+                return
+
         matches = self.rules.match(data=buffer_as.data)
         # yara-cpython bindings from pip.
         if type(matches) is dict:
@@ -69,22 +219,33 @@ class BaseYaraASScanner(scan.BaseScanner):
                     yield (match.rule, hit_offset, name, value)
 
     def check_addr(self, scan_offset, buffer_as=None):
+        """Returns a list of all the hits at scan_offset."""
         # The buffer was changed - we scan the entire buffer and record the
         # hits - then we can feed it to the Rekall scan framework.
         if self.base_offset != buffer_as.base_offset:
             self.base_offset = buffer_as.base_offset
-            self.hits = []
+            self.hits = [(offset, rule, name, value) for rule, offset, name, value
+                         in self._match_rules(buffer_as)]
+            heapq.heapify(self.hits)
 
-            for rule, offset, name, value in self._match_rules(buffer_as):
-                self.hits.append((rule, offset, name, value))
+        result = []
+        while self.hits and self.hits[0][0] <= scan_offset:
+            offset, rule, name, value = heapq.heappop(self.hits)
+            if offset == scan_offset:
+                result.append((rule, offset, name, value))
 
-        if self.hits and scan_offset == self.hits[0][1]:
-            return self.hits.pop(0)
+        return result or None
 
     def skip(self, buffer_as, offset):
         # Skip the entire buffer.
         if not self.hits:
-            return len(buffer_as.data)
+            return buffer_as.end() - offset
+
+        return self.hits[0][0] - offset
 
-        next_hit = self.hits[0][1]
-        return next_hit - offset
+    def scan(self, offset=0, maxlen=None):
+        """Yields (rule, offset, name, value) for each yara string match."""
+        for hits in super(BaseYaraASScanner, self).scan(
+                offset=offset, maxlen=maxlen):
+            for hit in hits:
+                yield hit
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import unittest
+
+from rekall import constants
+from rekall import obj
+from rekall import session
+from rekall import testlib
+
+# Import and register all the plugins.
+from rekall import plugins # pylint: disable=unused-import
+
+try:
+    from rekall.plugins import yarascanner
+except ImportError:
+    yarascanner = None
+
+
+RULES = """
+rule first {
+    strings:
+        $a = "NEEDLE"
+        $b = { 4E 45 ?? 44 4C [2-4] 45 58 }
+    condition:
+        any of them
+}
+
+rule second {
+    strings:
+        $a = "DLE" wide ascii
+    condition:
+        $a
+}
+"""
+
+
+@unittest.skipIf(yarascanner is None, "Yara is not available.")
+class PrefilterAtomsTest(testlib.RekallBaseUnitTestCase):
+    """Test the extraction of literals from yara rules."""
+
+    def testAtoms(self):
+        self.assertEqual(
+            yarascanner.GetPrefilterAtoms(RULES),
+            ["D\x00L\x00E\x00", "DLE", "NE", "NEEDLE"])
+
+        self.assertEqual(
+            yarascanner.GetPrefilterAtoms(
+                'rule r1 {strings: $a = "a\\x41\\"" condition: $a}'),
+            ['aA"'])
+
+    def testUnsupportedRules(self):
+        for rules in (
+                # Conditions which do not require a string to match.
+                'rule r1 {strings: $a = "abc" condition: not $a}',
+                'rule r1 {strings: $a = "abc" $b = "d" condition: $a and $b}',
+                'rule r1 {condition: true}',
+
+                # Strings we do not understand.
+                'rule r1 {strings: $a = "abc" nocase condition: $a}',
+                'rule r1 {strings: $a = /abc/ condition: $a}',
+                'rule r1 {strings: $a = { 41 (42 | 43) } condition: $a}',
+
+                # Anything before the rules.
+                'import "pe"\nrule r1 {strings: $a = "abc" condition: $a}'):
+            self.assertEqual(yarascanner.GetPrefilterAtoms(rules), None)
+
+
+@unittest.skipIf(yarascanner is None, "Yara is not available.")
+class YaraScannerTest(testlib.RekallBaseUnitTestCase):
+    """Test the yara scanner in all its modes."""
+
+    def setUp(self):
+        size = constants.SCAN_BLOCKSIZE * 3
+        self.offsets = [1000, constants.SCAN_BLOCKSIZE - 3,
+                        constants.SCAN_BLOCKSIZE * 2 + 17, size - 6]
+
+        data = bytearray(size)
+        for offset in self.offsets:
+            data[offset:offset + 6] = "NEEDLE"
+
+        fd, self.filename = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as fd:
+            fd.write(data)
+
+        self.session = session.Session(filename=self.filename)
+        self.address_space = self.session.plugins.load_as(
+            pas_spec="FileAddressSpace").GetPhysicalAddressSpace()
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def _Scan(self, scan_workers=0, **kwargs):
+        scanner = yarascanner.BaseYaraASScanner(
+            profile=obj.NoneObject(), session=self.session,
+            address_space=self.address_space, scan_workers=scan_workers,
+            **kwargs)
+
+        return list(scanner.scan())
+
+    def testScan(self):
+        hits = self._Scan(rules_source=RULES)
+
+        # Both rules match each needle so we must see all the hits at the
+        # same offset.
+        expected = []
+        for offset in self.offsets:
+            expected.append(("first", offset, "$a", "NEEDLE"))
+            expected.append(("second", offset + 3, "$a", "DLE"))
+
+        self.assertEqual(sorted(hits), sorted(expected))
+
+        # Hits are reported in order.
+        self.assertEqual([x[1] for x in hits], sorted(x[1] for x in hits))
+
+        # The prefilter does not change the result.
+        rules = yarascanner.yara.compile(source=RULES)
+        self.assertEqual(self._Scan(rules=rules), hits)
+
+    def testParallelScan(self):
+        self.assertEqual(self._Scan(scan_workers=4, rules_source=RULES),
+                         self._Scan(rules_source=RULES))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -21,11 +21,27 @@
 __author__ = "Michael Cohen <scudette@gmail.com>"
 
 import acora
+import cPickle
+import multiprocessing
 import re
 
 from rekall import addrspace
+from rekall import config
 from rekall import constants
+from rekall import obj
 from rekall import registry
+from rekall import session as rekall_session
+
+
+config.DeclareOption(
+    "--scan_workers", default=0, type="IntParser",
+    help="Number of worker processes used to scan physical images. "
+    "(Default 0 - scan in the main process).")
+
+# Session parameters copied into the worker sessions of a parallel scan so they
+# can re-open the same image.
+PARALLEL_SCAN_PARAMETERS = ("filename", "file_offset", "pagefile",
+                            "repository_path", "cache_dir", "buffer_size")
 
 
 class ScannerCheck(object):
@@ -49,6 +65,33 @@ class ScannerCheck(object):
     def object_offset(self, offset):
         return offset
 
+    def get_needles(self):
+        """Returns the needles this check looks for.
+
+        A ScannerGroup uses the needles to find the hits of all its scanners in
+        a single pass over the data.
+
+        Returns:
+          A list of (needle, needle_offset) tuples or None if this check does
+          not look for needles. The check can only match at offset if one of
+          the needles occurs at offset + needle_offset.
+        """
+        return None
+
+    def set_hits(self, buffer_as, hits):
+        """Receives the needle hits a ScannerGroup found in buffer_as.
+
+        Checks which search the buffer for their needles in check() can use
+        these instead of searching the same data again.
+
+        Args:
+          buffer_as: The BufferAddressSpace the group is scanning.
+          hits: A list of (needle, data_offset) tuples for the needles returned
+            by get_needles().
+        """
+        _ = buffer_as
+        _ = hits
+
     def check(self, buffer_as, offset):
         _ = offset
         _ = buffer_as
@@ -96,6 +139,7 @@ class MultiStringFinderCheck(ScannerCheck):
         if not needles:
             raise RuntimeError("No needles provided to search.")
 
+        self.needles = needles
         tree = acora.AcoraBuilder(*needles)
 
         self.engine = tree.build()
@@ -125,6 +169,13 @@ class MultiStringFinderCheck(ScannerCheck):
                 return False
         return False
 
+    def get_needles(self):
+        return [(needle, 0) for needle in self.needles]
+
+    def set_hits(self, buffer_as, hits):
+        self.hits = sorted(hits, key=lambda x: x[1], reverse=True)
+        self.base_offset = buffer_as.base_offset
+
     def skip(self, buffer_as, offset):
         # Normally the scanner calls the check method first, then the skip
         # method immediately after. We are depending on this order so self.hits
@@ -217,6 +268,9 @@ class StringCheck(ScannerCheck):
         buffer_offset = buffer_as.get_buffer_offset(offset)
         return buffer_as.data.startswith(self.needle, buffer_offset)
 
+    def get_needles(self):
+        return [(self.needle, 0)]
+
     def skip(self, buffer_as, offset):
         # Search the rest of the buffer for the needle.
         buffer_offset = buffer_as.get_buffer_offset(offset)
@@ -253,13 +307,15 @@ class BaseScanner(object):
     checks = []
 
     def __init__(self, profile=None, address_space=None, window_size=8,
-                 session=None, checks=None):
+                 session=None, checks=None, scan_workers=None):
         """The base scanner.
 
         Args:
            profile: The kernel profile to use for this scan.
            address_space: The address space we use for scanning.
            window_size: The size of the overlap window between each buffer read.
+           scan_workers: The number of worker processes to scan with. If not
+             specified we use the session's scan_workers parameter.
         """
         self.session = session or address_space.session
         self.address_space = address_space
@@ -276,6 +332,14 @@ class BaseScanner(object):
         if checks is not None:
             self.checks = checks
 
+        if scan_workers is None:
+            scan_workers = self.session.GetParameter("scan_workers", 0)
+
+        self.scan_workers = scan_workers
+
+        # Hits found for this scanner by a ScannerGroup (see scan()).
+        self.replay_hits = None
+
     def build_constraints(self):
         self.constraints = []
         for class_name, args in self.checks:
@@ -336,12 +400,185 @@ class BaseScanner(object):
           maxlen: The maximum length to scan. If not provided we just scan until
             there is no data.
 
+        Returns:
+          A generator of offsets where all the constrainst are satisfied.
+        """
+        # A ScannerGroup already found our hits in its own pass over the data.
+        # We replay them here so scanners which override scan() still process
+        # them.
+        if self.replay_hits is not None:
+            return iter(self.replay_hits)
+
+        spec = self._GetParallelScanSpec()
+        if spec is not None:
+            return self._parallel_scan(spec, offset=offset, maxlen=maxlen)
+
+        return (hit for _, hit in self._serial_scan(
+            offset=offset, maxlen=maxlen))
+
+    def has_generic_checks(self):
+        """Returns True if this scanner is entirely driven by its checks.
+
+        This is the case when the scanner does not override check_addr() or
+        skip().
+        """
+        for method in ("check_addr", "skip"):
+            if (getattr(self.__class__, method).im_func is not
+                    getattr(BaseScanner, method).im_func):
+                return False
+
+        return True
+
+    def get_worker_spec(self):
+        """Returns how to rebuild this scanner in a worker process.
+
+        Workers only run check_addr() and skip() of the rebuilt scanner. Its
+        scan() method still runs in this process on the merged hits.
+
+        Returns:
+          A tuple of (scanner class name, constructor arguments) or None if
+          this scanner can not run in a worker process. The arguments must be
+          picklable.
+        """
+        # Workers only run the generic check_addr() and skip() so scanners
+        # which override them must run in process.
+        if self.has_generic_checks():
+            return "BaseScanner", dict(checks=self.checks)
+
+    def _GetParallelScanSpec(self):
+        """Returns the spec for worker processes if we can scan in parallel.
+
+        Workers re-open the image from the session parameters and rebuild the
+        scanner from get_worker_spec(), so this is only possible for physical
+        images and for scanners which can be rebuilt from picklable arguments.
+
+        Returns:
+          A picklable dict used to initialize the workers or None if this scan
+          must run in the current process.
+        """
+        if self.scan_workers < 2:
+            return
+
+        worker_spec = self.get_worker_spec()
+        if worker_spec is None:
+            return
+
+        if (self.address_space.volatile or
+                self.address_space is not self.session.physical_address_space):
+            return
+
+        try:
+            cPickle.dumps(worker_spec, -1)
+        except (cPickle.PicklingError, TypeError) as e:
+            self.session.logging.debug(
+                "%s: Checks are not picklable, scanning in process: %s",
+                self.__class__.__name__, e)
+            return
+
+        # The specification to rebuild the physical address space stack.
+        as_names = []
+        address_space = self.address_space
+        while address_space is not None:
+            as_names.insert(0, address_space.__class__.__name__)
+            if address_space.base is address_space:
+                break
+
+            address_space = address_space.base
+
+        parameters = {}
+        for name in PARALLEL_SCAN_PARAMETERS:
+            value = self.session.state.get(name)
+            if value is not None:
+                parameters[name] = value
+
+        profile_name = None
+        if isinstance(self.profile, obj.Profile):
+            profile_name = self.profile.name
+
+        return dict(pas_spec=":".join(as_names),
+                    parameters=parameters,
+                    profile=profile_name,
+                    scanner=worker_spec,
+                    window_size=self.window_size,
+                    overlap=self.overlap)
+
+    def _get_shards(self, offset, end):
+        """Partitions the address ranges between offset and end into shards.
+
+        Each shard is a (start, end) tuple covering about the same amount of
+        mapped data. Shards overlap their predecessor by self.overlap bytes so
+        hits straddling the shard boundary are still found.
+        """
+        ranges = list(self.address_space.get_address_ranges(
+            start=offset, end=end))
+        total_length = sum(length for _, _, length in ranges)
+
+        # Make a few shards per worker so the load stays balanced.
+        shard_size = max(constants.SCAN_BLOCKSIZE,
+                         total_length // (self.scan_workers * 4) + 1)
+
+        shard_start = None
+        shard_length = 0
+        range_offset = offset
+        for range_start, _, length in ranges:
+            range_offset = range_start
+            range_end = range_start + length
+            while range_offset < range_end:
+                if shard_start is None:
+                    shard_start = range_offset
+
+                to_take = min(shard_size - shard_length,
+                              range_end - range_offset)
+                range_offset += to_take
+                shard_length += to_take
+
+                if shard_length >= shard_size:
+                    yield max(offset, shard_start - self.overlap), range_offset
+                    shard_start = None
+                    shard_length = 0
+
+        if shard_start is not None:
+            yield max(offset, shard_start - self.overlap), range_offset
+
+    def _parallel_scan(self, spec, offset=0, maxlen=None):
+        """Scans the shards in a process pool and merges hits in order."""
+        maxlen = maxlen or 2**64
+        shards = list(self._get_shards(offset, offset + maxlen))
+
+        # Record the last reported hit to prevent multiple reporting of the same
+        # hits in the overlap between shards.
+        last_reported_hit = -1
+
+        pool = multiprocessing.Pool(self.scan_workers,
+                                    initializer=_InitScanWorker,
+                                    initargs=(spec,))
+        try:
+            # imap() returns the shard results in order so the hits are still
+            # sorted by offset.
+            for i, hits in enumerate(pool.imap(_ScanShard, shards)):
+                self.session.report_progress(
+                    "Scanned shard %(shard)d/%(total)d with %(name)s",
+                    shard=i + 1, total=len(shards),
+                    name=self.__class__.__name__)
+
+                for hit_offset, hit in hits:
+                    if hit_offset > last_reported_hit:
+                        last_reported_hit = hit_offset
+                        yield hit
+
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _serial_scan(self, offset=0, maxlen=None):
+        """Scans the region in the current process.
+
         Yields:
-          offsets where all the constrainst are satisfied.
+          (offset, hit) tuples, where hit is the result of check_addr().
         """
         maxlen = maxlen or 2**64
         end = offset + maxlen
-        overlap = ""
 
         # Record the last reported hit to prevent multiple reporting of the same
         # hits when using an overlap.
@@ -356,73 +593,57 @@ class BaseScanner(object):
         # and then passing up to constants.SCAN_BLOCKSIZE bytes to the checkers
         # and skippers.
         #
-        # If range has less data than the block size, then the full range is
-        # scanned at once.
+        # Ranges which are virtually contiguous are scanned as a single
+        # region, even if they are not physically contiguous. Each chunk is
+        # gathered from the physical runs making up the region, so the
+        # checkers see large blocks instead of many page sized ones.
         #
-        # If a range is larger than the block size, it's split in chunks until
+        # If a region is larger than the block size, it's split in chunks until
         # it's fully consumed. Overlap is applied only in this case, starting
         # from the second chunk.
-        chunk_end = 0
-
-        for run in self.address_space.get_address_ranges(start=offset, end=end):
-            range_start, phys_start, length = run
-
-            # Find a new range if offset is past this range.
-            range_end = range_start + length
-            if range_end < offset:
-                continue
-
-            # Stop searching for ranges if this is past end.
-            if range_start > end:
-                break
+        buffer_as = addrspace.BufferAddressSpace(session=self.session)
 
-            # Calculate where in the range we'll be reading data from.
-            # Covers the case where offset falls within a range.
-            start = max(range_start, offset)
+        for runs in self.address_space.get_gather_ranges(
+                start=offset, end=end):
+            region_start = runs[0][0]
+            region_end = runs[-1][0] + runs[-1][2]
 
             # Store where this chunk will start. Absolute offset.
-            chunk_offset = start
-
-            buffer_as = addrspace.BufferAddressSpace(session=self.session)
+            chunk_offset = chunk_end = region_start
 
-            # Keep scanning this range as long as the current chunk isn't
-            # past the end of the range or the end of the scanner.
-            while chunk_offset < end and chunk_offset < range_end:
+            # Keep scanning this region as long as the current chunk isn't
+            # past the end of the region.
+            while chunk_offset < region_end:
                 if self.session:
                     self.session.report_progress(
                         self.progress_message % dict(
                             offset=chunk_offset,
                             name=self.__class__.__name__))
 
-                # This chunk does not begin where the last chunk ended - this
-                # means there is a gap in the virtual address space and
-                # therefore we should not use any overlap.
-                if chunk_offset != chunk_end:
-                    overlap = ""
-
-                chunk_offset = max(start, chunk_offset)
+                # If the skippers moved us past the end of the last chunk we
+                # should not use any overlap.
+                overlap = 0
+                if chunk_offset == chunk_end:
+                    overlap = min(self.overlap, chunk_offset - region_start)
 
                 # Our chunk is SCAN_BLOCKSIZE long or as much data there's
-                # left in the range.
+                # left in the region.
                 chunk_size = min(constants.SCAN_BLOCKSIZE,
-                                 range_end - chunk_offset)
-
-                # Adjust chunk_size if the chunk we're gonna read goes past
-                # the end or we could end up scanning more data than requested.
-                chunk_size = min(chunk_size, end - chunk_offset)
+                                 region_end - chunk_offset)
 
                 chunk_end = chunk_offset + chunk_size
 
-                phys_chunk_offset = phys_start + (chunk_offset - range_start)
+                # Release the previous block before reading the next one so we
+                # only ever hold a single block in memory.
+                buffer_as.assign_buffer("")
 
-                # Consume the next block in this range.
+                # Consume the next block in this region. The overlap is read
+                # together with the block rather than copying the whole block
+                # again to prepend it.
                 buffer_as.assign_buffer(
-                    overlap + self.address_space.phys_base.read(
-                        phys_chunk_offset, chunk_size),
-                    base_offset=chunk_offset - len(overlap))
-
-                if self.overlap > 0:
-                    overlap = buffer_as.data[-self.overlap:]
+                    self.address_space.read_runs(
+                        runs, chunk_offset - overlap, chunk_size + overlap),
+                    base_offset=chunk_offset - overlap)
 
                 scan_offset = buffer_as.base_offset
                 while scan_offset < buffer_as.end():
@@ -433,7 +654,7 @@ class BaseScanner(object):
                     # have previously reported.
                     if res is not None and scan_offset > last_reported_hit:
                         last_reported_hit = scan_offset
-                        yield res
+                        yield scan_offset, res
 
                     # Skip as much data as the skippers tell us to, up to the
                     # end of the buffer.
@@ -443,6 +664,51 @@ class BaseScanner(object):
                 chunk_offset = scan_offset
 
 
+# The scanner of a parallel scan worker process. It is built once per process
+# by _InitScanWorker().
+_WORKER_SCANNER = None
+
+
+def _InitScanWorker(spec):
+    """Re-opens the image and builds the scanner in a worker process."""
+    global _WORKER_SCANNER  # pylint: disable=global-statement
+
+    try:
+        worker_session = rekall_session.Session()
+        with worker_session.state as state:
+            for k, v in spec["parameters"].iteritems():
+                state.Set(k, v)
+
+        address_space = worker_session.plugins.load_as(
+            pas_spec=spec["pas_spec"]).GetPhysicalAddressSpace()
+
+        profile = obj.NoneObject("No profile for scan worker.")
+        if spec["profile"]:
+            profile = worker_session.LoadProfile(spec["profile"])
+
+        scanner_name, scanner_args = spec["scanner"]
+        _WORKER_SCANNER = BaseScanner.classes[scanner_name](
+            profile=profile, address_space=address_space,
+            session=worker_session, window_size=spec["window_size"],
+            scan_workers=0, **scanner_args)
+        _WORKER_SCANNER.overlap = spec["overlap"]
+
+    # Raising here would make the pool restart the worker forever, so we report
+    # the error from the first shard instead.
+    except Exception as e:  # pylint: disable=broad-except
+        _WORKER_SCANNER = e
+
+
+def _ScanShard(shard):
+    """Scans one (start, end) shard in a worker process."""
+    if isinstance(_WORKER_SCANNER, Exception):
+        raise _WORKER_SCANNER
+
+    start, end = shard
+    return list(_WORKER_SCANNER._serial_scan(  # pylint: disable=protected-access
+        offset=start, maxlen=end - start))
+
+
 class MultiStringScanner(BaseScanner):
     """A scanner for multiple strings at once."""
 
@@ -509,7 +775,14 @@ class PointerScanner(BaseScanner):
 
 
 class ScannerGroup(BaseScanner):
-    """Runs a bunch of scanners in one pass over the image."""
+    """Runs a bunch of scanners in one pass over the image.
+
+    The needles of all the scanners which look for needles (e.g. with a
+    StringCheck, MultiStringFinderCheck or PoolTagCheck) are compiled into a
+    single automaton. Each block is read once and every needle hit is checked
+    with the remaining checks of the scanner owning the needle. Scanners which
+    can not be driven this way are run one after the other as before.
+    """
 
     def __init__(self, scanners=None, **kwargs):
         """Create a new scanner group.
@@ -523,25 +796,144 @@ class ScannerGroup(BaseScanner):
         for scanner in scanners.values():
             scanner.address_space = self.address_space
 
-        # A dict to hold all hits for each scanner.
+            # The group feeds its scanners one block at a time so they must
+            # not start their own worker pools.
+            scanner.scan_workers = 0
+
+        # A dict to hold all hits for each scanner run from the automaton.
         self.result = {}
 
-    def scan(self, offset=0, maxlen=None):
-        available_length = maxlen or self.profile.get_constant("MaxPointer")
+        # Maps each needle to a list of (name, needle_offset) tuples.
+        self.needles = {}
 
-        while available_length > 0:
-            to_read = min(constants.SCAN_BLOCKSIZE + self.overlap,
-                          available_length)
+        # Maps the name of each scanner run from the automaton to the check
+        # providing its needles.
+        self.needle_checks = {}
+        self.engine = None
 
-            # Now feed all the scanners from the same address space.
-            for name, scanner in self.scanners.items():
-                for hit in scanner.scan(offset=offset, maxlen=to_read):
-                    # Yield the result as well as cache it.
-                    yield name, hit
+        # The scanners which do not use the automaton.
+        self.other_scanners = {}
 
-            # Move to the next scan block.
-            offset += constants.SCAN_BLOCKSIZE
-            available_length -= constants.SCAN_BLOCKSIZE
+        # The candidate hits in the current buffer, sorted in reverse.
+        self.candidates = []
+
+    def _get_needle_check(self, scanner):
+        """Returns the check whose needles a hit of this scanner must contain.
+
+        Returns:
+          A ScannerCheck or None if the scanner can not be run from the
+          automaton.
+        """
+        if not scanner.has_generic_checks():
+            return
+
+        if scanner.constraints is None:
+            scanner.build_constraints()
+
+        # Every check must match for a hit so any of them will do.
+        for check in scanner.constraints:
+            if check.get_needles():
+                return check
+
+    def build_constraints(self):
+        super(ScannerGroup, self).build_constraints()
+
+        for name, scanner in self.scanners.iteritems():
+            check = self._get_needle_check(scanner)
+            if check is None:
+                self.other_scanners[name] = scanner
+                continue
+
+            self.needle_checks[name] = check
+            for needle, needle_offset in check.get_needles():
+                owners = self.needles.setdefault(needle, [])
+                if (name, needle_offset) not in owners:
+                    owners.append((name, needle_offset))
+
+        if self.needles:
+            self.engine = acora.AcoraBuilder(*self.needles).build()
+
+    def _find_candidates(self, buffer_as):
+        """Finds the offsets in the buffer where any scanner may match."""
+        if buffer_as.base_offset == self.base_offset:
+            return
+
+        self.base_offset = buffer_as.base_offset
+        candidates = set()
+        check_hits = dict((name, []) for name in self.needle_checks)
+        for needle, data_offset in self.engine.findall(buffer_as.data):
+            for name, needle_offset in self.needles[needle]:
+                check_hits[name].append((needle, data_offset))
+                offset = buffer_as.base_offset + data_offset - needle_offset
+                if offset >= buffer_as.base_offset:
+                    candidates.add((offset, name))
+
+        # Hand the hits to the checks so they do not search the buffer again
+        # when the member scanners are checked.
+        for name, check in self.needle_checks.iteritems():
+            check.set_hits(buffer_as, check_hits[name])
+
+        self.candidates = sorted(candidates, reverse=True)
+
+    def check_addr(self, offset, buffer_as=None):
+        """Returns a list of (name, hit) for the scanners matching offset."""
+        self._find_candidates(buffer_as)
+
+        hits = []
+        while self.candidates and self.candidates[-1][0] <= offset:
+            candidate, name = self.candidates.pop()
+
+            # The skipper never moves past a candidate so this is only the case
+            # for candidates in the overlap which were already checked.
+            if candidate < offset:
+                continue
+
+            hit = self.scanners[name].check_addr(offset, buffer_as=buffer_as)
+            if hit is not None:
+                hits.append((name, hit))
+
+        return hits or None
+
+    def skip(self, buffer_as, offset):
+        self._find_candidates(buffer_as)
+
+        if self.candidates:
+            return self.candidates[-1][0] - offset
+
+        # No more candidates in this buffer, skip it.
+        return buffer_as.end() - offset
+
+    def _replay_hit(self, scanner, hit):
+        """Yields what scanner.scan() yields for a hit found by the group."""
+        scanner.replay_hits = [hit]
+        try:
+            for result in scanner.scan(offset=hit, maxlen=1):
+                yield result
+        finally:
+            scanner.replay_hits = None
+
+    def scan(self, offset=0, maxlen=None):
+        maxlen = maxlen or self.profile.get_constant("MaxPointer")
+
+        if self.constraints is None:
+            self.build_constraints()
+
+        # Forget the candidates of a previous scan.
+        self.base_offset = None
+        self.candidates = []
+
+        if self.engine is not None:
+            for hits in super(ScannerGroup, self).scan(
+                    offset=offset, maxlen=maxlen):
+                for name, hit in hits:
+                    self.result.setdefault(name, []).append(hit)
+                    for result in self._replay_hit(self.scanners[name], hit):
+                        yield name, result
+
+        # Now run the remaining scanners over the same range.
+        for name, scanner in self.other_scanners.iteritems():
+            for hit in scanner.scan(offset=offset, maxlen=maxlen):
+                yield name, hit
 
 
 class DiscontigScannerGroup(ScannerGroup):
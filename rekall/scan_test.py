@@ -0,0 +1,143 @@
+import os
+import tempfile
+import unittest
+
+from rekall import addrspace
+from rekall import constants
+from rekall import obj
+from rekall import scan
+from rekall import session
+from rekall import testlib
+
+# Import and register all the plugins.
+from rekall import plugins # pylint: disable=unused-import
+
+
+class ParallelScanTest(testlib.RekallBaseUnitTestCase):
+    """Test the parallel scan engine against the serial scanner."""
+
+    def setUp(self):
+        # Place needles throughout an image spanning several scan blocks,
+        # including one straddling a block boundary.
+        self.needle = "NEEDLE"
+        size = constants.SCAN_BLOCKSIZE * 3
+        self.offsets = [0, 1000, constants.SCAN_BLOCKSIZE - 3,
+                        constants.SCAN_BLOCKSIZE * 2 + 17, size - 6]
+
+        data = bytearray(size)
+        for offset in self.offsets:
+            data[offset:offset + len(self.needle)] = self.needle
+
+        fd, self.filename = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as fd:
+            fd.write(data)
+
+        self.session = session.Session(filename=self.filename)
+        self.address_space = self.session.plugins.load_as(
+            pas_spec="FileAddressSpace").GetPhysicalAddressSpace()
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def _Scan(self, scan_workers):
+        scanner = scan.BaseScanner(
+            profile=obj.NoneObject(), session=self.session,
+            address_space=self.address_space, scan_workers=scan_workers,
+            checks=[("StringCheck", dict(needle=self.needle))])
+
+        return list(scanner.scan())
+
+    def testParallelScan(self):
+        self.assertEqual(self._Scan(0), self.offsets)
+        self.assertEqual(self._Scan(4), self.offsets)
+
+    def testUnpicklableChecksScanInProcess(self):
+        scanner = scan.BaseScanner(
+            profile=obj.NoneObject(), session=self.session,
+            address_space=self.address_space, scan_workers=4,
+            checks=[("StringCheck", dict(needle=lambda: None))])
+
+        self.assertEqual(scanner._GetParallelScanSpec(), None)
+
+
+class EvenHitsScanner(scan.BaseScanner):
+    """A scanner which post-processes its hits in scan()."""
+
+    def scan(self, offset=0, maxlen=None):
+        for hit in super(EvenHitsScanner, self).scan(
+                offset=offset, maxlen=maxlen):
+            if hit % 2 == 0:
+                yield "even", hit
+
+
+class ScannerGroupTest(testlib.RekallBaseUnitTestCase):
+    """Test the single pass scanner group against the member scanners."""
+
+    def setUp(self):
+        size = constants.SCAN_BLOCKSIZE * 3
+        data = bytearray(size)
+        for needle, offsets in (
+                ("NEEDLE", [0, 1000, constants.SCAN_BLOCKSIZE - 3, size - 6]),
+                ("FOO", [11, 2000, constants.SCAN_BLOCKSIZE * 2 - 1]),
+                ("BARBAZ", [2003, constants.SCAN_BLOCKSIZE + 10]),
+                ("TAIL", [12345, 12350])):
+            for offset in offsets:
+                data[offset:offset + len(needle)] = needle
+
+        self.session = session.Session()
+        self.address_space = addrspace.BufferAddressSpace(
+            session=self.session, data=str(data))
+
+    def _MakeScanners(self):
+        kwargs = dict(profile=obj.NoneObject(), session=self.session,
+                      address_space=self.address_space)
+
+        return dict(
+            string=scan.BaseScanner(
+                checks=[("StringCheck", dict(needle="NEEDLE"))], **kwargs),
+            multi=scan.BaseScanner(
+                checks=[("MultiStringFinderCheck", dict(
+                    needles=["FOO", "BARBAZ"]))], **kwargs),
+            even=EvenHitsScanner(
+                checks=[("StringCheck", dict(needle="FOO"))], **kwargs),
+            tail=scan.MultiStringScanner(needles=["TAIL"], **kwargs))
+
+    def testScannerGroup(self):
+        expected = set()
+        for name, scanner in self._MakeScanners().iteritems():
+            for hit in scanner.scan(maxlen=len(self.address_space)):
+                expected.add((name, hit))
+
+        group = scan.ScannerGroup(
+            scanners=self._MakeScanners(), profile=obj.NoneObject(),
+            session=self.session, address_space=self.address_space)
+
+        hits = list(group.scan(maxlen=len(self.address_space)))
+        self.assertEqual(len(expected), 12)
+        self.assertEqual(len(hits), len(expected))
+        self.assertEqual(set(hits), expected)
+
+        # The MultiStringScanner overrides check_addr() so it is not run from
+        # the automaton.
+        self.assertEqual(group.other_scanners.keys(), ["tail"])
+
+    def testNeedleChecksUseGroupHits(self):
+        expected = list(self._MakeScanners()["multi"].scan(
+            maxlen=len(self.address_space)))
+
+        group = scan.ScannerGroup(
+            scanners=self._MakeScanners(), profile=obj.NoneObject(),
+            session=self.session, address_space=self.address_space)
+        group.build_constraints()
+
+        # The member check must not search the buffer itself.
+        group.needle_checks["multi"].engine = None
+
+        hits = [hit for name, hit in group.scan(maxlen=len(self.address_space))
+                if name == "multi"]
+        self.assertEqual(len(expected), 5)
+        self.assertEqual(sorted(hits), sorted(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,6 +26,7 @@ way for people to save their own results.
 
 __author__ = "Michael Cohen <scudette@gmail.com>"
 
+import contextlib
 import logging
 import os
 import pdb
@@ -34,6 +35,7 @@ import time
 import traceback
 import weakref
 
+from rekall import addrspace
 from rekall import cache
 from rekall import config
 from rekall import io_manager
@@ -41,6 +43,7 @@ from rekall import kb
 from rekall import obj
 from rekall import plugin
 from rekall import registry
+from rekall import threadpool
 from rekall import utils
 
 from rekall.entities import manager as entity_manager
@@ -62,6 +65,16 @@ config.DeclareOption(
     help="The maximum size of buffers we are allowed to read. "
     "This is used to control Rekall memory usage.")
 
+config.DeclareOption(
+    "--profile_prefetch_threads", default=4, type="IntParser",
+    help="The number of threads used to fetch profiles from the repositories "
+    "concurrently.")
+
+config.DeclareOption(
+    "--minimized_profiles", default=False, type="Boolean",
+    help="Prefer the minimized profiles in the repositories (built with the "
+    "minimize_profile plugin) when present.")
+
 config.DeclareOption(
     "--output", default=None,
     help="If specified we write output to this file.")
@@ -431,6 +444,10 @@ class Session(object):
         # Cache the profiles we get from LoadProfile() below.
         self.profile_cache = {}
 
+        # A persistent cache of the profile data LoadProfile() reads from the
+        # repositories.
+        self.profile_data_cache = cache.ProfileCache(self)
+
         self.entities = entity_manager.EntityManager(session=self)
 
         # A container for active plugins. This is done so that the interactive
@@ -445,6 +462,10 @@ class Session(object):
         self.context_cache = {}
         self._repository_managers = []
 
+        # Address translations and paging structures shared by all the address
+        # spaces in this session.
+        self.translation_cache = addrspace.TranslationCache()
+
         # Store user configurable attributes here. These will be read/written to
         # the configuration file.
         self.state = Configuration(session=self)
@@ -526,6 +547,7 @@ class Session(object):
         self.profile_cache = {}
         self.physical_address_space = None
         self.kernel_address_space = None
+        self.translation_cache.Flush()
         self.cache.Clear()
 
     @property
@@ -783,28 +805,33 @@ class Session(object):
         if not result:
             # Add the last supported repository as the last fallback path.
             for path, manager in self.repository_managers:
-                try:
-                    # The inventory allows us to fail fetching the profile
-                    # quickly - without making the round trip.
-                    if not manager.CheckInventory(name):
+                for repository_name in self._GetRepositoryNames(name):
+                    try:
+                        # The inventory allows us to fail fetching the profile
+                        # quickly - without making the round trip.
+                        if not manager.CheckInventory(repository_name):
+                            self.logging.debug(
+                                "Skipped profile %s from %s (Not in inventory)",
+                                repository_name, path)
+                            continue
+
+                        result = obj.Profile.LoadProfileFromData(
+                            self.profile_data_cache.GetData(
+                                manager, repository_name),
+                            self, name=name)
+                        if result:
+                            self.logging.info("Loaded profile %s from %s",
+                                              repository_name, manager)
+                            break
+
+                    except (IOError, KeyError) as e:
+                        result = obj.NoneObject(e)
                         self.logging.debug(
-                            "Skipped profile %s from %s (Not in inventory)",
-                            name, path)
-                        continue
-
-                    result = obj.Profile.LoadProfileFromData(
-                        manager.GetData(name), self, name=name)
-                    if result:
-                        self.logging.info(
-                            "Loaded profile %s from %s", name, manager)
-                        break
-
-                except (IOError, KeyError) as e:
-                    result = obj.NoneObject(e)
-                    self.logging.debug("Could not find profile %s in %s: %s",
-                                       name, path, e)
+                            "Could not find profile %s in %s: %s",
+                            repository_name, path, e)
 
-                    continue
+                if result:
+                    break
 
         # Cache it for later. Note that this also caches failures so we do not
         # retry again.
@@ -815,6 +842,82 @@ class Session(object):
 
         return result
 
+    def _GetRepositoryNames(self, name):
+        """The names to look for the profile under in each repository.
+
+        Minimized profiles (see the minimize_profile plugin) are stored under
+        the "minimized/" prefix and are preferred if requested.
+        """
+        if self.GetParameter("minimized_profiles", False):
+            return ["minimized/" + name, name]
+
+        return [name]
+
+    def PrefetchProfiles(self, names):
+        """Load many profiles concurrently into the profile cache.
+
+        The profile data is fetched and decoded from the repositories by a pool
+        of threads, then the profiles are built and cached so subsequent
+        LoadProfile() calls return immediately. Profiles which can not be
+        fetched are not cached, so LoadProfile() will still try all its
+        fallbacks for them.
+
+        Args:
+          names: A list of canonical profile names.
+        """
+        names = set(name.replace("\\", "/") for name in names if name)
+        names = sorted(name for name in names if name not in self.profile_cache)
+
+        threads = self.GetParameter("profile_prefetch_threads", 4)
+        if not names or not threads:
+            return
+
+        # Initialize all the lazily created state before starting the threads.
+        managers = self.repository_managers
+        for _, manager in managers:
+            _ = manager.inventory
+
+        _ = self.profile_data_cache.io_manager
+
+        fetched = {}
+        def _Fetch(name):
+            for path, manager in managers:
+                for repository_name in self._GetRepositoryNames(name):
+                    try:
+                        if not manager.CheckInventory(repository_name):
+                            continue
+
+                        data = self.profile_data_cache.GetData(
+                            manager, repository_name)
+                        if data:
+                            fetched[name] = (manager, data)
+                            return
+
+                    except (IOError, KeyError) as e:
+                        self.logging.debug(
+                            "Could not find profile %s in %s: %s",
+                            repository_name, path, e)
+
+        # Managers which cache their data locally only update their inventory
+        # once all the threads are done.
+        with contextlib.nested(*[manager.BatchWrites()
+                                 for _, manager in managers]):
+            pool = threadpool.ThreadPool(min(threads, len(names)))
+            for name in names:
+                pool.AddTask(_Fetch, [name])
+
+            pool.Stop()
+
+        for name in names:
+            if name not in fetched:
+                continue
+
+            manager, data = fetched[name]
+            result = obj.Profile.LoadProfileFromData(data, self, name=name)
+            if result:
+                self.logging.info("Loaded profile %s from %s", name, manager)
+                self.profile_cache[name] = result
+
     def __unicode__(self):
         return u"Session"
 
@@ -1089,7 +1192,11 @@ Config:
 
 Cache (%r):
 %s
-""" % (time.ctime(self._start_time), self.state, self.cache, self.cache)
+
+Translation Cache:
+  %s
+""" % (time.ctime(self._start_time), self.state, self.cache, self.cache,
+       self.translation_cache)
         return result
 
     def __dir__(self):
@@ -0,0 +1,74 @@
+import unittest
+
+from rekall import session
+from rekall import testlib
+
+# Import and register all the plugins.
+from rekall import plugins # pylint: disable=unused-import
+
+
+class LoadProfileTest(testlib.RepositoryTestCase):
+    """Test loading profiles from the repositories."""
+
+    NAMES = ["mod%d/GUID/%d" % (i, i) for i in range(10)]
+
+    def setUp(self):
+        super(LoadProfileTest, self).setUp()
+        for i, name in enumerate(self.NAMES):
+            profile = dict(testlib.TEST_PROFILE)
+            profile["$CONSTANTS"] = dict(first=i)
+            self.repository.StoreData(name, profile)
+
+        self.session = session.Session(cache_dir=None)
+        self.session._repository_managers = [  # pylint: disable=protected-access
+            ("test", self.repository)]
+
+    def testPrefetchProfiles(self):
+        self.session.PrefetchProfiles(self.NAMES + ["missing/GUID/1"])
+        self.assertEqual(sorted(self.repository.reads), self.NAMES)
+
+        for i, name in enumerate(self.NAMES):
+            profile = self.session.LoadProfile(name)
+            self.assertEqual(profile.get_constant("first"), i)
+            self.assertEqual(profile.name, name)
+
+        # Loading the prefetched profiles does not read the repository again.
+        self.assertEqual(len(self.repository.reads), len(self.NAMES))
+
+        # Missing profiles are not cached so LoadProfile() can try harder.
+        self.assertFalse("missing/GUID/1" in self.session.profile_cache)
+
+        # Prefetching again does nothing.
+        self.session.PrefetchProfiles(self.NAMES)
+        self.assertEqual(len(self.repository.reads), len(self.NAMES))
+
+    def testDisabled(self):
+        self.session.SetParameter("profile_prefetch_threads", 0)
+        self.session.PrefetchProfiles(self.NAMES)
+        self.assertEqual(self.repository.reads, [])
+        self.assertEqual(self.session.profile_cache, {})
+
+    def testMinimizedProfiles(self):
+        minimized = dict(testlib.TEST_PROFILE)
+        minimized["$CONSTANTS"] = dict(first=100)
+        self.repository.StoreData("minimized/" + self.NAMES[0], minimized)
+
+        self.assertEqual(
+            self.session.LoadProfile(self.NAMES[0]).get_constant("first"), 0)
+
+        test_session = session.Session(minimized_profiles=True)
+        test_session._repository_managers = [  # pylint: disable=protected-access
+            ("test", self.repository)]
+
+        # The minimized profile is preferred but the name stays the same.
+        profile = test_session.LoadProfile(self.NAMES[0])
+        self.assertEqual(profile.get_constant("first"), 100)
+        self.assertEqual(profile.name, self.NAMES[0])
+
+        # Profiles without a minimized version are still found.
+        self.assertEqual(
+            test_session.LoadProfile(self.NAMES[1]).get_constant("first"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
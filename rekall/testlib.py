@@ -54,11 +54,14 @@ import subprocess
 import pdb
 import os
 import shutil
+import struct
 import sys
 import tempfile
 import unittest
 
+from rekall import addrspace
 from rekall import config
+from rekall import io_manager
 from rekall import plugin
 from rekall import registry
 from rekall import session as rekall_session
@@ -330,3 +333,100 @@ class HashChecker(SimpleTestCase):
 
     def testCase(self):
         self.assertEqual(self.baseline['hashes'], self.current['hashes'])
+
+
+# A small profile for tests which need a profile repository.
+TEST_PROFILE = {
+    "$METADATA": dict(ProfileClass="Profile32Bits", Type="Profile"),
+    "$CONSTANTS": dict(first=0x2000, second=0x1000),
+    "$FUNCTIONS": dict(function=0x3000),
+    "$STRUCTS": {
+        "Test": [4, {"field": [0, ["unsigned int"]]}],
+        },
+    }
+
+
+class RecordingDirectoryIOManager(io_manager.DirectoryIOManager):
+    """A repository which records how it is used by the tests."""
+
+    # Only used by the tests and must not be selected by io_manager.Factory().
+    __abstract = True
+
+    def __init__(self, **kwargs):
+        super(RecordingDirectoryIOManager, self).__init__(**kwargs)
+        self.reads = []
+        self.inventory_writes = 0
+
+    def GetData(self, name, **kwargs):
+        if name != "inventory":
+            self.reads.append(name)
+
+        return super(RecordingDirectoryIOManager, self).GetData(name, **kwargs)
+
+    def Create(self, name):
+        if name == "inventory":
+            self.inventory_writes += 1
+
+        return super(RecordingDirectoryIOManager, self).Create(name)
+
+
+class RepositoryTestCase(RekallBaseUnitTestCase):
+    """A test with a writable profile repository in a temporary directory.
+
+    The repository starts with an empty inventory and is available as
+    self.repository.
+    """
+
+    __abstract = True
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.repository_path = os.path.join(self.temp_dir, "repository")
+        self.repository = RecordingDirectoryIOManager(
+            urn=self.repository_path, mode="w", version="",
+            session=rekall_session.Session())
+        self.repository.StoreData("inventory", {
+            "$METADATA": dict(Type="Inventory", ProfileClass="Inventory"),
+            "$INVENTORY": {}})
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, True)
+
+
+class RecordingBufferAddressSpace(addrspace.BufferAddressSpace):
+    """A BufferAddressSpace which records the (addr, length) of its reads."""
+
+    # Only used by the tests and must not be selected as an address space.
+    __abstract = True
+
+    def __init__(self, **kwargs):
+        super(RecordingBufferAddressSpace, self).__init__(**kwargs)
+        self.reads = []
+
+    def read(self, addr, length):
+        self.reads.append((addr, length))
+        return super(RecordingBufferAddressSpace, self).read(addr, length)
+
+
+class SyntheticPageTables(object):
+    """Builds a physical memory image containing page tables."""
+
+    def __init__(self, entry_format="<Q", size=0x400000):
+        self.entry_format = entry_format
+        self.entry_size = struct.calcsize(entry_format)
+        self.data = bytearray(size)
+
+    def fill_pattern(self):
+        """Fills the image with a pattern so reads from different pages differ.
+
+        Tables must be cleared with clear_table() before they are used.
+        """
+        for page in range(0, len(self.data), 0x1000):
+            struct.pack_into("<I", self.data, page, page)
+
+    def set_entry(self, table_addr, index, value):
+        struct.pack_into(self.entry_format, self.data,
+                         table_addr + index * self.entry_size, value)
+
+    def clear_table(self, table_addr):
+        self.data[table_addr:table_addr + 0x1000] = "\x00" * 0x1000
@@ -848,6 +848,47 @@ class RangedCollection(object):
             return None
 
 
+class IntervalIndex(object):
+    """An index of ranges which is built all at once.
+
+    Unlike RangedCollection, which inserts the ranges one at a time, the index
+    is sorted once when it is built. Items are tuples which start with (start,
+    end).
+    """
+
+    def __init__(self, items=()):
+        self._items = sorted(items, key=lambda x: x[0])
+        self._starts = [int(x[0]) for x in self._items]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __getitem__(self, i):
+        return self._items[i]
+
+    def find_le(self, value):
+        """Returns the last item starting at or below value.
+
+        Raises ValueError if not found.
+        """
+        i = bisect.bisect_right(self._starts, value)
+        if i:
+            return self._items[i-1]
+
+        raise ValueError("No range found at or below: %r" % (value,))
+
+    def get_range(self, value):
+        """Returns the item with the range that contains value or None."""
+        i = bisect.bisect_right(self._starts, value)
+        if i:
+            item = self._items[i-1]
+            if value < item[1]:
+                return item
+
+
 class JITIterator(object):
     def __init__(self, baseclass):
         self.baseclass = baseclass
@@ -0,0 +1,37 @@
+import unittest
+
+from rekall import testlib
+from rekall import utils
+
+
+class IntervalIndexTest(testlib.RekallBaseUnitTestCase):
+    """Test the interval index."""
+
+    def setUp(self):
+        self.index = utils.IntervalIndex([
+            (0x5000, 0x6000, "c"),
+            (0x1000, 0x2000, "a"),
+            (0x3000, 0x5000, "b"),
+            ])
+
+    def testIteration(self):
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual([x[2] for x in self.index], ["a", "b", "c"])
+        self.assertEqual(self.index[-1], (0x5000, 0x6000, "c"))
+
+    def testGetRange(self):
+        self.assertEqual(self.index.get_range(0x1000)[2], "a")
+        self.assertEqual(self.index.get_range(0x1fff)[2], "a")
+        self.assertEqual(self.index.get_range(0x2000), None)
+        self.assertEqual(self.index.get_range(0x4fff)[2], "b")
+        self.assertEqual(self.index.get_range(0x5000)[2], "c")
+        self.assertEqual(self.index.get_range(0xfff), None)
+        self.assertEqual(self.index.get_range(0x6000), None)
+
+    def testFindLe(self):
+        self.assertEqual(self.index.find_le(0x2800)[2], "a")
+        self.assertRaises(ValueError, self.index.find_le, 0xfff)
+
+
+if __name__ == "__main__":
+    unittest.main()
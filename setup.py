@@ -26,9 +26,9 @@ __author__ = "Michael Cohen <scudette@gmail.com>"
 import sys
 
 try:
-    from setuptools import find_packages, setup
+    from setuptools import find_packages, setup, Extension
 except ImportError:
-    from distutils.core import find_packages, setup
+    from distutils.core import find_packages, setup, Extension
 
 # Change PYTHONPATH to include rekall so that we can get the version.
 sys.path.insert(0, '.')
@@ -57,6 +57,13 @@ setup(
     packages=find_packages('.'),
     include_package_data=True,
 
+    # The native address space implementations. Rekall falls back to the pure
+    # Python implementations if this can not be built.
+    ext_modules=[
+        Extension("rekall.support", sources=["src/support.c"],
+                  depends=["src/support.h"], optional=True),
+    ],
+
     entry_points={
         "console_scripts": [
             "rekal = rekall.rekal:main",
@@ -1,10 +1,10 @@
 from distutils.core import setup, Extension
 
-pysupport = Extension('volatility.support',
+pysupport = Extension('rekall.support',
                       sources = ['src/support.c'],
-                      extra_compile_args=["-O0"])
+                      depends = ['src/support.h'])
 
 setup(name='support',
       version='0.5',
-      description='Support clases for volatility.',
+      description='Support clases for rekall.',
       ext_modules=[pysupport])
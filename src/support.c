@@ -8,505 +8,474 @@
 #include "support.h"
 
 
-static int _read_from_python_base(AMD64PagedMemory *self,
-                                  uint64_t offset,
-                                  uint64_t length, char *out) {
-  PyObject *buffer = PyObject_CallMethod(self->base, "read", "Ki", offset,
-                                         length);
-  char *data;
-  Py_ssize_t buffer_length;
-
-  if (!buffer) goto error;
-
-  PyString_AsStringAndSize(buffer, &data, &buffer_length);
+/* The paging modes. The first level is the table pointed to by the DTB. */
+static const paging_mode paging_modes[] = {
+  // MODE_IA32: 4 byte entries, the PDE may map a 4mb page.
+  {4, 0xfffff000, 2, {
+      {22, 0xffc00000},
+      {12, 0}}},
+
+  // MODE_PAE: 8 byte entries, the PDE may map a 2mb page.
+  {8, 0xffffffffff000, 3, {
+      {30, 0},
+      {21, 0xfffffffe00000},
+      {12, 0}}},
+
+  // MODE_AMD64: 8 byte entries, the PDPTE may map a 1gb page and the PDE may
+  // map a 2mb page.
+  {8, 0xffffffffff000, 4, {
+      {39, 0},
+      {30, 0xfffffc0000000},
+      {21, 0xfffffffe00000},
+      {12, 0}}},
+};
 
-  memcpy(out, data, MIN(length, buffer_length));
 
-  Py_DecRef(buffer);
+static uint64_t _unpack(const unsigned char *data, int size) {
+  uint64_t decoded = 0;
+  int i;
 
-  return buffer_length;
+  // Little endian decoding.
+  for (i=0; i < size; i++) {
+    decoded |= ((uint64_t)data[i]) << (8*i);
+  }
 
- error:
-  return 0;
+  return decoded;
 }
 
 
-static int AMD64PagedMemory_init(AMD64PagedMemory *self, PyObject *args,
-                                 PyObject *kwds) {
-  static char *kwlist[] = {"base", "dtb", NULL};
+/* Reads from the base address space into out.
+
+   Reads which return less data than requested are zero padded. Returns 0 on
+   success or -1 with an exception set.
+*/
+static int _read_from_base(PagedMemory *self, uint64_t offset,
+                           uint64_t length, unsigned char *out) {
+  PyObject *buffer = PyObject_CallMethod(self->base, "read", "KK", offset,
+                                         length);
+  char *data;
+  Py_ssize_t buffer_length;
 
-  self->base = NULL;
-  self->dtb = 0;
+  if (!buffer)
+    return -1;
 
-  if(!PyArg_ParseTupleAndKeywords(args, kwds, "OK", kwlist,
-                                  &self->base, &self->dtb))
-    goto error;
+  if (PyString_AsStringAndSize(buffer, &data, &buffer_length) < 0) {
+    Py_DecRef(buffer);
+    return -1;
+  }
 
-  self->_read = _read_from_python_base;
+  buffer_length = MIN((uint64_t)buffer_length, length);
+  memcpy(out, data, buffer_length);
+  memset(out + buffer_length, 0, length - buffer_length);
 
-  Py_IncRef(self->base);
+  Py_DecRef(buffer);
 
   return 0;
+}
 
- error:
-  return -1;
-};
 
+/* Returns the cache slot holding the physical page, filling it if needed. */
+static table_cache_entry *_get_cached_page(PagedMemory *self, uint64_t page) {
+  table_cache_entry *slot = &self->cache[(page / PAGE_SIZE) %
+                                         TABLE_CACHE_SLOTS];
 
-static uint64_t _unpack_uint64(unsigned char *str) {
-  uint64_t decoded = 0;
-  int i;
+  if (slot->tag != page + 1) {
+    slot->tag = 0;
+    if (_read_from_base(self, page, PAGE_SIZE, slot->data) < 0)
+      return NULL;
 
-  // Little endian decoding: 8 bytes for 64 bits.
-  for (i=0; i < 8; i++) {
-    decoded |= ((uint64_t)str[i]) << (8*i);
+    slot->tag = page + 1;
   }
 
-  return decoded;
+  return slot;
 }
 
-/* Read a single 64 bit int from the image.
-
- */
-static uint64_t _read_long_long_phys(AMD64PagedMemory *self, uint64_t address) {
-  unsigned char result[sizeof(uint64_t)];
 
-  // Read directly into the buffer.
-  if (!self->_read(self, address, sizeof(result), (char *)result))
-    goto error;
+/* Reads length bytes of a paging structure. The read must not cross a page. */
+static int _read_table(PagedMemory *self, uint64_t address, uint64_t length,
+                       unsigned char *out) {
+  uint64_t page = address & ~(uint64_t)(PAGE_SIZE - 1);
+  table_cache_entry *slot;
 
-  // Decode as a uint64_t.
-  return _unpack_uint64(result);
-
-  error:
-    // An error occured in the base address space. We ignore the error and just
-    // return 0.
-    PyErr_Clear();
-    return 0;
-};
+  if (!self->cache)
+    return _read_from_base(self, address, length, out);
 
-static uint64_t get_two_meg_paddr(uint64_t vaddr, uint64_t pde) {
-  return (pde & 0xfffffffe00000) | (vaddr & 0x1fffff);
-}
+  slot = _get_cached_page(self, page);
+  if (!slot)
+    return -1;
 
-static uint64_t get_one_gig_paddr(AMD64PagedMemory *self, uint64_t vaddr,
-                                  uint64_t pdpte) {
+  memcpy(out, slot->data + (address - page), length);
 
-  return (pdpte & 0xfffffc0000000) | (vaddr & 0x3fffffff);
+  return 0;
 }
 
-static uint64_t get_phys_addr(uint64_t vaddr, uint64_t pte_value) {
 
-  return (pte_value & 0xfffff000) | (vaddr & 0xfff);
-}
+/* Reads a single paging structure entry. */
+static int _read_entry(PagedMemory *self, uint64_t address, uint64_t *entry) {
+  int entry_size = paging_modes[self->mode].entry_size;
+  unsigned char buffer[sizeof(uint64_t)];
 
-static bool entry_present(uint64_t entry) {
-  if (entry & 1) {
-    return true;
+  if (_read_table(self, address, entry_size, buffer) < 0)
+    return -1;
 
-    // The page is in transition and not a prototype.
-    // Thus, we will treat it as present.
-  } else if ((entry & (1 << 11)) && !(entry & (1 << 10))) {
-    return true;
-  }
+  *entry = _unpack(buffer, entry_size);
 
-  return false;
+  return 0;
 }
 
-static bool page_size_flag(uint64_t entry) {
-  return (entry & (1 << 7));
-}
 
-static void _add_range(PyObject *result,
-                       uint64_t virt_addr, uint64_t length, uint64_t phys_addr,
-                       uint64_t *last_virt_address, uint64_t *last_length,
-                       uint64_t *last_physical_address) {
-  if(*last_virt_address + *last_length == virt_addr &&
-     *last_physical_address + *last_length == phys_addr) {
-    *last_length += length;
-  } else {
-
-    // Skip zero length regions.
-    if (*last_length > 0) {
-      // Flush the last entry to the result list.
-      PyObject *list=PyTuple_New(3);
-      PyTuple_SET_ITEM(list, 0,
-                       PyLong_FromUnsignedLongLong(*last_virt_address));
-
-      PyTuple_SET_ITEM(list, 1,
-                       PyLong_FromUnsignedLongLong(*last_length));
-
-      PyTuple_SET_ITEM(list, 2,
-                       PyLong_FromUnsignedLongLong(*last_physical_address));
-
-      PyList_Append(result, list);
-    };
-
-    *last_virt_address = virt_addr;
-    *last_length = length;
-    *last_physical_address = phys_addr;
-  }
-};
+/* Returns the physical address and number of entries of the first table. */
+static uint64_t _get_top_table(PagedMemory *self, uint64_t *entries) {
+  switch (self->mode) {
+    case MODE_IA32:
+      *entries = 0x400;
+      return self->dtb & 0xfffff000;
 
+    case MODE_PAE:
+      // The PDPT has just 4 entries and is 32 byte aligned.
+      *entries = 4;
+      return self->dtb & 0xffffffe0;
 
-static PyObject *_get_memory_map(AMD64PagedMemory *self, uint64_t start,
-                                 Py_ssize_t length) {
-  PyObject *result = PyList_New(0);
-  page_table_lookup lookup;
-  uint64_t pml4e_addr, pml4e_value, pdpte_addr, pdpte_value;
-  uint64_t pde_addr, pde_value, pte_addr, pte_table_addr;
-  uint64_t last_virt_address = 0;
-  uint64_t last_physical_address = 0;
-  uint64_t last_length = 0;
-  uint64_t total_length = 0;
-
-  unsigned char pte_table[0x1000];
-  uint64_t pml4e_start, vaddr;
+    default:
+      *entries = 0x200;
+      return self->dtb & 0xffffffffff000;
+  }
+}
 
-  memset(&lookup, 0, sizeof(lookup));
 
-  /* Even if the initial memory range is invalid, the lookup should contain
-     partial data.
-  */
-  _vtop(self, start, &lookup);
+/* Translates vaddr.
 
-  pml4e_start = lookup.pml4e_addr;
-  if (pml4e_start == 0) {
-    pml4e_start = self->dtb & 0xffffffffff000;
-  }
+   Returns 1 and sets paddr if the address is mapped, 0 if it is not mapped and
+   -1 with an exception set on error.
+*/
+static int _vtop(PagedMemory *self, uint64_t vaddr, uint64_t *paddr) {
+  const paging_mode *mode = &paging_modes[self->mode];
+  uint64_t entries;
+  uint64_t table = _get_top_table(self, &entries);
+  uint64_t entry;
+  int i;
 
-  // Pages that hold PDEs and PTEs are 0x1000 bytes each.
-  // Each PDE and PTE is eight bytes. Thus there are 0x1000 / 8 = 0x200
-  // PDEs and PTEs we must test.
-  for (pml4e_addr = pml4e_start;
-       pml4e_addr < (self->dtb & 0xffffffffff000) + 0x1000; // Last entry in pml4e.
-       pml4e_addr += 8) {
-    uint64_t pdpte_start = lookup.pdpte_addr;
+  for (i=0; i < mode->levels; i++) {
+    const paging_level *level = &mode->level[i];
+    uint64_t index = (vaddr >> level->shift) & (entries - 1);
 
-    pml4e_value = _read_long_long_phys(self, pml4e_addr);
+    if (_read_entry(self, table + index * mode->entry_size, &entry) < 0)
+      return -1;
 
-    if (!entry_present(pml4e_value))
-      continue;
+    if (!(entry & self->valid_mask))
+      return 0;
 
-    if (pdpte_start == 0) {
-      pdpte_start = pml4e_value & 0xffffffffff000;
+    // A PTE maps a 4kb page.
+    if (i == mode->levels - 1) {
+      *paddr = (entry & mode->address_mask) | (vaddr & 0xfff);
+      return 1;
     }
 
-    for (pdpte_addr=pdpte_start;
-         pdpte_addr<(pml4e_value & 0xffffffffff000) + 0x1000;
-         pdpte_addr+=8) {
-      uint64_t pde_start = lookup.pde_addr;
+    // A large page.
+    if (level->large_page_mask && (entry & PAGE_SIZE_FLAG)) {
+      *paddr = ((entry & level->large_page_mask) |
+                (vaddr & (((uint64_t)1 << level->shift) - 1)));
+      return 1;
+    }
 
-      pdpte_value = _read_long_long_phys(self, pdpte_addr);
-      if (!entry_present(pdpte_value))
-        continue;
+    table = entry & mode->address_mask;
+    entries = PAGE_SIZE / mode->entry_size;
+  }
 
-      // One gig pages.
-      if (page_size_flag(pdpte_value)) {
-        vaddr = ((pml4e_addr & 0xff8) << 36 |
-                 (pdpte_addr & 0xff8) << 27);
+  return 0;
+}
 
-        _add_range(result, vaddr, 0x40000000,
-                   get_one_gig_paddr(self, vaddr, pdpte_value),
-                   &last_virt_address, &last_length, &last_physical_address);
 
-        total_length += 0x40000000;
-        if (length && total_length > length) goto done;
-        continue;
-      };
+/* Flushes the current run into the result list. */
+static int _flush_range(range_builder *builder) {
+  PyObject *run;
 
-      if (pde_start == 0) {
-        pde_start = pdpte_value & 0xffffffffff000;
-      }
+  // Skip zero length regions.
+  if (!builder->length)
+    return 0;
 
-      for (pde_addr=pde_start;
-           pde_addr<(pdpte_value & 0xffffffffff000) + 0x1000;
-           pde_addr+=8) {
-        uint64_t pte_start = lookup.pte_addr;
+  run = Py_BuildValue("(KKK)", builder->virt_addr, builder->phys_addr,
+                      builder->length);
+  if (!run)
+    return -1;
 
-        pde_value = _read_long_long_phys(self, pde_addr);
-        if (!entry_present(pde_value))
-          continue;
+  if (PyList_Append(builder->result, run) < 0) {
+    Py_DecRef(run);
+    return -1;
+  }
 
-        // 2mb pages.
-        if (page_size_flag(pde_value)) {
-          vaddr = ((pml4e_addr & 0xff8) << 36 |
-                   (pdpte_addr & 0xff8) << 27 |
-                   (pde_addr   & 0xff8) << 18);
+  Py_DecRef(run);
+  builder->length = 0;
 
-          _add_range(result, vaddr, 0x200000, get_two_meg_paddr(vaddr, pde_value),
-                     &last_virt_address, &last_length, &last_physical_address);
-          total_length += 0x200000;
-          if (length && total_length > length) goto done;
+  return 0;
+}
 
-          continue;
-        };
 
+/* Adds a range, merging it with the last one if they are contiguous. */
+static int _add_range(range_builder *builder, uint64_t virt_addr,
+                      uint64_t phys_addr, uint64_t length) {
+  if (builder->length &&
+      builder->virt_addr + builder->length == virt_addr &&
+      builder->phys_addr + builder->length == phys_addr) {
+    builder->length += length;
+    return 0;
+  }
 
-        // This reads the entire PTE table at once - On windows where IO is
-        // extremely expensive, its about 10 times more efficient than reading
-        // it one value at the time - and this loop is HOT!
-        pte_table_addr = pde_value & 0xffffffffff000;
-        if(!self->_read(self, pte_table_addr, sizeof(pte_table),
-                        (char *)pte_table))
-          goto error;
+  if (_flush_range(builder) < 0)
+    return -1;
 
-        if (pte_start == 0) {
-          pte_start = pde_value & 0xffffffffff000;
-        }
-
-        for (pte_addr=pte_start;
-             pte_addr<(pde_value & 0xffffffffff000) + 0x1000;
-             pte_addr+=8) {
-
-          uint64_t pte_value = _unpack_uint64(pte_table +
-                                              (pte_addr - pte_table_addr));
-
-          if (entry_present(pte_value)) {
-            vaddr = ((pml4e_addr & 0xff8) << 36 |
-                     (pdpte_addr & 0xff8) << 27 |
-                     (pde_addr   & 0xff8) << 18 |
-                     (pte_addr   & 0xff8) << 9);
-
-            _add_range(result, vaddr, 0x1000,
-                       get_phys_addr(vaddr, pte_value),
-                       &last_virt_address, &last_length, &last_physical_address);
-            total_length += 0x1000;
-            if (length && total_length > length) goto done;
-          }
-        };
-
-        // Next time around the loop - start at the begining.
-        lookup.pte_addr = 0;
-      }
+  builder->virt_addr = virt_addr;
+  builder->phys_addr = phys_addr;
+  builder->length = length;
 
-      // Next time around the loop - start at the begining.
-      lookup.pde_addr = 0;
-    }
+  return 0;
+}
 
-    // Next time around the loop - start at the begining.
-    lookup.pdpte_addr = 0;
-  }
 
+/* Enumerates the valid pages mapped by a paging structure. */
+static int _walk(PagedMemory *self, int level_index, uint64_t table_addr,
+                 uint64_t entries, uint64_t table_vaddr,
+                 range_builder *builder) {
+  const paging_mode *mode = &paging_modes[self->mode];
+  const paging_level *level = &mode->level[level_index];
+  uint64_t entry_span = (uint64_t)1 << level->shift;
+  unsigned char table[PAGE_SIZE];
+  uint64_t i;
 
- done:
-  // Include the last range.
-  _add_range(result, -1, -1, -1,
-             &last_virt_address, &last_length, &last_physical_address);
+  // This reads the entire table at once - this loop is HOT!
+  if (_read_table(self, table_addr, entries * mode->entry_size, table) < 0)
+    return -1;
 
-  return result;
+  for (i=0; i < entries; i++) {
+    uint64_t vaddr = table_vaddr | (i << level->shift);
+    uint64_t entry;
 
- error:
-  // Delete the result.
-  Py_DecRef(result);
+    // The region mapped by this entry ends before the start.
+    if (vaddr + entry_span <= builder->start)
+      continue;
 
-  return NULL;
-};
+    entry = _unpack(table + i * mode->entry_size, mode->entry_size);
+    if (!(entry & self->valid_mask))
+      continue;
 
-static PyObject *AMD64PagedMemory_get_available_addresses(AMD64PagedMemory *self,
-                                                          PyObject *args,
-                                                          PyObject *kwds) {
-  static char *kwlist[] = {"start", "length", NULL};
-  uint64_t start = 0;
-  uint64_t length = -1;
+    if (level_index == mode->levels - 1) {
+      if (_add_range(builder, vaddr, entry & mode->address_mask,
+                     PAGE_SIZE) < 0)
+        return -1;
 
-  if(!PyArg_ParseTupleAndKeywords(args, kwds, "|KK", kwlist, &start, &length))
-    goto error;
+    } else if (level->large_page_mask && (entry & PAGE_SIZE_FLAG)) {
+      if (_add_range(builder, vaddr, entry & level->large_page_mask,
+                     entry_span) < 0)
+        return -1;
 
-  return _get_memory_map(self, start, length);
+    } else if (_walk(self, level_index + 1, entry & mode->address_mask,
+                     PAGE_SIZE / mode->entry_size, vaddr, builder) < 0) {
+      return -1;
+    }
+  }
 
- error:
-  return NULL;
+  return 0;
 }
 
 
-static int _vtop(AMD64PagedMemory *self, uint64_t vaddr,
-                 page_table_lookup *result) {
+static int PagedMemory_init(PagedMemory *self, PyObject *args,
+                            PyObject *kwds) {
+  static char *kwlist[] = {"base", "dtb", "mode", "valid_mask", "cache", NULL};
+  PyObject *base = NULL;
+  int cache = 1;
 
-  result->pml4e_addr = ((self->dtb & 0xffffffffff000) |
-                        ((vaddr & 0xff8000000000) >> 36));
+  self->mode = MODE_AMD64;
+  self->valid_mask = 1;
 
-  result->pml4e = _read_long_long_phys(self, result->pml4e_addr);
-  if (!entry_present(result->pml4e)) {
-    goto invalid;
-  }
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "OK|iKi", kwlist,
+                                  &base, &self->dtb, &self->mode,
+                                  &self->valid_mask, &cache))
+    return -1;
 
-  result->pdpte_addr = ((result->pml4e & 0xffffffffff000) |
-                        ((vaddr & 0x7fc0000000) >> 27));
-  result->pdpte = _read_long_long_phys(self, result->pdpte_addr);
-  if (!entry_present(result->pdpte)) {
-    goto invalid;
+  if (self->mode < MODE_IA32 || self->mode > MODE_AMD64) {
+    PyErr_Format(PyExc_ValueError, "Unsupported paging mode %d.", self->mode);
+    return -1;
   }
 
-  if (page_size_flag(result->pdpte)) {
-    result->paddr = get_one_gig_paddr(self, vaddr, result->pdpte);
-    goto ok;
-  }
+  Py_IncRef(base);
+  Py_XDECREF(self->base);
+  self->base = base;
 
-  result->pde_addr = ((result->pdpte & 0xffffffffff000) |
-                      ((vaddr & 0x3fe00000) >> 18));
-  result->pde = _read_long_long_phys(self, result->pde_addr);
-  if (!entry_present(result->pde)) {
-    goto invalid;
-  }
+  PyMem_Free(self->cache);
+  self->cache = NULL;
 
-  if (page_size_flag(result->pde)) {
-    result->paddr = get_two_meg_paddr(vaddr, result->pde);
-    goto ok;
-  }
+  if (cache) {
+    self->cache = PyMem_Malloc(sizeof(table_cache_entry) * TABLE_CACHE_SLOTS);
+    if (!self->cache) {
+      PyErr_NoMemory();
+      return -1;
+    }
 
-  result->pte_addr = ((result->pde & 0xffffffffff000) |
-                      ((vaddr & 0x1ff000) >> 9));
-  result->pte = _read_long_long_phys(self, result->pte_addr);
-  if (!entry_present(result->pte)) {
-    goto invalid;
+    memset(self->cache, 0, sizeof(table_cache_entry) * TABLE_CACHE_SLOTS);
   }
 
-  result->paddr = ((result->pte & 0xfffff000) |
-                   (vaddr & 0xfff));
+  return 0;
+};
 
- ok:
-  return 1;
 
- invalid:
-  return 0;
+static void PagedMemory_dealloc(PagedMemory *self) {
+  Py_XDECREF(self->base);
+  PyMem_Free(self->cache);
+  self->ob_type->tp_free((PyObject *)self);
 }
 
-static PyObject *AMD64PagedMemory_vtop(AMD64PagedMemory *self, PyObject *args,
-                                       PyObject *kwds) {
-  static char *kwlist[] = {"offset", NULL};
-  uint64_t vaddr = 0;
-  page_table_lookup result;
 
-  if(!PyArg_ParseTupleAndKeywords(args, kwds, "K", kwlist, &vaddr))
-    goto error;
+static PyObject *PagedMemory_get_available_addresses(PagedMemory *self,
+                                                     PyObject *args,
+                                                     PyObject *kwds) {
+  static char *kwlist[] = {"start", NULL};
+  range_builder builder;
+  uint64_t entries, table;
 
-  if(!_vtop(self, vaddr, &result))
-    goto invalid;
+  memset(&builder, 0, sizeof(builder));
 
-  PyErr_Clear();
-  return PyLong_FromUnsignedLongLong(result.paddr);
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "|K", kwlist, &builder.start))
+    return NULL;
 
- invalid:
-  Py_RETURN_NONE;
+  builder.result = PyList_New(0);
+  if (!builder.result)
+    return NULL;
 
- error:
-  return 0;
+  table = _get_top_table(self, &entries);
+  if (_walk(self, 0, table, entries, 0, &builder) < 0 ||
+      _flush_range(&builder) < 0) {
+    Py_DecRef(builder.result);
+    return NULL;
+  }
+
+  return builder.result;
 };
 
 
+static PyObject *PagedMemory_vtop(PagedMemory *self, PyObject *args,
+                                  PyObject *kwds) {
+  static char *kwlist[] = {"offset", NULL};
+  uint64_t vaddr = 0;
+  uint64_t paddr = 0;
+
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "K", kwlist, &vaddr))
+    return NULL;
 
+  switch (_vtop(self, vaddr, &paddr)) {
+    case 1:
+      return PyLong_FromUnsignedLongLong(paddr);
+
+    case 0:
+      Py_RETURN_NONE;
+
+    default:
+      return NULL;
+  }
+};
 
 
-static PyObject *AMD64PagedMemory_read(AMD64PagedMemory *self, PyObject *args, PyObject *kwds) {
+static PyObject *PagedMemory_read(PagedMemory *self, PyObject *args,
+                                  PyObject *kwds) {
   static char *kwlist[] = {"offset", "length", NULL};
   uint64_t offset = 0;
-  Py_ssize_t length = 0;
-  PyObject *result, *map;
-  char *out_buffer;
-  int out_index = 0;
-  int i;
+  uint64_t length = 0;
+  uint64_t done = 0;
+  PyObject *result;
+  unsigned char *out_buffer;
 
-  if(!PyArg_ParseTupleAndKeywords(args, kwds, "KI", kwlist,
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "KK", kwlist,
                                   &offset, &length))
-    goto error;
+    return NULL;
 
   if (length > MAX_READ_LENGTH) {
-    PyErr_Format(PyExc_IOError, "Read buffer size too large (%lu).", length);
-    goto error;
+    PyErr_Format(PyExc_IOError, "Read buffer size too large (%llu).",
+                 (unsigned long long)length);
+    return NULL;
   };
 
   // Since we are reading from memory we can never actually fail this read -
   // even if the pages are not mapped, we just zero pad them. Therefore we just
   // allocate the entire buffer here and clear it.
   result = PyString_FromStringAndSize(NULL, length);
-  if (!result) goto error;
-
-  out_buffer = PyString_AS_STRING(result);
+  if (!result)
+    return NULL;
 
-  // Clear the buffer.
+  out_buffer = (unsigned char *)PyString_AS_STRING(result);
   memset(out_buffer, 0, length);
 
-  // Get the memory map for the next read.
-  map = _get_memory_map(self, offset, length);
-  if(!map) goto error_with_result;
-
-  // Use the map to read as much as we need.
-  for(i=0; i<PyList_Size(map); i++) {
-    PyObject *item = PyList_GetItem(map, i);
-    uint64_t virt_addr = PyLong_AsLongLong(PyTuple_GetItem(item, 0));
-    uint64_t range_length = PyLong_AsLongLong(PyTuple_GetItem(item, 1));
-    uint64_t physical_addr = PyLong_AsLongLong(PyTuple_GetItem(item, 2));
-    Py_ssize_t available_to_read;
-    int chunk_offset;
-    int data_read;
-
-    // We are reading before the next available range - we just skip up to it.
-    if(virt_addr > offset) {
-      length -= virt_addr - offset;
-      out_index += virt_addr - offset;
-      offset = virt_addr;
-    };
-
-    // We are done reading.
-    if (length <= 0) break;
-
-    // The relative offset inside the chunk.
-    chunk_offset = offset - virt_addr;
-
-    // How much data is in this memory range?
-    available_to_read = MIN(length, range_length - chunk_offset);
-
-    // Read the chunk from the base address space.
-    data_read = self->_read(self, physical_addr + chunk_offset,
-                            available_to_read, out_buffer + out_index);
-    if (!data_read)
-      goto error_with_map;
-
-    // Advance the destination buffer pointer.
-    out_index += data_read;
-
-    // Adjust the offset and length in the virtual address space.
-    length -= data_read;
-    offset += data_read;
-  };
+  while (done < length) {
+    uint64_t vaddr = offset + done;
+    uint64_t to_read = MIN(length - done, PAGE_SIZE - (vaddr & 0xfff));
+    uint64_t paddr, next_paddr;
+    int valid = _vtop(self, vaddr, &paddr);
+
+    if (valid < 0)
+      goto error;
+
+    if (valid) {
+      // Read the following pages together as long as they are physically
+      // contiguous.
+      while (done + to_read < length) {
+        int next_valid = _vtop(self, vaddr + to_read, &next_paddr);
+        if (next_valid < 0)
+          goto error;
 
-  Py_DecRef(map);
+        if (!next_valid || next_paddr != paddr + to_read)
+          break;
 
-  return result;
+        to_read += MIN(length - done - to_read, PAGE_SIZE);
+      }
+
+      if (_read_from_base(self, paddr, to_read, out_buffer + done) < 0)
+        goto error;
+    }
 
- error_with_map:
-  Py_DecRef(map);
+    done += to_read;
+  }
 
- error_with_result:
-  Py_DecRef(result);
+  return result;
 
  error:
-  return 0;
+  Py_DecRef(result);
+  return NULL;
 };
 
-static PyMethodDef AMD64PagedMemory_methods[] = {
-  {"read",(PyCFunction)AMD64PagedMemory_read, METH_VARARGS|METH_KEYWORDS,
-   "Read a buffer from the base address space.\n"},
 
-  {"vtop",(PyCFunction)AMD64PagedMemory_vtop, METH_VARARGS|METH_KEYWORDS,
+static PyObject *PagedMemory_flush(PagedMemory *self) {
+  if (self->cache)
+    memset(self->cache, 0, sizeof(table_cache_entry) * TABLE_CACHE_SLOTS);
+
+  Py_RETURN_NONE;
+}
+
+
+static PyMethodDef PagedMemory_methods[] = {
+  {"read",(PyCFunction)PagedMemory_read, METH_VARARGS|METH_KEYWORDS,
+   "Read a buffer from the virtual address space. Unmapped pages are zero "
+   "padded.\n"},
+
+  {"vtop",(PyCFunction)PagedMemory_vtop, METH_VARARGS|METH_KEYWORDS,
    "Converts a virtual offset to a physical offset. Returns None if invalid.\n"},
 
-  {"get_available_addresses",(PyCFunction)AMD64PagedMemory_get_available_addresses,
+  {"get_available_addresses",(PyCFunction)PagedMemory_get_available_addresses,
    METH_VARARGS|METH_KEYWORDS,
-   "Returns a list of lists of available memory ranges.\n"},
+   "Returns a list of (virtual address, physical address, length) tuples for "
+   "the mapped ranges at or after start. Adjacent ranges are coalesced.\n"},
+
+  {"flush",(PyCFunction)PagedMemory_flush, METH_NOARGS,
+   "Flushes the cached paging structures.\n"},
 
   {NULL}  /* Sentinel */
 };
 
 
-static PyTypeObject AMD64PagedMemory_Type = {
+static PyTypeObject PagedMemory_Type = {
     PyObject_HEAD_INIT(NULL)
     0,                         /* ob_size */
-    "support.AMD64PagedMemory",               /* tp_name */
-    sizeof(AMD64PagedMemory),            /* tp_basicsize */
+    "support.PagedMemory",     /* tp_name */
+    sizeof(PagedMemory),       /* tp_basicsize */
     0,                         /* tp_itemsize */
-    (destructor)0,             /* tp_dealloc */
+    (destructor)PagedMemory_dealloc,  /* tp_dealloc */
     0,                         /* tp_print */
     0,                         /* tp_getattr */
     0,                         /* tp_setattr */
@@ -522,14 +491,14 @@ static PyTypeObject AMD64PagedMemory_Type = {
     0,                         /* tp_setattro */
     0,                         /* tp_as_buffer */
     Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,        /* tp_flags */
-    AMD64PagedMemory__doc__,   /* tp_doc */
+    PagedMemory__doc__,        /* tp_doc */
     0,	                       /* tp_traverse */
     0,                         /* tp_clear */
     0,                         /* tp_richcompare */
     0,                         /* tp_weaklistoffset */
     (getiterfunc)0,            /* tp_iter */
     (iternextfunc)0,           /* tp_iternext */
-    AMD64PagedMemory_methods,  /* tp_methods */
+    PagedMemory_methods,       /* tp_methods */
     0,                         /* tp_members */
     0,                         /* tp_getset */
     0,                         /* tp_base */
@@ -537,7 +506,7 @@ static PyTypeObject AMD64PagedMemory_Type = {
     0,                         /* tp_descr_get */
     0,                         /* tp_descr_set */
     0,                         /* tp_dictoffset */
-    (initproc)AMD64PagedMemory_init,      /* tp_init */
+    (initproc)PagedMemory_init,      /* tp_init */
     0,                         /* tp_alloc */
     0,                         /* tp_new */
 };
@@ -549,22 +518,23 @@ static PyMethodDef supportMethods[] = {
 
 
 PyMODINIT_FUNC initsupport(void) {
-  PyGILState_STATE gstate;
-
   /* create module */
   PyObject *m = Py_InitModule("support", supportMethods);
+  if (!m)
+    return;
 
-  /* Make sure threads are enabled */
-  PyEval_InitThreads();
-  gstate = PyGILState_Ensure();
+  PagedMemory_Type.tp_new = PyType_GenericNew;
+  if (PyType_Ready(&PagedMemory_Type) < 0)
+    return;
 
-  AMD64PagedMemory_Type.tp_new = PyType_GenericNew;
-  if (PyType_Ready(&AMD64PagedMemory_Type) < 0)
-    goto exit;
+  Py_IncRef((PyObject *)&PagedMemory_Type);
+  PyModule_AddObject(m, "PagedMemory", (PyObject *)&PagedMemory_Type);
 
-  Py_IncRef((PyObject *)&AMD64PagedMemory_Type);
-  PyModule_AddObject(m, "AMD64PagedMemory", (PyObject *)&AMD64PagedMemory_Type);
+  // The previous name of this class. It defaults to the AMD64 paging mode.
+  Py_IncRef((PyObject *)&PagedMemory_Type);
+  PyModule_AddObject(m, "AMD64PagedMemory", (PyObject *)&PagedMemory_Type);
 
- exit:
-  PyGILState_Release(gstate);
+  PyModule_AddIntConstant(m, "MODE_IA32", MODE_IA32);
+  PyModule_AddIntConstant(m, "MODE_PAE", MODE_PAE);
+  PyModule_AddIntConstant(m, "MODE_AMD64", MODE_AMD64);
 }
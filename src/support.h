@@ -3,15 +3,22 @@
 #include <stdbool.h>
 
 
-static char AMD64PagedMemory__doc__[] = "Standard AMD 64-bit address space.\n"
+static char PagedMemory__doc__[] = "Native Intel paged address space.\n"
 "\n"
-"    Provides an address space for AMD64 paged memory, aka the x86_64\n"
-"    architecture, which is laid out similarly to Physical Address\n"
-"    Extensions (PAE). Allows callers to map virtual address to\n"
-"    offsets in physical memory.\n"
+"    Provides a page table walker for the IA32 (non PAE), IA32 PAE and\n"
+"    AMD64 paging modes. This is used by the accelerated address spaces in\n"
+"    rekall.plugins.addrspaces.accelerated and must translate addresses\n"
+"    exactly like the pure Python address spaces in\n"
+"    rekall.plugins.addrspaces.intel and rekall.plugins.addrspaces.amd64.\n"
 "\n"
-"    Create a new AMD64 address space to sit on top of the base address\n"
-"    space and a Directory Table Base (CR3 value) of 'dtb'.\n"
+"    PagedMemory(base, dtb, mode=MODE_AMD64, valid_mask=1, cache=True)\n"
+"\n"
+"    base: The physical address space to read the page tables from.\n"
+"    dtb: The Directory Table Base (CR3 value).\n"
+"    mode: One of MODE_IA32, MODE_PAE or MODE_AMD64.\n"
+"    valid_mask: Entries with any of these bits set are present.\n"
+"    cache: If set, paging structures are cached. This must not be set\n"
+"      for volatile (live) address spaces.\n"
 "\n"
 "    Comments in this class mostly come from the Intel(R) 64 and IA-32\n"
 "    Architectures Software Developer's Manual Volume 3A: System Programming\n"
@@ -24,40 +31,79 @@ static char AMD64PagedMemory__doc__[] = "Standard AMD 64-bit address space.\n"
 // Reads must stay below this size to protect process memory usage.
 #define MAX_READ_LENGTH 100 * 1024 * 1024
 
-
 #define MIN(X,Y) ((X) < (Y) ? (X) : (Y))
 
+#define PAGE_SIZE 0x1000
+
+// The supported paging modes.
+#define MODE_IA32 0
+#define MODE_PAE 1
+#define MODE_AMD64 2
+
+// The number of paging structures held in the cache. The cache is direct
+// mapped by physical page number.
+#define TABLE_CACHE_SLOTS 256
+
+// The page size flag in PDEs and PDPTEs.
+#define PAGE_SIZE_FLAG (1 << 7)
+
 
-/* Looking up a page table may fill all these value. */
+/* Describes a single level of the paging structures. */
 typedef struct {
-  // For each page table entry we collect the address and the value of it.
-  uint64_t pml4e_addr;
-  uint64_t pml4e;
-  uint64_t pdpte_addr;
-  uint64_t pdpte;
-  uint64_t pde_addr;
-  uint64_t pde;
-  uint64_t pte_addr;
-  uint64_t pte;
-  uint64_t paddr;
-} page_table_lookup;
-
-typedef struct AMD64PagedMemory_t {
-  PyObject_HEAD
-  PyObject *base;
-  uint64_t dtb;
-  int (*_read)(struct AMD64PagedMemory_t *self, uint64_t offset,
-               uint64_t length, char *out);
-} AMD64PagedMemory;
+  // The virtual address bits mapped by each entry (as a shift).
+  int shift;
 
-static int AMD64PagedMemory_init(AMD64PagedMemory *self, PyObject *args,
-                                 PyObject *kwds);
+  // The mask of the physical address of a large page mapped at this level or
+  // 0 if this level can not map large pages.
+  uint64_t large_page_mask;
+} paging_level;
+
+
+/* Describes a paging mode. */
+typedef struct {
+  int entry_size;
 
+  // The mask of the physical address of the next level table (or of a 4kb page
+  // in a PTE).
+  uint64_t address_mask;
 
+  int levels;
+  paging_level level[4];
+} paging_mode;
+
+
+typedef struct {
+  // The physical address of the cached page + 1 (0 means the slot is empty).
+  uint64_t tag;
+  unsigned char data[PAGE_SIZE];
+} table_cache_entry;
+
+
+/* Collects coalesced (virtual, physical, length) runs into a list. */
+typedef struct {
+  PyObject *result;
+  uint64_t start;
+  uint64_t virt_addr;
+  uint64_t phys_addr;
+  uint64_t length;
+} range_builder;
+
+
+typedef struct PagedMemory_t {
+  PyObject_HEAD
+  PyObject *base;
+  uint64_t dtb;
+  int mode;
+  uint64_t valid_mask;
+  table_cache_entry *cache;
+} PagedMemory;
 
 
+static int PagedMemory_init(PagedMemory *self, PyObject *args,
+                            PyObject *kwds);
+static void PagedMemory_dealloc(PagedMemory *self);
 
-static uint64_t _unpack_uint64(unsigned char *str);
-static uint64_t _read_long_long_phys(AMD64PagedMemory *self, uint64_t address);
-static int _vtop(AMD64PagedMemory *self, uint64_t vaddr,
-                 page_table_lookup *result);
+static int _read_from_base(PagedMemory *self, uint64_t offset,
+                           uint64_t length, unsigned char *out);
+static int _read_entry(PagedMemory *self, uint64_t address, uint64_t *entry);
+static int _vtop(PagedMemory *self, uint64_t vaddr, uint64_t *paddr);